@@ -0,0 +1,136 @@
+"""Локальный архив эксель-файлов актов приема-передачи.
+
+Каждый скачанный эксель-файл акта сохраняется один раз под своим sha256
+(тот же content_hash, что в манифесте актов) в сжатом виде:
+<ACT_ARCHIVE_DIR>/objects/<первые два символа хэша>/<sha256>.xlsx.gz.
+Одинаковые файлы хранятся одной копией. Индекс архива — sqlite-файл
+<ACT_ARCHIVE_DIR>/index.sqlite: кабинет, название акта, номер документа,
+дата акта и хэш файла.
+
+Из архива акты можно разобрать заново без обращения к API документов
+(например, когда ВБ меняет шаблон акта) — см. reparse_acts.py.
+
+Переменные окружения:
+    ACT_ARCHIVE=0       — не сохранять акты в архив (по умолчанию сохраняются)
+    ACT_ARCHIVE_DIR     — папка архива (по умолчанию <WB_DATA_DIR>/act_archive,
+                          WB_DATA_DIR по умолчанию ~/wb_data)
+"""
+import gzip
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+from datetime import datetime
+import pandas as pd
+from wb_client import data_dir
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DIR = os.getenv('ACT_ARCHIVE_DIR', os.path.join(data_dir(), 'act_archive'))
+INDEX_COLUMNS = ('account', 'act', 'document_number', 'act_date', 'content_hash', 'size', 'archived_at')
+
+
+def archive_enabled() -> bool:
+    return os.getenv('ACT_ARCHIVE', '1') != '0'
+
+
+def object_path(content_hash: str) -> str:
+    """Путь к сжатому эксель-файлу в архиве по его sha256."""
+    return os.path.join(ARCHIVE_DIR, 'objects', content_hash[:2], f'{content_hash}.xlsx.gz')
+
+
+def _connect() -> sqlite3.Connection:
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    # Соединение на каждый вызов: архив пишется из потоков пула распаковки
+    connection = sqlite3.connect(os.path.join(ARCHIVE_DIR, 'index.sqlite'), timeout=30)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS acts (
+            account TEXT NOT NULL,
+            act TEXT NOT NULL,
+            document_number TEXT,
+            act_date TEXT,
+            content_hash TEXT NOT NULL,
+            size INTEGER,
+            archived_at TEXT,
+            PRIMARY KEY (account, act, content_hash)
+        )""")
+    connection.execute('CREATE INDEX IF NOT EXISTS acts_document ON acts (account, document_number)')
+    connection.execute('CREATE INDEX IF NOT EXISTS acts_date ON acts (act_date)')
+    return connection
+
+
+def normalize_act_date(value):
+    """Дата акта в формате YYYY-MM-DD. В актах ФБС дата вида '17.10.2026',
+    в актах ФБО — '"17" 10 2026'; в обоих случаях это ДДММГГГГ."""
+    if not isinstance(value, str):
+        return None
+    digits = re.sub(r'\D', '', value)
+    try:
+        return datetime.strptime(digits, '%d%m%Y').strftime('%Y-%m-%d')
+    except ValueError:
+        return None
+
+
+def archive_act(account: str, act: str, xlsx_bytes: bytes, number_pattern: str, act_date=None) -> str:
+    """Сохраняет эксель-файл акта в архив и добавляет его в индекс.
+    Файл, который уже есть в архиве, повторно не записывается.
+
+    Returns:
+        str: sha256 эксель-файла
+    """
+    content_hash = hashlib.sha256(xlsx_bytes).hexdigest()
+    path = object_path(content_hash)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Пишем под временным именем, чтобы в архиве не было недописанных файлов
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as file:
+            file.write(gzip.compress(xlsx_bytes))
+        os.replace(tmp_path, path)
+
+    number = re.search(number_pattern, act)
+    connection = _connect()
+    try:
+        with connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO acts VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (str(account), act, number.group(1) if number else None, normalize_act_date(act_date),
+                 content_hash, len(xlsx_bytes), datetime.now().isoformat(timespec='seconds')))
+    finally:
+        connection.close()
+    return content_hash
+
+
+def read_archived_workbook(content_hash: str) -> bytes:
+    """Байты эксель-файла акта из архива."""
+    with open(object_path(content_hash), 'rb') as file:
+        return gzip.decompress(file.read())
+
+
+def list_archived_acts(account: str = None, date_from: str = None, date_to: str = None) -> pd.DataFrame:
+    """Акты из индекса архива, по одному (последнему сохраненному) файлу на акт кабинета.
+
+    Args:
+        account: только этот кабинет
+        date_from, date_to: границы даты акта (YYYY-MM-DD); акты без даты при этом не попадают
+    """
+    conditions, params = [], []
+    if account:
+        conditions.append('account = ?')
+        params.append(account)
+    if date_from:
+        conditions.append('act_date >= ?')
+        params.append(date_from)
+    if date_to:
+        conditions.append('act_date <= ?')
+        params.append(date_to)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    connection = _connect()
+    try:
+        acts = pd.read_sql_query(f"SELECT {', '.join(INDEX_COLUMNS)} FROM acts {where} ORDER BY archived_at",
+                                 connection, params=params)
+    finally:
+        connection.close()
+    return acts.drop_duplicates(subset=['account', 'act'], keep='last').reset_index(drop=True)
@@ -0,0 +1,185 @@
+"""Параллельный разбор актов приема-передачи.
+
+Общий архив из documents/download/all содержит по вложенному zip на каждый акт,
+внутри которого лежит эксель с актом и файл подписи .sig. Акты распаковываются
+по одному в пуле потоков основного процесса, а эксель-файлы разбираются в пуле
+процессов: разбор — чистая работа процессора и не зависит от других актов,
+поэтому сотни актов разбираются на всех ядрах, а не на одном.
+
+Число процессов задается переменной ACT_PARSER_WORKERS (по умолчанию — число ядер),
+потоков распаковки — ACT_INFLATE_THREADS (4), актов в работе одновременно —
+ACT_PARSER_INFLIGHT (по умолчанию два на процесс).
+Каждый эксель-файл акта сохраняется в локальный архив (act_archive), откуда
+акты можно разобрать заново без скачивания.
+Скрипты, которые используют пул, должны запускаться под if __name__ == "__main__".
+"""
+import asyncio
+import hashlib
+import io
+import logging
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import pandas as pd
+from act_reader import read_act
+from act_archive import archive_act, archive_enabled, read_archived_workbook
+
+# Номер документа в названии вложенного архива акта ФБС
+FBS_NUMBER_PATTERN = r'act-income-mp-(\d+)\.zip'
+
+PARSER_WORKERS = int(os.getenv('ACT_PARSER_WORKERS', 0)) or os.cpu_count()
+# Потоки для распаковки актов и число актов в работе одновременно
+INFLATE_THREADS = int(os.getenv('ACT_INFLATE_THREADS', 4))
+INFLIGHT_ACTS = int(os.getenv('ACT_PARSER_INFLIGHT', 0)) or 2 * PARSER_WORKERS
+
+_executor = None
+_inflate_executor = None
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """Общий пул процессов для разбора актов, создается при первом обращении."""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=PARSER_WORKERS)
+    return _executor
+
+
+def get_inflate_executor() -> ThreadPoolExecutor:
+    """Общий пул потоков для распаковки актов из архива."""
+    global _inflate_executor
+    if _inflate_executor is None:
+        _inflate_executor = ThreadPoolExecutor(max_workers=INFLATE_THREADS)
+    return _inflate_executor
+
+
+def shutdown_executor():
+    """Останавливает пулы процессов и потоков, если они были созданы."""
+    global _executor, _inflate_executor
+    if _executor is not None:
+        _executor.shutdown()
+        _executor = None
+    if _inflate_executor is not None:
+        _inflate_executor.shutdown()
+        _inflate_executor = None
+
+
+def read_nested_act(full_zip: zipfile.ZipFile, act: str) -> list:
+    """Достает эксель-файлы одного акта из общего архива. Выполняется в потоке:
+    zlib отпускает GIL, поэтому акты распаковываются параллельно.
+
+    Вложенный архив акта читается в сжатом виде (эксель внутри уже сжат, это
+    немного), файл подписи .sig не распаковывается.
+
+    Returns:
+        list: пары (название вложенного архива акта, байты эксель-файла)
+    """
+    # Вложенный ZIP: внутри как правило два файла, один эксель, другой .sig
+    with zipfile.ZipFile(io.BytesIO(full_zip.read(act))) as nested_zip:
+        return [(act, nested_zip.read(info)) for info in nested_zip.infolist()
+                if info.filename.endswith('.xlsx')]
+
+
+def try_archive_act(account: str, act: str, xlsx_bytes: bytes, number_pattern: str, act_date=None) -> bool:
+    """Сохраняет акт в локальный архив. Ошибка записи не останавливает загрузку.
+
+    Returns:
+        bool: акт сохранен в архив
+    """
+    try:
+        archive_act(account, act, xlsx_bytes, number_pattern, act_date)
+        return True
+    except Exception as e:
+        logging.error(f"[{account}] Акт {act} не сохранен в архив: {e!r}")
+        return False
+
+
+def parse_act_workbook(act: str, xlsx_bytes: bytes, account: str, number_pattern: str = FBS_NUMBER_PATTERN) -> pd.DataFrame:
+    """Разбирает один эксель-файл акта. Выполняется в процессе пула.
+
+    Лист читается за один проход (act_reader): дата акта берется из D3 (или F3),
+    заголовки — из строк 9 и 10, данные — с 13 строки. Возвращает датафрейм
+    строк акта с колонками Документ, Дата, Номер_документа, account и content_hash
+    (sha256 эксель-файла, для манифеста загруженных актов). Акт, хэш и кабинет
+    лежат и в df.attrs — для манифеста актов без строк.
+    """
+    date_value, df = read_act(xlsx_bytes)
+    df['Документ'] = act
+    df['Дата'] = date_value
+    df['Дата'] = df['Дата'].str.replace(' г.', '').str.strip()
+    df['Номер_документа'] = df['Документ'].str.extract(number_pattern)[0]
+    df['account'] = account
+    content_hash = hashlib.sha256(xlsx_bytes).hexdigest()
+    df['content_hash'] = content_hash
+    df.attrs.update(act=act, account=account, content_hash=content_hash)
+    return df
+
+
+async def parse_archive_async(account: str, decoded_acts, number_pattern: str = FBS_NUMBER_PATTERN) -> list:
+    """Разбирает все акты общего архива: распаковка каждого акта идет в пуле потоков,
+    разбор эксель-файла — в пуле процессов. Одновременно в работе не больше
+    ACT_PARSER_INFLIGHT актов, поэтому в памяти не лежат все эксель-файлы архива сразу.
+    Возвращает список датафреймов в порядке актов в архиве."""
+    loop = asyncio.get_running_loop()
+    executor = get_executor()
+    inflate_executor = get_inflate_executor()
+    inflight = asyncio.Semaphore(INFLIGHT_ACTS)
+
+    archive = archive_enabled()
+
+    async def parse_act(act):
+        async with inflight:
+            workbooks = await loop.run_in_executor(inflate_executor, read_nested_act, full_zip, act)
+            act_dfs = []
+            for name, xlsx_bytes in workbooks:
+                act_date = None
+                try:
+                    df = await loop.run_in_executor(executor, parse_act_workbook, name, xlsx_bytes, account, number_pattern)
+                    act_date = df['Дата'].iat[0] if not df.empty else None
+                finally:
+                    # Акт попадает в архив и тогда, когда разобрать его не удалось
+                    archived = archive and await loop.run_in_executor(
+                        inflate_executor, try_archive_act, account, name, xlsx_bytes, number_pattern, act_date)
+                df.attrs['archived'] = archived
+                act_dfs.append(df)
+            return act_dfs
+
+    # Открываем данные общего архива со всеми документами
+    with zipfile.ZipFile(decoded_acts, 'r') as full_zip:
+        # Ждем все акты, даже если один упал: потоки распаковки читают из full_zip,
+        # и архив нельзя закрывать, пока они не закончат
+        results = await asyncio.gather(*(parse_act(act) for act in full_zip.namelist()), return_exceptions=True)
+    errors = [result for result in results if isinstance(result, BaseException)]
+    if errors:
+        raise errors[0]
+    acts_list = [df for act_dfs in results for df in act_dfs]
+    print(f'[{account}] Разобрано актов: {len(acts_list)}')
+    return acts_list
+
+
+def parse_archived_workbook(act: str, content_hash: str, account: str, number_pattern: str = FBS_NUMBER_PATTERN) -> pd.DataFrame:
+    """Разбирает эксель-файл акта из локального архива. Выполняется в процессе пула:
+    файл читается и распаковывается там же, байты не передаются между процессами."""
+    df = parse_act_workbook(act, read_archived_workbook(content_hash), account, number_pattern)
+    df.attrs['archived'] = True
+    return df
+
+
+async def parse_archived_async(archived_acts: pd.DataFrame, number_pattern: str = FBS_NUMBER_PATTERN) -> list:
+    """Разбирает акты из локального архива в пуле процессов, без обращения к API.
+
+    Args:
+        archived_acts: строки индекса архива (account, act, content_hash)
+
+    Returns:
+        list: датафреймы актов в порядке строк индекса
+    """
+    loop = asyncio.get_running_loop()
+    executor = get_executor()
+    inflight = asyncio.Semaphore(INFLIGHT_ACTS)
+
+    async def parse_act(row):
+        async with inflight:
+            return await loop.run_in_executor(executor, parse_archived_workbook, row.act, row.content_hash,
+                                              row.account, number_pattern)
+
+    return list(await asyncio.gather(*(parse_act(row) for row in archived_acts.itertuples())))
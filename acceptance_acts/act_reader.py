@@ -0,0 +1,215 @@
+"""Однопроходное чтение эксель-файлов актов приема-передачи.
+
+Вместо load_workbook (ради даты в D3 / F3) и pd.read_excel (ради всего листа)
+XML листа читается один раз потоково:
+    - дата акта берется из ячейки D3, а если она пустая — из F3;
+    - заголовок собирается из строк 9 и 10; ВБ использует несколько постоянных
+      шаблонов, поэтому готовый заголовок кэшируется по содержимому этих строк;
+    - данные берутся с 13 строки и сразу раскладываются по колонкам,
+      пустые строки пропускаются.
+Результат совпадает с прежним разбором через pd.read_excel: значения как в ячейках,
+пустые ячейки — NaN, типы колонок те же. Числа в ячейках с форматом даты
+или времени (по numFmt из styles.xml) переводятся в datetime / time / timedelta
+теми же функциями openpyxl, что и при pd.read_excel.
+"""
+import io
+import posixpath
+import zipfile
+from functools import lru_cache
+from xml.etree.ElementTree import fromstring, iterparse
+import numpy as np
+import pandas as pd
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format, is_timedelta_format
+from openpyxl.utils.datetime import MAC_EPOCH, WINDOWS_EPOCH, from_excel, from_ISO8601
+
+NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+REL_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+PKG_REL_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+# Номера строк Excel (с единицы)
+DATE_ROW = 3
+DATE_COLUMNS = (3, 5)  # D и F, с нуля
+HEADER_ROWS = (9, 10)
+DATA_START_ROW = 13
+
+
+def _column_index(ref: str) -> int:
+    """Номер колонки (с нуля) по адресу ячейки вида 'AB12'."""
+    index = 0
+    for char in ref:
+        if char.isdigit():
+            break
+        index = index * 26 + ord(char.upper()) - 64
+    return index - 1
+
+
+def _shared_strings(xlsx: zipfile.ZipFile) -> list:
+    if 'xl/sharedStrings.xml' not in xlsx.namelist():
+        return []
+    strings = []
+    with xlsx.open('xl/sharedStrings.xml') as file:
+        for _, elem in iterparse(file):
+            if elem.tag == NS + 'si':
+                # Текст ячейки — прямой <t> или куски форматированного текста <r><t>, без фонетики <rPh>
+                parts = [child.text or '' for child in elem if child.tag == NS + 't']
+                parts += [run.findtext(NS + 't') or '' for run in elem if run.tag == NS + 'r']
+                strings.append(''.join(parts))
+                elem.clear()
+    return strings
+
+
+def _date_styles(xlsx: zipfile.ZipFile) -> dict:
+    """Стили ячеек с форматом даты или времени: {номер стиля: формат длительности ли это}."""
+    if 'xl/styles.xml' not in xlsx.namelist():
+        return {}
+    with xlsx.open('xl/styles.xml') as file:
+        root = fromstring(file.read())
+    custom = {int(fmt.get('numFmtId')): fmt.get('formatCode')
+              for fmt in root.iterfind(f'{NS}numFmts/{NS}numFmt')}
+    styles = {}
+    for index, xf in enumerate(root.iterfind(f'{NS}cellXfs/{NS}xf')):
+        fmt_id = int(xf.get('numFmtId', 0))
+        fmt = custom.get(fmt_id) or BUILTIN_FORMATS.get(fmt_id)
+        if fmt and is_date_format(fmt):
+            styles[index] = is_timedelta_format(fmt)
+    return styles
+
+
+def _workbook_info(xlsx: zipfile.ZipFile) -> tuple:
+    """Путь к XML активного листа книги и начало отсчета дат (1900 или 1904)."""
+    with xlsx.open('xl/workbook.xml') as file:
+        workbook = file.read()
+    root = fromstring(workbook)
+    properties = root.find(f'{NS}workbookPr')
+    date1904 = properties is not None and properties.get('date1904') in ('1', 'true')
+    return _active_sheet_path(xlsx, root), MAC_EPOCH if date1904 else WINDOWS_EPOCH
+
+
+def _active_sheet_path(xlsx: zipfile.ZipFile, root) -> str:
+    """Путь к XML активного листа книги."""
+    view = root.find(f'{NS}bookViews/{NS}workbookView')
+    active = int(view.get('activeTab', 0)) if view is not None else 0
+    sheets = root.findall(f'{NS}sheets/{NS}sheet')
+    rel_id = sheets[min(active, len(sheets) - 1)].get(REL_NS + 'id')
+    with xlsx.open('xl/_rels/workbook.xml.rels') as file:
+        rels = fromstring(file.read())
+    for rel in rels.iter(PKG_REL_NS + 'Relationship'):
+        if rel.get('Id') == rel_id:
+            target = rel.get('Target')
+            return target.lstrip('/') if target.startswith('/') else posixpath.normpath(posixpath.join('xl', target))
+    return 'xl/worksheets/sheet1.xml'
+
+
+def _cell_value(cell, strings: list, dates: dict, epoch):
+    cell_type = cell.get('t')
+    if cell_type == 'inlineStr':
+        inline = cell.find(NS + 'is')
+        value = ''.join(text.text or '' for text in inline.iter(NS + 't')) if inline is not None else ''
+        return value or None
+    text = cell.findtext(NS + 'v')
+    if text is None:
+        return None
+    if cell_type == 's':
+        return strings[int(text)] or None
+    if cell_type in ('str', 'e'):
+        return text or None
+    if cell_type == 'b':
+        return text == '1'
+    if cell_type == 'd':
+        return from_ISO8601(text)
+    try:
+        number = int(text)
+    except ValueError:
+        number = float(text)
+        number = int(number) if number.is_integer() else number
+    style = int(cell.get('s', 0))
+    if style in dates:
+        try:
+            return from_excel(number, epoch, timedelta=dates[style])
+        except (OverflowError, ValueError):
+            # Как в openpyxl: число вне диапазона дат считается ошибкой ячейки
+            return '#VALUE!'
+    return number
+
+
+def _row_values(row, strings: list, dates: dict, epoch) -> list:
+    values = []
+    for position, cell in enumerate(row.iter(NS + 'c')):
+        ref = cell.get('r')
+        index = _column_index(ref) if ref else position
+        if index >= len(values):
+            values.extend([None] * (index - len(values) + 1))
+        values[index] = _cell_value(cell, strings, dates, epoch)
+    # Пустые ячейки в конце строки не считаются
+    while values and values[-1] is None:
+        values.pop()
+    return values
+
+
+@lru_cache(maxsize=32)
+def build_header(row_1: tuple, row_2: tuple, width: int) -> tuple:
+    """Комбинированный заголовок из строк 9 и 10: 'верхний - нижний' или просто верхний."""
+    row_1 = tuple('' if value is None else str(value) for value in row_1) + ('',) * (width - len(row_1))
+    row_2 = tuple('' if value is None else str(value) for value in row_2) + ('',) * (width - len(row_2))
+    return tuple(f"{h1.strip()} - {h2.strip()}" if h2.strip() else h1.strip()
+                 for h1, h2 in zip(row_1, row_2))
+
+
+def _data_column(head_rows: list, index: int, column: list) -> pd.Series:
+    head = [row[index] if index < len(row) else None for row in head_rows]
+    values = [np.nan if value is None else value for value in head + column]
+    return pd.Series(values).iloc[len(head):].reset_index(drop=True)
+
+
+def read_act(source) -> tuple:
+    """Читает эксель-файл акта (байты или файл) за один проход по листу.
+
+    Returns:
+        tuple: (дата акта из D3 / F3 или 'Нет даты', датафрейм строк акта с заголовком)
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    with zipfile.ZipFile(source) as xlsx:
+        strings = _shared_strings(xlsx)
+        dates = _date_styles(xlsx)
+        sheet_path, epoch = _workbook_info(xlsx)
+        date_row, header_rows, head_rows = [], {}, []
+        columns = []
+        width = 0
+        data_rows = 0
+        with xlsx.open(sheet_path) as file:
+            for _, elem in iterparse(file):
+                if elem.tag != NS + 'row':
+                    continue
+                row_number = int(elem.get('r', 0))
+                values = _row_values(elem, strings, dates, epoch)
+                elem.clear()
+                width = max(width, len(values))
+                if row_number < DATA_START_ROW:
+                    head_rows.append(values)
+                if row_number == DATE_ROW:
+                    date_row = values
+                elif row_number in HEADER_ROWS:
+                    header_rows[row_number] = values
+                elif row_number >= DATA_START_ROW and values:
+                    # Строка данных сразу раскладывается по колонкам
+                    if len(values) > len(columns):
+                        columns.extend([None] * data_rows for _ in range(len(values) - len(columns)))
+                    for index, column in enumerate(columns):
+                        column.append(values[index] if index < len(values) else None)
+                    data_rows += 1
+
+    date_value = 'Нет даты'
+    for index in DATE_COLUMNS:
+        if index < len(date_row) and date_row[index]:
+            date_value = date_row[index]
+            break
+
+    header = build_header(tuple(header_rows.get(HEADER_ROWS[0], ())),
+                          tuple(header_rows.get(HEADER_ROWS[1], ())), width)
+    columns.extend([None] * data_rows for _ in range(width - len(columns)))
+    # Тип колонки выводится вместе с верхними строками листа, как при срезе
+    # листа целиком из pd.read_excel: колонка с заголовком и числами остается object
+    df = pd.DataFrame({index: _data_column(head_rows, index, column) for index, column in enumerate(columns)})
+    df.columns = list(header)
+    return date_value, df
@@ -0,0 +1,12 @@
+import argparse
+import asyncio
+from utils_act import main_reparse
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Перезагрузка актов ФБС и ФБО из локального архива')
+    parser.add_argument('--account', help='только этот кабинет')
+    parser.add_argument('--date-from', help='дата акта с (YYYY-MM-DD)')
+    parser.add_argument('--date-to', help='дата акта по (YYYY-MM-DD)')
+    args = parser.parse_args()
+    asyncio.run(main_reparse(args.account, args.date_from, args.date_to))
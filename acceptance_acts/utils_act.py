@@ -1,22 +1,89 @@
 import pandas as pd
 import json
-import base64
-from utils_sql import create_connection_to_vector_db, execute_query
+import sys
+from utils_sql import create_connection_to_vector_db
 from datetime import datetime, timedelta
-import io
 import asyncio
 import aiohttp
 import os
 import logging
 from dotenv import load_dotenv
-import zipfile
-from openpyxl import load_workbook
 from sqlalchemy import create_engine, text
 from sqlalchemy.exc import SQLAlchemyError
 import logging
 import os
 from dotenv import load_dotenv
 
+# Общие модули проекта (клиент API ВБ) лежат в корневой папке
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from wb_client import get_client, close_client, data_dir
+from wb_retry import AccountUnavailableError
+from wb_documents import read_document_archive
+from act_parser import parse_archive_async, parse_archived_async, shutdown_executor
+from act_archive import list_archived_acts
+
+# Манифест загруженных актов. Акт ВБ после выдачи не меняется, поэтому документ,
+# который уже есть в манифесте, повторно не скачивается и не разбирается
+ACT_MANIFEST_TABLE = 'acceptance_acts_manifest'
+ACT_MANIFEST_COLUMNS = {
+    'account': 'VARCHAR(100)',
+    'service_name': 'VARCHAR(255)',
+    'category': 'VARCHAR(50)',
+    'content_hash': 'VARCHAR(64)',
+    'row_count': 'INTEGER',
+    'ingested_at': 'TIMESTAMP',
+}
+
+# Категории актов приема-передачи ФБС и ФБО в перечне документов. Перечень
+# запрашивается по категориям: без фильтра API отдает все документы кабинета
+ACT_CATEGORIES = ('act-income-mp', 'act-income')
+# Номер документа в названии вложенного архива акта любой категории
+ACT_NUMBER_PATTERN = r'(\d+)\.zip'
+# Шаблон акта определяется по заголовку: у ФБС есть стикер, у ФБО — ШК короба
+FBS_TEMPLATE_COLUMN = 'Фактически принято - Стикер/этикетка'
+FBO_TEMPLATE_COLUMN = ' - ШК короба'
+# Строки одного документа в таблицах актов
+ACT_DOCUMENT_KEY = ('account', 'document_number')
+
+# Сверка строк актов ФБС со сборочными заданиями. Сверяются только новые строки
+# актов и строки, для которых задание еще не было найдено (за RECONCILE_RECHECK_DAYS дней)
+ACT_RECONCILIATION_TABLE = 'acceptance_fbs_reconciliation'
+ACT_RECONCILIATION_COLUMNS = {
+    'order_number': 'VARCHAR(255)',
+    'sticker': 'VARCHAR(255)',
+    'document_number': 'VARCHAR(50)',
+    'account': 'VARCHAR(50)',
+    'date': 'DATE',
+    'quantity': 'INTEGER',
+    'supply_id': 'VARCHAR(255)',
+    'nm_id': 'BIGINT',
+    'local_vendor_code': 'VARCHAR(255)',
+    'wb_status': 'TEXT',
+    'supplier_status': 'TEXT',
+    'in_supply': 'BOOLEAN',
+    'in_status_model': 'BOOLEAN',
+    'matched': 'BOOLEAN',
+    'reconciled_at': 'TIMESTAMP',
+}
+RECONCILE_RECHECK_DAYS = int(os.getenv('ACT_RECONCILE_RECHECK_DAYS', 30))
+# В assembly_task_status_model на задание приходится по строке на каждую пару статусов
+# без отметки времени. Для сверки берется строка с финальным статусом ВБ
+# (как FINAL_WB_STATUSES в assembly_info_utils), затем с финальным статусом продавца
+FINAL_WB_STATUSES = ('sold', 'canceled', 'canceled_by_client', 'declined_by_client', 'defect')
+FINAL_SUPPLIER_STATUSES = ('complete', 'cancel')
+
+# Конвейер загрузки актов (скачивание -> разбор -> загрузка в БД): размер очередей
+# между этапами, число одновременно разбираемых архивов и строк в одной загрузке в БД
+PIPELINE_QUEUE_SIZE = int(os.getenv('ACT_PIPELINE_QUEUE', 4))
+PIPELINE_PARSERS = int(os.getenv('ACT_PIPELINE_PARSERS', 2))
+LOAD_BATCH_ROWS = int(os.getenv('ACT_LOAD_BATCH_ROWS', 50000))
+
+# Кэш перечня документов по дням. Перечень за день, который старше LIST_OPEN_DAYS
+# дней, больше не меняется и повторно у API не запрашивается. Кэш лежит в папке
+# данных вне проекта (WB_DATA_DIR, по умолчанию ~/wb_data)
+LIST_CACHE_DIR = os.getenv('ACT_LIST_CACHE_DIR', os.path.join(data_dir(), 'documents_list_cache'))
+LIST_OPEN_DAYS = int(os.getenv('ACT_LIST_OPEN_DAYS', 3))
+
 # Функция для загрузки API токенов из файла tokens.json
 def load_api_tokens():
     # Укажи полный путь к tokens.json
@@ -24,6 +91,8 @@ def load_api_tokens():
     CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
     file_path = os.path.join(CURRENT_DIR, "tokens.json")
     # file_path = 'tokens.json'
+    # Другой файл токенов можно указать в WB_TOKENS_FILE (например, для тестового сервера)
+    file_path = os.getenv('WB_TOKENS_FILE') or file_path
     
     if not os.path.exists(file_path):
         raise FileNotFoundError(f"Файл с токенами не найден: {file_path}")
@@ -31,8 +100,72 @@ def load_api_tokens():
     with open(file_path, encoding='utf-8') as f:
         tokens = json.load(f)
         return tokens
+
+
+async def fetch_documents_pages(account: str, token: str, title: str, beginTime: str, endTime: str) -> tuple:
+    """Все страницы documents/list за период.
+
+    Returns:
+        tuple: (список документов, True если перечень получен полностью без ошибок)
+    """
+    path = '/api/v1/documents/list'
+    client = get_client()
+    all_documents = []
+    offset = 0
+    limit = 50
     
-semaphore = asyncio.Semaphore(10)
+    while True:
+        params = {
+            'beginTime': beginTime,
+            'endTime': endTime,
+            'limit': limit,
+            'offset': offset
+        }
+        
+        # Добавляем category только если указано
+        if title:
+            params['category'] = title
+        
+        try:
+            async with client.get(account, 'documents', path, token, params=params) as res:
+                if res.status == 200:
+                    data = await res.json()
+                    documents = data.get('data', {}).get('documents', [])
+                    print(f"Успешно получены документы за период {beginTime} - {endTime} по аккаунту {account}")
+                    
+                    # Если документов нет - выходим
+                    if not documents:
+                        print(f"Документы не найдены для периода {beginTime} - {endTime}")
+                        return all_documents, True
+                        
+                    all_documents.extend(documents)
+                    print(f"Получено {len(documents)} документов, всего: {len(all_documents)}, offset: {offset}")
+                    
+                    # Если получено меньше limit - это последняя страница
+                    if len(documents) < limit:
+                        print(f"Последняя страница: всего получено {len(all_documents)} документов")
+                        return all_documents, True
+                        
+                    # Лимит 1 запрос в 10 секунд (всплеск 5) соблюдает ограничитель клиента
+                    offset += limit
+                    
+                else:
+                    error_text = await res.text()
+                    print(f"Ошибка HTTP {res.status}: {error_text}")
+                    break
+                    
+        except aiohttp.ClientError as err:
+            print(f"Сетевая ошибка: {err}")
+            break
+        except asyncio.TimeoutError:
+            print("Таймаут запроса")
+            break
+        except Exception as e:
+            print(f"Неожиданная ошибка: {e}")
+            break
+
+    return all_documents, False
+
 
 async def documents_list_async(account: str, token: str, title: str, beginTime = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d'), endTime = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d'))-> pd.DataFrame:
     """
@@ -41,94 +174,95 @@ async def documents_list_async(account: str, token: str, title: str, beginTime =
     Args:
         token: Токен авторизации
         title: ID категории документов (опционально)
-        days_back: Количество дней назад для периода выборки
-        locale: Язык поля категории ('ru', 'en', 'zh')
-        sort: Поле для сортировки ('date', 'category')
-        order: Порядок сортировки ('desc', 'asc')
+        beginTime, endTime: период выборки (YYYY-MM-DD)
     
     Returns:
         DataFrame с документами или None в случае ошибки
     """
-    url = 'https://documents-api.wildberries.ru/api/v1/documents/list'
-    headers = {'Authorization': token}
-    all_documents = []
-    # beginTime = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
-    # endTime = beginTime
-    offset = 0
-    limit = 50
-    
-    async with aiohttp.ClientSession(headers=headers) as session:
-        while True:
-            params = {
-                'beginTime': beginTime,
-                'endTime': endTime,
-                'limit': limit,
-                'offset': offset
-            }
-            
-            # Добавляем category только если указано
-            if title:
-                params['category'] = title
-            
-            try:
-                async with session.get(url, params=params) as res:
-                    if res.status == 200:
-                        data = await res.json()
-                        documents = data.get('data', {}).get('documents', [])
-                        print(f"Успешно получены документы за период {beginTime} - {endTime} по аккаунту {account}")
-                        
-                        # Если документов нет - выходим
-                        if not documents:
-                            print(f"Документы не найдены для периода {beginTime} - {endTime}")
-                            break
-                            
-                        all_documents.extend(documents)
-                        print(f"Получено {len(documents)} документов, всего: {len(all_documents)}, offset: {offset}")
-                        
-                        # Если получено меньше limit - это последняя страница
-                        if len(documents) < limit:
-                            print(f"Последняя страница: всего получено {len(all_documents)} документов")
-                            break
-                            
-                        offset += limit
-                        
-                        # Соблюдаем лимит запросов - 1 запрос в 10 секунд
-                        await asyncio.sleep(10)
-                        
-                    else:
-                        error_text = await res.text()
-                        print(f"Ошибка HTTP {res.status}: {error_text}")
-                        
-                        # При ошибке 429 (Too Many Requests) ждем дольше
-                        if res.status == 429:
-                            await asyncio.sleep(30)
-                        else:
-                            await asyncio.sleep(10)
-                            
-                        # При серьезных ошибках прерываем выполнение
-                        if res.status >= 500:
-                            break
-                        
-            except aiohttp.ClientError as err:
-                print(f"Сетевая ошибка: {err}")
-                await asyncio.sleep(10)
-                break
-            except asyncio.TimeoutError:
-                print("Таймаут запроса")
-                await asyncio.sleep(10)
-                break
-            except Exception as e:
-                print(f"Неожиданная ошибка: {e}")
-                await asyncio.sleep(10)
-                break
-
+    all_documents, _ = await fetch_documents_pages(account, token, title, beginTime, endTime)
     if all_documents:
         df = pd.DataFrame(all_documents)
         return df
     else:
         print("Не удалось получить документы")
         return None
-    
+
+
+def _list_cache_path(account: str, title: str, day: str) -> str:
+    account = ''.join('_' if char in '/\\:*?"<>|' else char for char in str(account))
+    return os.path.join(LIST_CACHE_DIR, account, title or 'all', f'{day}.json')
+
+
+def read_cached_documents(account: str, title: str, day: str):
+    """Перечень документов закрытого дня из кэша или None, если дня в кэше нет."""
+    try:
+        with open(_list_cache_path(account, title, day), encoding='utf-8') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logging.warning(f"Не удалось прочитать кэш перечня документов {account} {day}: {e}")
+        return None
+
+
+def write_cached_documents(account: str, title: str, day: str, documents: list):
+    """Сохраняет перечень документов закрытого дня (в том числе пустой)."""
+    path = _list_cache_path(account, title, day)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Файл пишется целиком под временным именем, чтобы в кэше не было недописанных дней
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump(documents, file, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+async def documents_list_cached(account: str, token: str, title: str, beginTime: str, endTime: str) -> pd.DataFrame:
+    """documents/list за период с кэшем по дням.
+
+    Дни старше LIST_OPEN_DAYS считаются закрытыми: их перечень уже не меняется
+    и берется из кэша (кабинет, категория, день). Открытые дни и закрытые дни,
+    которых еще нет в кэше, запрашиваются одним диапазоном, после чего закрытые
+    дни из ответа раскладываются по дате creationTime и сохраняются в кэш.
+    Неполный ответ (ошибка на одной из страниц) в кэш не попадает.
+
+    Returns:
+        DataFrame с документами или None, если документов нет или запрос не удался
+    """
+    first_open_day = (datetime.now() - timedelta(days=LIST_OPEN_DAYS)).strftime('%Y-%m-%d')
+    begin = datetime.strptime(beginTime, '%Y-%m-%d')
+    days = [(begin + timedelta(days=day)).strftime('%Y-%m-%d')
+            for day in range((datetime.strptime(endTime, '%Y-%m-%d') - begin).days + 1)]
+
+    all_documents, missing, cached_days = [], [], set()
+    for day in days:
+        cached = read_cached_documents(account, title, day) if day < first_open_day else None
+        if cached is None:
+            missing.append(day)
+        else:
+            all_documents.extend(cached)
+            cached_days.add(day)
+    print(f"Аккаунт {account}: дней в кэше перечня документов {len(days) - len(missing)} из {len(days)}")
+
+    if missing:
+        documents, complete = await fetch_documents_pages(account, token, title, missing[0], missing[-1])
+        # Диапазон может захватить дни из кэша между пропущенными, их документы уже есть
+        all_documents.extend(document for document in documents
+                             if str(document.get('creationTime', ''))[:10] not in cached_days)
+        closed_days = [day for day in missing if day < first_open_day]
+        if complete and closed_days:
+            by_day = {day: [] for day in closed_days}
+            for document in documents:
+                day = str(document.get('creationTime', ''))[:10]
+                if day in by_day:
+                    by_day[day].append(document)
+            for day, day_documents in by_day.items():
+                write_cached_documents(account, title, day, day_documents)
+
+    if all_documents:
+        return pd.DataFrame(all_documents)
+    return None
+
+
 def batchify(data, batch_size):
     """
     Splits data into batches of a specified size.
@@ -143,118 +277,141 @@ def batchify(data, batch_size):
     for i in range(0, len(data), batch_size):
         yield data[i:i + batch_size]
     
+async def download_acts_batch(account, batch, tokens):
+    """Скачивает одну пачку документов (до 50) одним архивом.
+
+    Returns:
+        tuple: (статус ответа, файл с общим архивом или None)
+    """
+    path = '/api/v1/documents/download/all'
+    client = get_client()
+    payload = {
+                "params": [
+                    {
+                        "extension": "xlsx",
+                        "serviceName": doc_id
+                    } for doc_id in batch
+                ]
+            }
+    print(payload)
+    async with client.post(account, 'documents', path, tokens[account], json=payload) as res:
+        print(res.status)
+        if res.status == 200:
+            # Тело читается один раз: base64 декодируется по кускам во временный файл
+            decoded_acts = await read_document_archive(res)
+            if decoded_acts is None:
+                print(f"В ответе нет архива документов по ЛК {account}")
+            return res.status, decoded_acts
+        if res.status == 400:
+            error = await res.json()
+            print(f"Ошибка 400 {account}: {error.get('message') or error}")
+        elif res.status == 429:
+            print("429 ошибка — лимит запросов не освободился, пачка пропущена")
+        elif res.status == 401:
+            print(f"401 ошибка авторизации по ЛК {account}")
+        else:
+            print('Отсутствует список документов')
+        return res.status, None
+
+
+async def iter_decoded_acts(account, doc_list, tokens, batch_size=50):
+    """Асинхронный генератор: скачивает все пачки документов кабинета и отдает
+    архив каждой пачки сразу после загрузки. Следующая пачка скачивается,
+    пока обрабатывается текущая. Частоту запросов ограничивает клиент.
+    Пачка, которую не удалось скачать (таймаут, сетевая ошибка, битый ответ),
+    пропускается, остальные пачки и кабинеты загружаются; ее акты не попадают
+    в манифест и будут скачаны при следующем запуске."""
+    batches = list(batchify(doc_list, batch_size))
+    next_task = None
+    try:
+        for i, batch in enumerate(batches):
+            task = next_task or asyncio.create_task(download_acts_batch(account, batch, tokens))
+            next_task = (asyncio.create_task(download_acts_batch(account, batches[i + 1], tokens))
+                         if i + 1 < len(batches) else None)
+            try:
+                status, decoded_acts = await task
+            except AccountUnavailableError as e:
+                # Кабинет отключен — остальные пачки не запрашиваем
+                logging.error(f"[{account}] {e}")
+                return
+            except Exception as e:
+                logging.error(f"[{account}] Пачка документов {i + 1} из {len(batches)} пропущена "
+                              f"({batch[0]} ... {batch[-1]}): {e!r}")
+                continue
+            if status == 401:
+                return
+            if decoded_acts is not None:
+                print(f"[{account}] Получена пачка документов {i + 1} из {len(batches)}")
+                yield decoded_acts
+    finally:
+        if next_task is not None and not next_task.done():
+            next_task.cancel()
+
+
 async def get_decoded_acts(account, doc_list, tokens):
-    batch_doc_list = list(batchify(doc_list, 50))
-    url = 'https://documents-api.wildberries.ru/api/v1/documents/download/all'
-    headers = {'Authorization': tokens[account]}
-    acts_data = []
-    async with semaphore:
-        async with aiohttp.ClientSession(headers=headers) as session:
-            for batch in batch_doc_list:
-                payload = {
-                            "params": [
-                                {
-                                    "extension": "xlsx",
-                                    "serviceName": doc_id
-                                } for doc_id in batch
-                            ]
-                        }
-                print(payload)
-                try:
-                    async with session.post(url, json=payload) as res:
-                        print(res.status)
-                        error = await res.json()
-                        if res.status == 400:
-                            print(f"Ошибка 400 {account}: {error.get('message') or error}")
-                        if res.status == 429:
-                            print("429 ошибка — лимит запросов. Ждём 5 минут")
-                            await asyncio.sleep(300)
-                            continue
-                        if res.status == 401:
-                            print(f"401 ошибка авторизации по ЛК {account}")
-                            await asyncio.sleep(300)
-                            continue
-                        if res.status == 200:
-                            data = await res.json()
-                            document_data = data['data']['document']
-                            # Извлекаем зипы документов
-                            decoded_data = base64.b64decode(document_data)
-                            # Получаю общий архив, со всеми запрошенными документами
-                            decoded_acts = io.BytesIO(decoded_data)
-                            # Обрабатываем полученные документы
-                            acts_data.append(decoded_acts)
-                            return acts_data
-                        else:
-                            print('Отсутствует список документов')
-                except aiohttp.ClientError as e:
-                    print(f"Сетевая ошибка для {account}: {e}")
-                    await asyncio.sleep(30)
-
-def proccessing_data_acceptance_act(account, decoded_acts):
-    """Позволяет обрабатывать каждый отдельный архив, который
-    содержит внутри эксель файл с информацией о приеме передаче товара
-    по заказам ФБС. Возвращает датафрейм с информацией по каждому
-    сборочному заданию в документе."""
-    acts_list = []
-    # Открываем данные общего архива со всеми документами
-    with zipfile.ZipFile(decoded_acts, 'r') as full_zip:
-        # Представляем документы в архиве, как коллекцию zip-файлов
-        acts_income_zip = full_zip.namelist()
-        for act in acts_income_zip:
-            # Проходим циклом по каждому документу
-            with full_zip.open(act) as nested_zip_file:
-                # Читаем содержимое вложенного ZIP как байты
-                nested_zip_bytes = nested_zip_file.read()
-                # Загружаем его в память как новый ZIP-объект. Внутри как правило два файла, один эксель, другой .sig
-                nested_zip = zipfile.ZipFile(io.BytesIO(nested_zip_bytes))
-                # Получаем список файлов внутри вложенного ZIP
-                print("Файлы внутри вложенного ZIP:")
-                # Теперь извлекаем каждый эксель файл
-                for inner_file in nested_zip.namelist():
-                    print(f"  - {inner_file}")
-                    # Если нужно, обрабатываем, например, ищем .xlsx
-                    if inner_file.endswith('.xlsx'):
-                        with nested_zip.open(inner_file) as xlsx_file:
-                            wb = load_workbook(xlsx_file, read_only=True)
-                            ws = wb.active
-                            # Получаем значение из D3
-                            if ws['D3'].value:
-                                date_value = ws['D3'].value
-                            elif ws['F3'].value:
-                                date_value = ws['F3'].value
-                            else:
-                                date_value = 'Нет даты'
-                            df_act = pd.read_excel(xlsx_file, header=None)
-
-                            # Получаем строки 8 и 9 как заголовки
-                            header_1 = df_act.iloc[8].fillna('')
-                            header_2 = df_act.iloc[9].fillna('')
-
-                            # Формируем комбинированные заголовки
-                            multi_header = [
-                                f"{h1.strip()} - {h2.strip()}" if h2.strip() else h1.strip()
-                                for h1, h2 in zip(header_1, header_2)
-                            ]
-
-                            print(f"Количество колонок в df: {df_act.shape[1]}")
-                            print(f"Количество заголовков: {len(multi_header)}")
-                            
-                            # Загружаем данные с 12 строки
-                            df = df_act.iloc[12:].copy()
-                            df.columns = multi_header
-                            df = df.dropna(how='all').reset_index(drop=True)
-                            df['Документ'] = act
-                            df['Дата'] = date_value
-                            df['Дата'] = df['Дата'].str.replace(' г.', '').str.strip()
-                            df['Номер_документа'] = df['Документ'].str.extract(r'act-income-mp-(\d+)\.zip')        
-                            df['account'] = account
-                            acts_list.append(df)
-                            print(f'Данные по {act} добавлены в список')
-    return acts_list  
+    """Скачивает все пачки документов кабинета. Возвращает список архивов."""
+    return [decoded_acts async for decoded_acts in iter_decoded_acts(account, doc_list, tokens)]
+
+
+def get_act_manifest() -> pd.DataFrame:
+    """Читает манифест загруженных актов (account, service_name).
+    Если таблицы еще нет (первый запуск) или БД недоступна — возвращает пустой
+    датафрейм, и акты загружаются полностью."""
+    connection = create_connection_to_vector_db()
+    if connection is None:
+        return pd.DataFrame(columns=['account', 'service_name'])
+    try:
+        return pd.read_sql(f"SELECT account, service_name FROM {ACT_MANIFEST_TABLE}", connection)
+    except Exception as e:
+        logging.warning(f"Манифест актов не прочитан: {e}")
+        return pd.DataFrame(columns=['account', 'service_name'])
+    finally:
+        connection.close()
+
+
+def filter_new_documents(documents_df: pd.DataFrame) -> pd.DataFrame:
+    """Оставляет в перечне документов (documents/list) только те, которых нет в манифесте."""
+    manifest = get_act_manifest()
+    if manifest.empty:
+        return documents_df
+    ingested = set(zip(manifest['account'], manifest['service_name']))
+    is_new = [key not in ingested for key in zip(documents_df['account'], documents_df['serviceName'])]
+    new_documents = documents_df[is_new]
+    print(f"Документов уже загружено: {len(documents_df) - len(new_documents)}, новых: {len(new_documents)}")
+    return new_documents
+
+
+def build_act_manifest(full_docs: list, category: str) -> pd.DataFrame:
+    """Строки манифеста по разобранным актам: по одной на акт, в том числе
+    на акты без строк, чтобы они тоже не скачивались повторно.
+    serviceName акта — название его вложенного архива без .zip."""
+    rows = [{'account': df.attrs['account'],
+             'service_name': os.path.splitext(df.attrs['act'])[0],
+             'category': category,
+             'content_hash': df.attrs['content_hash'],
+             'row_count': len(df)}
+            for df in full_docs]
+    manifest = pd.DataFrame(rows, columns=[col for col in ACT_MANIFEST_COLUMNS if col != 'ingested_at'])
+    manifest['ingested_at'] = datetime.now()
+    return manifest
+
+
+def save_act_manifest(manifest: pd.DataFrame):
+    """Записывает акты в манифест. Вызывается после загрузки строк актов в БД,
+    чтобы при ошибке загрузки акты были скачаны снова."""
+    if manifest.empty:
+        return
+    create_insert_table_db_sync(manifest, ACT_MANIFEST_TABLE, ACT_MANIFEST_COLUMNS, ('account', 'service_name'))
+    print(f"В манифест записано актов: {len(manifest)}")
 
 # Глобальный лок для создания таблицы
 table_creation_lock = asyncio.Lock()
-def create_insert_table_db_sync(df: pd.DataFrame, table_name: str, columns_type: dict, key_columns: tuple):
+def create_insert_table_db_sync(df: pd.DataFrame, table_name: str, columns_type: dict, key_columns: tuple,
+                                replace_by: tuple = None):
+    """UPSERT датафрейма в таблицу (таблица создается при первом обращении).
+    replace_by — колонки (например, account и document_number): строки таблицы
+    с теми же значениями этих колонок, что во вставляемых данных, удаляются
+    в той же транзакции перед вставкой."""
     load_dotenv()
     
     user = os.getenv('USER_2')
@@ -344,6 +501,13 @@ def create_insert_table_db_sync(df: pd.DataFrame, table_name: str, columns_type:
                     SELECT {', '.join(select_columns)} FROM {temp_table}
                 """
             
+            if replace_by:
+                matches = ' AND '.join(f"{table_name}.{col} = replaced.{col}" for col in replace_by)
+                conn.execute(text(f"""
+                    DELETE FROM {table_name}
+                    USING (SELECT DISTINCT {', '.join(replace_by)} FROM {temp_table}) AS replaced
+                    WHERE {matches}
+                """))
             conn.execute(text(upsert_query))
             # Удаляем временную таблицу
             conn.execute(text(f"DROP TABLE {temp_table}"))
@@ -362,22 +526,26 @@ def create_insert_table_db_sync(df: pd.DataFrame, table_name: str, columns_type:
             engine.dispose()    
 
 # Получаем перечень доступных для скачивания документов
-async def create_acceptance_certificate_fbs_async(beginTime = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d'), endTime = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')):
-    """Функция обрабатывает данные полученные в documents_list
-    для каждого кабинета на ВБ. Забирает информацию об АПП ФБС"""
+async def list_act_documents(beginTime = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d'), endTime = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')):
+    """Перечень актов приема-передачи ФБС и ФБО по всем кабинетам.
+    documents/list запрашивается по каждой категории актов (ACT_CATEGORIES), чтобы
+    не листать остальные документы кабинета. Кабинеты и категории запрашиваются
+    одновременно, каждый кабинет под своим ограничителем клиента; закрытые дни
+    берутся из кэша. Категория из перечня только сужает выборку: ФБС и ФБО
+    различаются потом по шаблону акта (route_acts)."""
     tokens = load_api_tokens()
     
     doc_list_data = []
-    for account, token in tokens.items():
-        # Получаем документы для 'act-income-mp'
-        result_mp = await documents_list_async(account, token, 'act-income-mp', beginTime, endTime)
-        if result_mp is not None and not result_mp.empty:
-            result_mp['account'] = account
-            result_mp['doc_type'] = 'act-income-mp'
-            doc_list_data.append(result_mp)
-            print(f"Аккаунт {account}: получено {len(result_mp)} документов act-income-mp")
-        else:
-            print(f"Аккаунт {account}: нет документов act-income-mp")
+    queries = [(account, token, category) for account, token in tokens.items() for category in ACT_CATEGORIES]
+    results = await asyncio.gather(*(documents_list_cached(account, token, category, beginTime, endTime)
+                                     for account, token, category in queries))
+    for (account, _, category), result in zip(queries, results):
+        if result is None or result.empty:
+            print(f"Аккаунт {account}: нет документов {category}")
+            continue
+        result['account'] = account
+        doc_list_data.append(result)
+        print(f"Аккаунт {account}: получено {len(result)} документов {category}")
 
     # Объединяем все данные, если они есть
     if doc_list_data:
@@ -387,86 +555,43 @@ async def create_acceptance_certificate_fbs_async(beginTime = (datetime.now() -
     else:
         print("Не удалось получить ни одного документа")
         return pd.DataFrame()  # возвращаем пустой DataFrame вместо None
-    
-    
-# Получаем перечень доступных для скачивания документов
-async def create_acceptance_certificate_fbo_async():
-    """Функция обрабатывает данные полученные в documents_list
-    для каждого кабинета на ВБ. Забирает информацию об АПП ФБО"""
-    tokens = load_api_tokens()
-    
-    doc_list_data = []
-    
-    for account, token in tokens.items():
-        # Получаем документы для 'act-income'
-        result_income = await documents_list_async(account, token, 'act-income')
-        if result_income is not None and not result_income.empty:  
-            result_income['account'] = account
-            result_income['doc_type'] = 'act-income'
-            doc_list_data.append(result_income)
-            print(f"Аккаунт {account}: получено {len(result_income)} документов act-income")
-        else:
-            print(f"Аккаунт {account}: нет документов act-income")
 
-    # Объединяем все данные, если они есть
-    if doc_list_data:
-        documents_list_df = pd.concat(doc_list_data, ignore_index=True)
-        print(f"Всего собрано {len(documents_list_df)} документов")
-        return documents_list_df
-    else:
-        print("Не удалось получить ни одного документа")
-        return pd.DataFrame()  # возвращаем пустой DataFrame вместо None   
 
-async def get_all_fbs_acts_async(beginTime = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d'), endTime = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')):
-    """Получает и обрабатывает акты ПП ФБС/ФБО со всех ЛК"""
-    # Собирает полный перечень актов
-    full_docs = []
-    
-    # ДОБАВЛЕНО AWAIT - получаем DataFrame с документами
-    acceptance_certificate_df = await create_acceptance_certificate_fbs_async(beginTime, endTime)
-    
-    # Проверяем, что DataFrame не пустой
-    if acceptance_certificate_df.empty:
-        print("Нет документов для обработки")
-        return pd.DataFrame(), pd.DataFrame()
-    
-    # Группируем по аккаунту и получаем список документов для каждого аккаунта
-    acceptance_certificate_dict = acceptance_certificate_df.groupby('account')['serviceName'].apply(list).to_dict()
-    
-    # Для каждого аккаунта получаем документы, которые к нему относятся
-    for account, doc_list in acceptance_certificate_dict.items():
-        print(f"Обрабатываем аккаунт {account}, документов: {len(doc_list)}")
-        
-        # Получаем распакованные из zip акты
-        acts = await get_decoded_acts(account, doc_list, tokens=load_api_tokens())
-        
-        if acts and acts[0]:
-            # Обрабатываем данные актов
-            processed_acts = proccessing_data_acceptance_act(account, acts[0])
-            full_docs.extend(processed_acts)
+def route_acts(full_docs: list) -> tuple:
+    """Делит разобранные акты по шаблону: в акте ФБС есть колонка стикера,
+    в акте ФБО — ШК короба. ВБ иногда путает категории актов, поэтому
+    категория из перечня документов не используется.
+
+    Returns:
+        tuple: (акты ФБС, акты ФБО)
+    """
+    fbs_docs, fbo_docs = [], []
+    for df in full_docs:
+        if FBS_TEMPLATE_COLUMN in df.columns:
+            fbs_docs.append(df)
+        elif FBO_TEMPLATE_COLUMN in df.columns:
+            fbo_docs.append(df)
         else:
-            print(f"Не удалось получить документы для аккаунта {account}")
-    
-    # Если нет обработанных документов, возвращаем пустые DataFrame
-    if not full_docs:
-        print("Нет обработанных документов")
-        return pd.DataFrame(), pd.DataFrame()
-    
+            logging.warning(f"Неизвестный шаблон акта {df['Документ'].iat[0] if not df.empty else ''}: {list(df.columns)}")
+    print(f"Актов ФБС: {len(fbs_docs)}, актов ФБО: {len(fbo_docs)}")
+    return fbs_docs, fbo_docs
+
+
+def build_fbs_acts(fbs_docs: list) -> pd.DataFrame:
+    """Строки актов ФБС для таблицы acceptance_fbs_acts_new"""
+    if not fbs_docs:
+        return pd.DataFrame()
     # Объединяем датафреймы
-    final_df = pd.concat(full_docs, ignore_index=True)
-    
-    # Проверяем, что final_df не пустой
-    if final_df.empty:
-        print("Объединенный DataFrame пуст")
-        return pd.DataFrame(), pd.DataFrame()
+    final_df = pd.concat(fbs_docs, ignore_index=True)
     
     # Удаляем лишние данные из объединенного датафрейма 
     final_df = final_df[final_df['Фактически принято - Стикер/этикетка'] != 'Итого']
 
-    # Из полученных данных формируем акты-приема передачи для ФБС
-    fbs_acts_df = final_df[['№ п\п', 'Номер заказа', 'Ед. изм.', 'Фактически принято - Стикер/этикетка', ' - Кол-во', 'Документ','Номер_документа', 'Дата', 'account']]
+    # Из полученных данных формируем акты-приема передачи для ФБС. Акты собираются
+    # по одной пачке, поэтому колонки, которых нет в шаблонах пачки, добавляются пустыми
+    fbs_acts_df = final_df.reindex(columns=['№ п\п', 'Номер заказа', 'Ед. изм.', 'Фактически принято - Стикер/этикетка', ' - Кол-во', 'Документ','Номер_документа', 'Дата', 'account'])
     
-    # ВБ иногда путает акты ФБО и ФБС, поэтому фильтруем по стикерам
+    # Строки без стикера в акт ФБС не попадают
     fbs_acts_df = fbs_acts_df[fbs_acts_df['Фактически принято - Стикер/этикетка'].notna()]
     
     # Приводим названия колонок к читаемому виду
@@ -502,53 +627,18 @@ async def get_all_fbs_acts_async(beginTime = (datetime.now() - timedelta(days=1)
     return fbs_acts_df
 
 
-async def get_all_fbo_acts_async():
-    """Получает и обрабатывает акты ПП ФБО со всех ЛК"""
-    # Собирает полный перечень актов
-    full_docs = []
-    
-    # ДОБАВЛЕНО AWAIT - получаем DataFrame с документами
-    acceptance_certificate_df = await create_acceptance_certificate_fbo_async()
-    
-    # Проверяем, что DataFrame не пустой
-    if acceptance_certificate_df.empty:
-        print("Нет документов для обработки")
-        return pd.DataFrame(), pd.DataFrame()
-    
-    # Группируем по аккаунту и получаем список документов для каждого аккаунта
-    acceptance_certificate_dict = acceptance_certificate_df.groupby('account')['serviceName'].apply(list).to_dict()
-    
-    # Для каждого аккаунта получаем документы, которые к нему относятся
-    for account, doc_list in acceptance_certificate_dict.items():
-        print(f"Обрабатываем аккаунт {account}, документов: {len(doc_list)}")
-        
-        # Получаем распакованные из zip акты
-        acts = await get_decoded_acts(account, doc_list, tokens=load_api_tokens())
-        
-        if acts and acts[0]:
-            # Обрабатываем данные актов
-            processed_acts = proccessing_data_acceptance_act(account, acts[0])
-            full_docs.extend(processed_acts)
-        else:
-            print(f"Не удалось получить документы для аккаунта {account}")
-    
-    # Если нет обработанных документов, возвращаем пустые DataFrame
-    if not full_docs:
-        print("Нет обработанных документов")
-        return pd.DataFrame(), pd.DataFrame()
-    
+def build_fbo_acts(fbo_docs: list) -> pd.DataFrame:
+    """Строки актов ФБО для таблицы acceptance_fbo_acts_new"""
+    if not fbo_docs:
+        return pd.DataFrame()
     # Объединяем датафреймы
-    final_df = pd.concat(full_docs, ignore_index=True)
+    final_df = pd.concat(fbo_docs, ignore_index=True)
     
-    # Проверяем, что final_df не пустой
-    if final_df.empty:
-        print("Объединенный DataFrame пуст")
-        return pd.DataFrame(), pd.DataFrame()
+    # Из полученных данных формируем акты-приема передачи для ФБО. Колонок кол-во
+    # и ШК товара нет в части шаблонов, они заполняются значениями по умолчанию ниже
+    fbo_acts_df = final_df.reindex(columns=['№ п\п', 'Товар (наименование)', 'Ед. изм.', 'Фактически принято - баркод', ' - артикул продавца', ' - сорт, размер', ' - КИЗ', ' - ШК короба', ' - кол-во', 'Документ','Номер_документа', 'Дата', ' - ШК товара', 'account'])
     
-    # Из полученных данных формируем акты-приема передачи для ФБО
-    fbo_acts_df = final_df[['№ п\п', 'Товар (наименование)', 'Ед. изм.', 'Фактически принято - баркод', ' - артикул продавца', ' - сорт, размер', ' - КИЗ', ' - ШК короба', ' - кол-во', 'Документ','Номер_документа', 'Дата', ' - ШК товара', 'account']]
-    
-    # ВБ иногда путает акты ФБО и ФБС, поэтому фильтруем по ШК короба
+    # Строки без ШК короба в акт ФБО не попадают
     fbo_acts_df = fbo_acts_df[fbo_acts_df[' - ШК короба'].notna()]
     
     # Приводим названия колонок к читаемому виду
@@ -594,36 +684,142 @@ async def get_all_fbo_acts_async():
     print('Данные по ФБО получены')
     return fbo_acts_df
 
-async def main_fbs(days_back=30):
-    "Получает, обрабатывает и передает данные из АПП ФБС в БД"
-    docs_data = []
-    for day in range(1, days_back):
-        beginTime = endTime =(datetime.now() - timedelta(days=day)).strftime('%Y-%m-%d')
-        docs_data.append(await(get_all_fbs_acts_async(beginTime, endTime)))
-        df_fbs = pd.concat(docs_data)
-        columns_type_fbs = {
-            'num': 'INTEGER',
-            'order_number': 'VARCHAR(255)',
-            'unit': 'VARCHAR(50)',
-            'sticker': 'VARCHAR(255)',
-            'quantity': 'INTEGER', 
-            'document': 'VARCHAR(255)',
-            'document_number': 'VARCHAR(50)',
-            'date': 'DATE',
-            'account': 'VARCHAR(50)', 
-        }
-        key_cols_fbs = ('order_number', 'sticker', 'document_number')
-        table_name_fbs = 'acceptance_fbs_acts_new'
-        create_insert_table_db_sync(df_fbs, table_name_fbs, columns_type_fbs, key_cols_fbs) 
-
-        # Устанавливаем соединение с БД
-        connection = create_connection_to_vector_db()
-        query_fin_weekly_fin_rep = """REFRESH MATERIALIZED VIEW public.check_act_fbs;"""
-        execute_query(connection, query_fin_weekly_fin_rep)
-
-async def main_fbo():
-    "Получает, обрабатывает и передает данные из АПП ФБО в БД"
-    df_fbo = await get_all_fbo_acts_async()
+
+def save_fbs_acts(df_fbs: pd.DataFrame, replace: bool = False):
+    """Загружает строки актов ФБС в БД. replace=True — прежние строки этих
+    документов (по кабинету и номеру документа) удаляются перед загрузкой"""
+    columns_type_fbs = {
+        'num': 'INTEGER',
+        'order_number': 'VARCHAR(255)',
+        'unit': 'VARCHAR(50)',
+        'sticker': 'VARCHAR(255)',
+        'quantity': 'INTEGER', 
+        'document': 'VARCHAR(255)',
+        'document_number': 'VARCHAR(50)',
+        'date': 'DATE',
+        'account': 'VARCHAR(50)', 
+    }
+    key_cols_fbs = ('order_number', 'sticker', 'document_number')
+    table_name_fbs = 'acceptance_fbs_acts_new'
+    # В одном INSERT ... ON CONFLICT ключ не может повторяться
+    df_fbs = df_fbs.drop_duplicates(subset=list(key_cols_fbs), keep='last')
+    create_insert_table_db_sync(df_fbs, table_name_fbs, columns_type_fbs, key_cols_fbs,
+                                replace_by=ACT_DOCUMENT_KEY if replace else None)
+
+
+def get_orders_for_acts(order_ids: list) -> tuple:
+    """Сборочные задания по номерам заказов из актов: строки supplies_and_orders и
+    статусы из assembly_task_status_model. Из БД читаются только эти задания (по ключу id).
+    На задание берется одна строка статусов: с финальным статусом ВБ, затем
+    с финальным статусом продавца, при равенстве — по названиям статусов.
+
+    Returns:
+        tuple: (задания в поставках, статусы заданий) или None, если БД недоступна
+    """
+    supplies = pd.DataFrame(columns=['id', 'supply_id', 'nm_id', 'local_vendor_code'])
+    statuses = pd.DataFrame(columns=['id', 'supply_id', 'wb_status', 'supplier_status'])
+    if not order_ids:
+        return supplies, statuses
+    connection = create_connection_to_vector_db()
+    if connection is None:
+        return None
+    params = {'ids': order_ids,
+              'final_wb': list(FINAL_WB_STATUSES),
+              'final_supplier': list(FINAL_SUPPLIER_STATUSES)}
+    try:
+        supplies = pd.read_sql("""
+            SELECT id, supply_id, nm_id, local_vendor_code
+            FROM supplies_and_orders
+            WHERE id = ANY(%(ids)s)
+            """, connection, params=params)
+        statuses = pd.read_sql("""
+            SELECT DISTINCT ON (id) id, supply_id, wb_status, supplier_status
+            FROM assembly_task_status_model
+            WHERE id = ANY(%(ids)s)
+            ORDER BY id,
+                     wb_status = ANY(%(final_wb)s) DESC,
+                     supplier_status = ANY(%(final_supplier)s) DESC,
+                     wb_status, supplier_status
+            """, connection, params=params)
+    except Exception as e:
+        logging.warning(f"Сборочные задания для сверки актов не прочитаны: {e}")
+        return None
+    finally:
+        connection.close()
+    return supplies, statuses
+
+
+def reconcile_fbs_acts(df_acts: pd.DataFrame) -> pd.DataFrame:
+    """Сверяет строки актов ФБС со сборочными заданиями и записывает результат
+    в acceptance_fbs_reconciliation. Номер заказа в акте — ID сборочного задания;
+    задания читаются из БД только по номерам из этих строк и соединяются с актами
+    в памяти (hash join), поэтому сверка зависит от числа новых строк, а не от всей истории.
+
+    Returns:
+        pd.DataFrame: результат сверки
+    """
+    if df_acts.empty:
+        return pd.DataFrame()
+    acts = df_acts[['order_number', 'sticker', 'document_number', 'account', 'date', 'quantity']].copy()
+    acts['order_id'] = pd.to_numeric(acts['order_number'], errors='coerce').astype('Int64')
+    order_ids = [int(order_id) for order_id in acts['order_id'].dropna().unique()]
+    orders = get_orders_for_acts(order_ids)
+    if orders is None:
+        # Без заданий все строки выглядели бы несопоставленными, поэтому сверку не пишем
+        logging.warning(f"Сверка актов ФБС пропущена: задания не прочитаны, строк {len(acts)}")
+        return pd.DataFrame()
+    supplies, statuses = orders
+
+    supplies = supplies.drop_duplicates(subset=['id']).rename(columns={'id': 'order_id'})
+    supplies['order_id'] = supplies['order_id'].astype('Int64')
+    supplies['in_supply'] = True
+    statuses = statuses.rename(columns={'id': 'order_id', 'supply_id': 'status_supply_id'})
+    statuses['order_id'] = statuses['order_id'].astype('Int64')
+    statuses['in_status_model'] = True
+
+    result = acts.merge(supplies, how='left', on='order_id').merge(statuses, how='left', on='order_id')
+    # Поставку берем из supplies_and_orders, а если задания там нет — из модели статусов
+    result['supply_id'] = result['supply_id'].where(result['supply_id'].notna(), result['status_supply_id'])
+    result['in_supply'] = result['in_supply'].eq(True)
+    result['in_status_model'] = result['in_status_model'].eq(True)
+    result['matched'] = result['in_supply'] | result['in_status_model']
+    result['nm_id'] = pd.to_numeric(result['nm_id'], errors='coerce').astype('Int64')
+    result['reconciled_at'] = datetime.now()
+    result = result[list(ACT_RECONCILIATION_COLUMNS)]
+    result = result.drop_duplicates(subset=['order_number', 'sticker', 'document_number'], keep='last')
+    create_insert_table_db_sync(result, ACT_RECONCILIATION_TABLE, ACT_RECONCILIATION_COLUMNS,
+                                ('order_number', 'sticker', 'document_number'))
+    print(f"Сверка актов ФБС: строк {len(result)}, сопоставлено с заданиями {int(result['matched'].sum())}")
+    return result
+
+
+def recheck_unmatched_fbs_acts(before: datetime, days: int = RECONCILE_RECHECK_DAYS) -> pd.DataFrame:
+    """Повторно сверяет строки актов за последние days дней, для которых задание
+    не было найдено при сверке до момента before: задания могут загрузиться позже актов.
+    Заодно сверяются строки актов, сверка которых была пропущена (задания не прочитались)."""
+    connection = create_connection_to_vector_db()
+    if connection is None:
+        return pd.DataFrame()
+    try:
+        unmatched = pd.read_sql(f"""
+            SELECT a.order_number, a.sticker, a.document_number, a.account, a.date, a.quantity
+            FROM acceptance_fbs_acts_new a
+            LEFT JOIN {ACT_RECONCILIATION_TABLE} r USING (order_number, sticker, document_number)
+            WHERE (r.order_number IS NULL OR (NOT r.matched AND r.reconciled_at < %(before)s))
+              AND a.date >= CURRENT_DATE - INTERVAL '{days} days'
+            """, connection, params={'before': before})
+    except Exception as e:
+        logging.warning(f"Несопоставленные строки актов не прочитаны: {e}")
+        return pd.DataFrame()
+    finally:
+        connection.close()
+    print(f"Несопоставленных строк актов ФБС для повторной сверки: {len(unmatched)}")
+    return reconcile_fbs_acts(unmatched)
+
+
+def save_fbo_acts(df_fbo: pd.DataFrame, replace: bool = False):
+    """Загружает строки актов ФБО в БД. replace=True — прежние строки этих
+    документов (по кабинету и номеру документа) удаляются перед загрузкой"""
     columns_type_fbo = {
         'num': 'INTEGER',
         'product_name': 'VARCHAR(255)',
@@ -643,4 +839,232 @@ async def main_fbo():
 
     key_cols_fbo = ('vendor_code', 'box_barcode', 'document_number','shk_id')
     table_name_fbo = 'acceptance_fbo_acts_new'
-    create_insert_table_db_sync(df_fbo, table_name_fbo, columns_type_fbo, key_cols_fbo)          
\ No newline at end of file
+    create_insert_table_db_sync(df_fbo, table_name_fbo, columns_type_fbo, key_cols_fbo,
+                                replace_by=ACT_DOCUMENT_KEY if replace else None)
+
+
+async def list_new_act_documents(periods: list, skip_ingested=True) -> pd.DataFrame:
+    """Перечень актов по всем кабинетам за периоды [(beginTime, endTime), ...].
+    При skip_ingested=True в перечень не попадают акты, которые уже есть в манифесте."""
+    doc_list_data = []
+    for beginTime, endTime in periods:
+        documents_df = await list_act_documents(beginTime, endTime)
+        if not documents_df.empty:
+            doc_list_data.append(documents_df)
+    if not doc_list_data:
+        print("Нет документов для обработки")
+        return pd.DataFrame()
+    documents_df = pd.concat(doc_list_data, ignore_index=True).drop_duplicates(subset=['account', 'serviceName'])
+    # Уже загруженные акты не скачиваем
+    if skip_ingested:
+        documents_df = filter_new_documents(documents_df)
+    return documents_df
+
+
+def split_parsed_acts(docs: list) -> tuple:
+    """Делит разобранные акты на ФБС и ФБО и готовит строки для загрузки.
+
+    Returns:
+        tuple: (строки актов ФБС, строки актов ФБО, строки манифеста)
+    """
+    fbs_docs, fbo_docs = route_acts(docs)
+    # Акт неизвестного шаблона попадает в манифест (без строк), только если он сохранен
+    # в архив актов: после правки разбора его можно взять оттуда. Иначе акт остается
+    # незагруженным и будет скачан снова
+    routed = {id(df) for df in fbs_docs + fbo_docs}
+    unknown_docs = [df for df in docs if id(df) not in routed and df.attrs.get('archived')]
+    manifest = pd.concat([build_act_manifest(fbs_docs, 'act-income-mp'),
+                          build_act_manifest(fbo_docs, 'act-income'),
+                          build_act_manifest(unknown_docs, 'unknown').assign(row_count=0)], ignore_index=True)
+    return build_fbs_acts(fbs_docs), build_fbo_acts(fbo_docs), manifest
+
+
+async def load_parsed_acts(parsed: asyncio.Queue, replace: bool = False) -> dict:
+    """Этап загрузки конвейера: берет из очереди тройки split_parsed_acts до None,
+    копит строки до ACT_LOAD_BATCH_ROWS и загружает их в БД в потоке. Загруженные
+    строки ФБС сразу сверяются с заданиями, после каждой загрузки пишется манифест.
+    replace=True — строки документов заменяются целиком (save_fbs_acts / save_fbo_acts).
+
+    Returns:
+        dict: загружено строк ФБС (fbs), строк ФБО (fbo) и актов (acts)
+    """
+    loaded = {'fbs': 0, 'fbo': 0, 'acts': 0}
+
+    async def flush(fbs_data, fbo_data, manifests):
+        # Загрузка в БД синхронная, поэтому выполняется в потоке
+        if fbs_data:
+            df_fbs = pd.concat(fbs_data, ignore_index=True)
+            await asyncio.to_thread(save_fbs_acts, df_fbs, replace)
+            loaded['fbs'] += len(df_fbs)
+            # Сверка с заданиями только по загруженным строкам
+            await asyncio.to_thread(reconcile_fbs_acts, df_fbs)
+        if fbo_data:
+            df_fbo = pd.concat(fbo_data, ignore_index=True)
+            await asyncio.to_thread(save_fbo_acts, df_fbo, replace)
+            loaded['fbo'] += len(df_fbo)
+        if manifests:
+            manifest = pd.concat(manifests, ignore_index=True)
+            await asyncio.to_thread(save_act_manifest, manifest)
+            loaded['acts'] += len(manifest)
+
+    fbs_data, fbo_data, manifests = [], [], []
+    rows = 0
+    while True:
+        item = await parsed.get()
+        if item is None:
+            break
+        df_fbs, df_fbo, manifest = item
+        if not df_fbs.empty:
+            fbs_data.append(df_fbs)
+        if not df_fbo.empty:
+            fbo_data.append(df_fbo)
+        if not manifest.empty:
+            manifests.append(manifest)
+        rows += len(df_fbs) + len(df_fbo)
+        if rows >= LOAD_BATCH_ROWS:
+            await flush(fbs_data, fbo_data, manifests)
+            fbs_data, fbo_data, manifests = [], [], []
+            rows = 0
+    await flush(fbs_data, fbo_data, manifests)
+    return loaded
+
+
+async def run_pipeline(*stages):
+    """Запускает этапы конвейера одновременно. Ошибка любого этапа останавливает
+    весь конвейер. Возвращает результат последнего этапа."""
+    tasks = [asyncio.ensure_future(stage) for stage in stages]
+    try:
+        results = await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+    return results[-1]
+
+
+async def ingest_acts(acceptance_certificate_dict: dict) -> dict:
+    """Конвейер загрузки актов из трех этапов, связанных очередями ограниченного размера:
+        1. скачивание — пачки документов по всем кабинетам одновременно;
+        2. разбор — архивы распаковываются и разбираются в пулах потоков и процессов,
+           акты делятся на ФБС и ФБО по шаблону;
+        3. загрузка — строки копятся до ACT_LOAD_BATCH_ROWS и загружаются в БД в потоке,
+           не останавливая скачивание и разбор (load_parsed_acts).
+    Если следующий этап не успевает, очередь заполняется и предыдущий этап ждет,
+    поэтому архивы и строки не копятся в памяти.
+
+    Args:
+        acceptance_certificate_dict: {account: [serviceName, ...]}
+
+    Returns:
+        dict: загружено строк ФБС (fbs), строк ФБО (fbo) и актов (acts)
+    """
+    tokens = load_api_tokens()
+    archives = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    parsed = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+
+    async def download_account(account, doc_list):
+        print(f"Обрабатываем аккаунт {account}, документов: {len(doc_list)}")
+        async for decoded_acts in iter_decoded_acts(account, doc_list, tokens):
+            await archives.put((account, decoded_acts))
+
+    async def download():
+        await asyncio.gather(*(download_account(account, doc_list)
+                               for account, doc_list in acceptance_certificate_dict.items()))
+        # Сигнал окончания для каждого обработчика разбора
+        for _ in range(PIPELINE_PARSERS):
+            await archives.put(None)
+
+    async def parse_worker():
+        while True:
+            item = await archives.get()
+            if item is None:
+                break
+            account, decoded_acts = item
+            with decoded_acts:
+                docs = await parse_archive_async(account, decoded_acts, ACT_NUMBER_PATTERN)
+            await parsed.put(split_parsed_acts(docs))
+
+    async def parse():
+        await asyncio.gather(*(parse_worker() for _ in range(PIPELINE_PARSERS)))
+        await parsed.put(None)
+
+    return await run_pipeline(download(), parse(), load_parsed_acts(parsed))
+
+
+async def reparse_archived_acts(account: str = None, date_from: str = None, date_to: str = None,
+                                batch_size: int = 500) -> dict:
+    """Заново разбирает акты из локального архива (act_archive) и перезаписывает
+    acceptance_fbs_acts_new и acceptance_fbo_acts_new. API документов не вызывается.
+
+    Акты разбираются пачками по batch_size в пуле процессов, загрузка в БД идет
+    параллельно с разбором следующей пачки (load_parsed_acts). Прежние строки
+    разобранных документов удаляются в той же транзакции, что и загрузка новых:
+    иначе строки старого разбора с другим ключом (например, shk_id=0) остались бы.
+
+    Args:
+        account: только этот кабинет
+        date_from, date_to: границы даты акта (YYYY-MM-DD)
+
+    Returns:
+        dict: загружено строк ФБС (fbs), строк ФБО (fbo) и актов (acts)
+    """
+    archived_acts = list_archived_acts(account, date_from, date_to)
+    print(f"Актов в архиве для разбора: {len(archived_acts)}")
+    if archived_acts.empty:
+        return {'fbs': 0, 'fbo': 0, 'acts': 0}
+    parsed = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+
+    async def parse():
+        for start in range(0, len(archived_acts), batch_size):
+            docs = await parse_archived_async(archived_acts.iloc[start:start + batch_size], ACT_NUMBER_PATTERN)
+            await parsed.put(split_parsed_acts(docs))
+        await parsed.put(None)
+
+    return await run_pipeline(parse(), load_parsed_acts(parsed, replace=True))
+
+
+async def main_acts(days_back=30, by_day=False):
+    """Получает, обрабатывает и передает данные из АПП ФБС и ФБО в БД.
+
+    Перечень актов за окно со вчерашнего дня на days_back - 1 дней назад запрашивается
+    одним диапазоном, затем акты проходят конвейер ingest_acts: скачивание, разбор
+    и загрузка в обе таблицы идут одновременно, новые строки ФБС сверяются
+    с заданиями. В конце заново сверяются строки, не сопоставленные раньше.
+    by_day=True — перечень документов запрашивается по дням.
+    """
+    days = [(datetime.now() - timedelta(days=day)).strftime('%Y-%m-%d') for day in range(1, days_back)]
+    periods = [(day, day) for day in days] if by_day else [(days[-1], days[0])]
+    started_at = datetime.now()
+    try:
+        documents_df = await list_new_act_documents(periods)
+        if documents_df.empty:
+            print("Новых актов нет")
+            loaded = {'fbs': 0, 'fbo': 0, 'acts': 0}
+        else:
+            # Группируем по аккаунту и получаем список документов для каждого аккаунта
+            acceptance_certificate_dict = documents_df.groupby('account')['serviceName'].apply(list).to_dict()
+            loaded = await ingest_acts(acceptance_certificate_dict)
+    finally:
+        await close_client()
+        shutdown_executor()
+    print(f"Загружено строк актов ФБС: {loaded['fbs']}, ФБО: {loaded['fbo']}, актов: {loaded['acts']}")
+    # Строки, не сопоставленные в прошлых запусках
+    await asyncio.to_thread(recheck_unmatched_fbs_acts, started_at)
+
+
+async def main_fbs(days_back=30, by_day=False):
+    "Загрузка актов ФБС за последние days_back дней (заодно загружаются и акты ФБО за это окно)"
+    await main_acts(days_back, by_day)
+
+
+async def main_fbo(days_back=2):
+    "Загрузка актов ФБО за вчерашний день (заодно загружаются и акты ФБС за этот день)"
+    await main_acts(days_back)
+
+
+async def main_reparse(account=None, date_from=None, date_to=None):
+    "Перезагрузка актов ФБС и ФБО из локального архива без скачивания"
+    try:
+        loaded = await reparse_archived_acts(account, date_from, date_to)
+    finally:
+        shutdown_executor()
+    print(f"Перезагружено строк актов ФБС: {loaded['fbs']}, ФБО: {loaded['fbo']}, актов: {loaded['acts']}")
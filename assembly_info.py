@@ -1,4 +1,7 @@
-from assembly_info_utils import fetch_all_assembly_data, create_assembly_info_df, fetch_all_statuses
+from assembly_info_utils import (fetch_assembly_data_with_statuses, create_assembly_info_df,
+                                 get_assembly_date_from, save_assembly_watermarks,
+                                 get_known_statuses, split_known_statuses, get_status_model_rows,
+                                 save_confirmed_statuses)
 import pandas as pd
 import sys
 import os
@@ -27,16 +30,32 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+# Режим синхронизации: full — все задания за 30 дней,
+# incremental — только задания новее сохраненной отметки по каждому кабинету
+SYNC_MODE = os.getenv('ASSEMBLY_SYNC_MODE', 'full')
+# Окно перекрытия для инкрементального режима, минут
+SYNC_OVERLAP_MINUTES = int(os.getenv('ASSEMBLY_SYNC_OVERLAP_MINUTES', 10))
+# Какие статусы обновлять: all — всех заданий из выдачи,
+# active — только заданий в нефинальном статусе (финальные перепроверяются один раз)
+STATUS_MODE = os.getenv('ASSEMBLY_STATUS_MODE', 'all')
+
 if __name__ == "__main__":
-    logger.info('Начало работы скрипта')
-    # Получаем данные по сборочным заданиям
-    all_data = asyncio.run(fetch_all_assembly_data())
+    logger.info(f'Начало работы скрипта, режим {SYNC_MODE}, статусы {STATUS_MODE}')
+    date_from = get_assembly_date_from(SYNC_OVERLAP_MINUTES) if SYNC_MODE == 'incremental' else None
+    skip_ids = recheck_ids = None
+    if STATUS_MODE == 'active':
+        known_statuses = get_known_statuses()
+        skip_ids, recheck_ids = split_known_statuses(known_statuses)
+        logger.info(f'Статусы не запрашиваются для {sum(len(ids) for ids in skip_ids.values())} заданий')
+    # Получаем данные по сборочным заданиям и их статусы в одном event loop:
+    # статусы запрашиваются по мере получения страниц заказов
+    df_orders, df_statuses = asyncio.run(fetch_assembly_data_with_statuses(load_api_tokens(), date_from=date_from,
+                                                                          skip_ids=skip_ids, recheck_ids=recheck_ids))
+    if df_orders.empty and df_statuses.empty:
+        logger.info('Новых сборочных заданий и статусов нет')
+        sys.exit(0)
     # Создаем датафрейм с информацие по сборочным заданиям
-    df_assembly_id = create_assembly_info_df(all_data)
-    # Создаем словарь для запроса статусов сборочных заданий
-    assembly_dict = df_assembly_id.groupby('account')['id'].apply(list).to_dict()
-    # Получаем информацию по сборочным заданиям в даатфрейме
-    df_statuses = asyncio.run(fetch_all_statuses(assembly_dict, load_api_tokens()))
+    df_assembly_id = create_assembly_info_df(df_orders)
     # Объединяем датафреймы по сборочным заданиям и их статусам
     df_status_model = pd.merge(df_assembly_id, df_statuses, how='left', on=['id', 'account'])
 
@@ -82,6 +101,18 @@ if __name__ == "__main__":
     df_status_model['price'] = (df_status_model['price'] / 100).round(3)
     df_status_model['converted_price'] = (df_status_model['converted_price'] / 100).round(3)
 
+    # Задания из БД, статус которых перепроверялся без повторной выдачи в /api/v3/orders:
+    # берем их сохраненную строку и подставляем новый статус
+    listed_ids = set(df_assembly_id['id'])
+    df_rechecked = df_statuses[~df_statuses['id'].isin(listed_ids)]
+    if not df_rechecked.empty:
+        df_db_rows = get_status_model_rows(df_rechecked['id'].tolist())
+        if not df_db_rows.empty:
+            df_db_rows = df_db_rows.drop(columns=['supplier_status', 'wb_status']).merge(
+                df_rechecked.rename(columns={'supplierStatus': 'supplier_status', 'wbStatus': 'wb_status'}),
+                how='inner', on=['id', 'account'])
+            df_status_model = pd.concat([df_status_model, df_db_rows[df_status_model.columns]], ignore_index=True)
+
     # На всякий случай, проверяем наличие дубликатов
     if df_status_model[['id', 'supplier_status', 'wb_status']].duplicated().sum() > 0:
         df_status_model = df_status_model.drop_duplicates(subset=['id', 'supplier_status', 'wb_status'])
@@ -135,4 +166,11 @@ if __name__ == "__main__":
     # Задаем уникальные поля для проверки уникальности данных
     key_cols = ('id', 'supplier_status', 'wb_status')
     # Отправляем данные в таблицу БД
-    create_insert_table_db(df_status_model, table_name, columns_type, key_cols)
\ No newline at end of file
+    loaded = create_insert_table_db(df_status_model, table_name, columns_type, key_cols)
+    # Запоминаем самое новое задание по каждому кабинету для следующего инкрементального запуска.
+    # Если загрузка не удалась, отметку не сдвигаем, чтобы не потерять задания
+    if loaded:
+        save_assembly_watermarks(df_orders)
+        # Финальные статусы, подтвержденные повторным запросом, больше не опрашиваем
+        if STATUS_MODE == 'active':
+            save_confirmed_statuses(df_statuses, known_statuses)
\ No newline at end of file
@@ -6,10 +6,17 @@ import os
 # Укажи путь к папке, где лежит utils_warehouse.py
 sys.path.append(r'D:\Pytnon_scripts\warehouse_scripts')
 sys.path.append(r'D:\Pytnon_scripts\tokens.json')
-from utils_warehouse import load_api_tokens
+from utils_warehouse import load_api_tokens, get_sync_state, create_insert_table_db_sync, create_connection
+from wb_client import get_client, close_client
+from wb_rate_limit import ENDPOINT_LIMITS
+from wb_ingest import ColumnBuffer, loads
 from time import time
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
 import logging
 
+load_dotenv()
+
 # Определяем директорию текущего файла (скрипта)
 LOG_FILE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assembly_info_log.log")
 
@@ -23,137 +30,311 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-semaphore = asyncio.Semaphore(8)  # максимум 8 одновременных запросов
-
-async def fetch_wb_assembly_task_info(account: str, api_token: str):
+# Таблица с отметкой последнего полученного сборочного задания по каждому кабинету
+ASSEMBLY_STATE_TABLE = 'assembly_sync_state'
+ASSEMBLY_STATE_COLUMNS = {
+    'account': 'VARCHAR(255)',
+    'last_created_at': 'TIMESTAMP',  # UTC
+    'last_id': 'BIGINT',
+    'updated_at': 'TIMESTAMP',
+}
+# ВБ отдает сборочные задания не более чем за 30 дней
+ASSEMBLY_MAX_DAYS = 30
+
+# Таблица статусов сборочных заданий и финальные статусы ВБ, после которых статус не меняется
+STATUS_MODEL_TABLE = 'assembly_task_status_model'
+FINAL_WB_STATUSES = ('sold', 'canceled', 'canceled_by_client', 'declined_by_client', 'defect')
+# Задания с финальным статусом, подтвержденным повторным запросом. Их больше не опрашиваем
+STATUS_CONFIRMED_TABLE = 'assembly_status_confirmed'
+STATUS_CONFIRMED_COLUMNS = {
+    'id': 'BIGINT',
+    'account': 'VARCHAR(255)',
+    'wb_status': 'VARCHAR(255)',
+    'confirmed_at': 'TIMESTAMP',
+}
+
+# Поля сборочного задания и статуса в ответах API — для пустых выборок
+ORDER_COLUMNS = ['address', 'scanPrice', 'deliveryType', 'supplyId', 'orderUid', 'article', 'colorCode', 'rid',
+                 'createdAt', 'offices', 'skus', 'id', 'warehouseId', 'officeId', 'nmId', 'chrtId', 'price',
+                 'convertedPrice', 'currencyCode', 'convertedCurrencyCode', 'cargoType', 'isZeroOrder',
+                 'comment', 'options', 'account']
+STATUS_COLUMNS = ['id', 'supplierStatus', 'wbStatus', 'account']
+
+async def fetch_wb_assembly_task_info(account: str, api_token: str, on_page=None, date_from: int = None,
+                                      buffer: ColumnBuffer = None):
         """ Функция получает информацию обо всех сборочных заданиях, крому их статуса.
         Получаем данные за последние 30 дней.
 
         Параметры:
             account - название аккаунта на ВБ
             api_token - апи-ключ ЛК
+            on_page - необязательная функция, которой передается каждая
+                      полученная страница заказов сразу после ее загрузки
+            date_from - Unix timestamp, начиная с которого запрашивать задания
+                        (инкрементальный режим). По умолчанию — последние 30 дней
+            buffer - общий ColumnBuffer, в который дописываются задания.
+                     Если не передан, создается свой
+
+        Возвращает ColumnBuffer с заданиями кабинета (колонка account добавлена).
         """
-        async with semaphore:
-            url = 'https://marketplace-api.wildberries.ru/api/v3/orders'
-            headers = {'Authorization': api_token}
-
-            full_data = []
-            next_cursor = 0
-            max_attempts = 3
-
-            # Создаём сессию один раз
-            timeout = aiohttp.ClientTimeout(total=10)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                while True:
-                    params = {
-                        'limit': 1000,
-                        'next': next_cursor
-                    }
-
-                    success = False
-                    for attempt in range(max_attempts):
+        path = '/api/v3/orders'
+        client = get_client()
+
+        full_data = buffer if buffer is not None else ColumnBuffer()
+        next_cursor = 0
+
+        # Соединения берём из общего пула клиента, повторы при 429 / 5xx выполняет клиент
+        timeout = aiohttp.ClientTimeout(total=10)
+        while True:
+            params = {
+                'limit': 1000,
+                'next': next_cursor
+            }
+            if date_from is not None:
+                params['dateFrom'] = date_from
+
+            try:
+                async with client.get(account, 'marketplace', path, api_token, params=params, timeout=timeout) as res:
+                    logger.info(f'Получили статус запроса {res.status}')
+                    # Проверяем статус
+                    if res.status == 200:
+                        # Страница сразу раскладывается по колонкам, кабинет — общей колонкой
+                        data = full_data.add_page(await res.read(), 'orders', account=account)
+                        orders = data.get('orders') or []
+                        print(f'Получены данные по кабинету {account}')
+                        if on_page is not None and orders:
+                            on_page(orders)
+
+                        # Обновляем курсор
+                        next_cursor = data.get('next', 0)
+
+                    elif res.status in (400, 401):
                         try:
-                            async with session.get(url, headers=headers, params=params) as res:
-                                logger.info(f'Получили статус запроса {res.status}')
-                                # Проверяем статус
-                                if res.status == 200:
-                                    data = await res.json()
-                                    orders = data.get('orders', [])
-                                    for order in orders:
-                                        order['account'] = account
-                                    full_data.extend(orders)
-                                    print(f'Получены данные по кабинету {account}')
-
-                                    # Обновляем курсор
-                                    next_cursor = data.get('next', 0)
-                                    success = True
-                                    break  # Успешно получили данные
-
-                                elif res.status == 401:
-                                    try:
-                                        error_detail = await res.json()  # Пробуем получить JSON
-                                    except Exception as e:
-                                        error_detail = await res.text()  # Если не JSON — хотя бы текст
-
-                                    logger.error(
-                                        f"[{account}] Ошибка авторизации 401. "
-                                        f"Ответ сервера: {error_detail}"
-                                    )
-                                    return full_data  # Дальше нет смысла
-
-                                elif res.status == 400:
-                                    try:
-                                        error_detail = await res.json()  # Пробуем получить JSON
-                                    except Exception as e:
-                                        error_detail = await res.text()  # Если не JSON — хотя бы текст
-                                    logger.error(f"[{account}] Ошибка запроса: 400. Проверьте параметры.")
-                                    print(f"[{account}] Ошибка запроса: 400. Проверьте параметры.")
-                                    return full_data
-
-                                elif res.status == 429:
-                                    logger.error(f"[{account}] Слишком много запросов. Ждём 60 секунд...")
-                                    print(f"[{account}] Слишком много запросов. Ждём 60 секунд...")
-                                    await asyncio.sleep(60)
-                                    continue  # Повторим попытку
-
-                                elif 400 <= res.status < 500:
-                                    logger.error(f"[{account}] Клиентская ошибка: {res.status}")
-                                    print(f"[{account}] Клиентская ошибка: {res.status}")
-                                    break  # Не повторяем
-
-                                else:
-                                    logger.error(f"[{account}] Серверная ошибка: {res.status}. Попытка {attempt + 1}")
-                                    print(f"[{account}] Серверная ошибка: {res.status}. Попытка {attempt + 1}")
-                                    await asyncio.sleep(1)  # Ждём перед повтором
-
-                        except aiohttp.ClientConnectorError as e:
-                            print(f"[{account}] Ошибка подключения: {e}")
-                            logger.error(f"[{account}] Ошибка подключения: {e}")
-                        except aiohttp.ServerDisconnectedError:
-                            print(f"[{account}] Сервер разорвал соединение")
-                            logger.error(f"[{account}] Сервер разорвал соединение")
-                        except aiohttp.ClientTimeout:
-                            print(f"[{account}] Таймаут соединения")
-                            logger.error(f"[{account}] Таймаут соединения")
-                        except asyncio.TimeoutError:
-                            print(f"[{account}] Таймаут asyncio")
-                            logger.error(f"[{account}] Таймаут asyncio")
+                            error_detail = await res.json()  # Пробуем получить JSON
                         except Exception as e:
-                            logger.error(f"[{account}] Неизвестная ошибка: {e}")
-                            print(f"[{account}] Неизвестная ошибка: {e}")
-
-                        # Задержка перед повтором
-                        await asyncio.sleep(1)
+                            error_detail = await res.text()  # Если не JSON — хотя бы текст
+                        logger.error(f"[{account}] Ошибка запроса {res.status}. Ответ сервера: {error_detail}")
+                        print(f"[{account}] Ошибка запроса {res.status}. Проверьте токен и параметры.")
+                        return full_data  # Дальше нет смысла
 
-                    if not success:
-                        print(f"[{account}] Не удалось получить данные после {max_attempts} попыток. Прерываем.")
-                        logger.error(f"[{account}] Не удалось получить данные после {max_attempts} попыток. Прерываем.")
-                        break
+                    else:
+                        logger.error(f"[{account}] Не удалось получить страницу заданий: {res.status}. Прерываем.")
+                        print(f"[{account}] Не удалось получить страницу заданий: {res.status}. Прерываем.")
+                        return full_data
 
-                    # Если next == 0 — больше нет данных
-                    if next_cursor == 0:
-                        break
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print(f"[{account}] Ошибка соединения: {e!r}. Прерываем.")
+                logger.error(f"[{account}] Ошибка соединения: {e!r}. Прерываем.")
+                return full_data
+            except Exception as e:
+                logger.error(f"[{account}] Неизвестная ошибка: {e}. Прерываем.")
+                print(f"[{account}] Неизвестная ошибка: {e}. Прерываем.")
+                return full_data
 
-                    # Соблюдаем лимит: 200 мс между запросами
-                    await asyncio.sleep(0.2)
+            # Если next == 0 — больше нет данных.
+            # Лимит 300 запросов в минуту соблюдает ограничитель клиента
+            if next_cursor == 0:
+                break
 
-            return full_data
+        return full_data
 
         
 async def fetch_all_assembly_data():
     """ Функция получает информацию по всем кабинетам асинхронно
-    и возвращает список списков с информацие о сборочных заданиях
-    по каждому кабинету."""
-    tasks = [fetch_wb_assembly_task_info(account, token)
+    и возвращает датафрейм со сборочными заданиями всех кабинетов."""
+    buffer = ColumnBuffer()
+    tasks = [fetch_wb_assembly_task_info(account, token, buffer=buffer)
             for account, token in load_api_tokens().items()]
-    results = await asyncio.gather(*tasks)
-    return results
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        await close_client()
+    return buffer.to_frame(ORDER_COLUMNS)
+
 
+async def fetch_assembly_data_with_statuses(tokens_dict=None, max_concurrent=None, date_from: dict = None,
+                                            skip_ids: dict = None, recheck_ids: dict = None):
+    """ Потоковый режим: получает сборочные задания и их статусы в одном event loop.
+    Каждая страница /api/v3/orders сразу уходит на получение статусов,
+    не дожидаясь окончания пагинации по всем кабинетам.
 
-def create_assembly_info_df(all_data: list):
-    """ Функция принимает список списков с информацие о сборочных заданиях и возвращает 
+    Args:
+        date_from (dict): {account: unix timestamp} для инкрементального режима,
+            кабинеты без отметки загружаются за последние 30 дней
+        skip_ids (dict): {account: set(id)} заданий, статус которых не запрашиваем
+        recheck_ids (dict): {account: [id]} заданий из БД, статус которых нужно
+            запросить, даже если их нет в выдаче /api/v3/orders
+
+    Returns:
+        tuple: (датафрейм сборочных заданий всех кабинетов, датафрейм статусов)
+    """
+    tokens_dict = tokens_dict or load_api_tokens()
+    date_from = date_from or {}
+    skip_ids = skip_ids or {}
+    recheck_ids = recheck_ids or {}
+    buffer = ColumnBuffer()
+
+    async def fetch_for_account(account, token):
+        status_tasks = []
+        account_skip = skip_ids.get(account, set())
+        requested = set()
+        # Один семафор на кабинет: пачки статусов всех страниц делят одно ограничение
+        semaphore = asyncio.Semaphore(max_concurrent or ENDPOINT_LIMITS['marketplace'][2])
+
+        def request_statuses(order_ids):
+            order_ids = [order_id for order_id in order_ids
+                         if order_id not in account_skip and order_id not in requested]
+            if order_ids:
+                requested.update(order_ids)
+                status_tasks.append(asyncio.create_task(
+                    fetch_account_statuses(account, token, order_ids, semaphore)))
+
+        def on_page(orders):
+            request_statuses([order['id'] for order in orders])
+
+        await fetch_wb_assembly_task_info(account, token, on_page=on_page,
+                                          date_from=date_from.get(account), buffer=buffer)
+        # Задания из БД, которых не было в выдаче (например, в инкрементальном режиме)
+        request_statuses(recheck_ids.get(account, []))
+        statuses = await asyncio.gather(*status_tasks)
+        return [status for page_statuses in statuses for status in page_statuses]
+
+    try:
+        results = await asyncio.gather(*(fetch_for_account(account, token)
+                                         for account, token in tokens_dict.items()))
+    finally:
+        await close_client()
+
+    df_orders = buffer.to_frame(ORDER_COLUMNS)
+    df_statuses = pd.DataFrame([status for statuses in results for status in statuses])
+    if df_statuses.empty:
+        df_statuses = pd.DataFrame(columns=STATUS_COLUMNS).astype({'id': 'int64'})
+    return df_orders, df_statuses
+
+
+def get_known_statuses(days: int = ASSEMBLY_MAX_DAYS) -> pd.DataFrame:
+    """ Последние известные статусы заданий за days дней из assembly_task_status_model.
+    Возвращает датафрейм id, account, is_final (задание дошло до финального статуса ВБ)
+    и confirmed (финальный статус уже подтвержден повторным запросом)."""
+    final_statuses = ', '.join(f"'{status}'" for status in FINAL_WB_STATUSES)
+    query = f"""
+    SELECT id, account, bool_or(wb_status IN ({final_statuses})) AS is_final
+    FROM {STATUS_MODEL_TABLE}
+    WHERE date > CURRENT_DATE - INTERVAL '{days} days'
+    GROUP BY id, account
+    """
+    connection = create_connection(os.getenv('NAME_2'), os.getenv('USER_2'), os.getenv('PASSWORD_2'),
+                                   os.getenv('HOST_2'), os.getenv('PORT_2'))
+    empty = pd.DataFrame(columns=['id', 'account', 'is_final', 'confirmed'])
+    if connection is None:
+        return empty
+    try:
+        known = pd.read_sql(query, connection)
+    except Exception as e:
+        # Таблицы еще нет (первый запуск): все задания опрашиваются
+        logger.warning(f"Известные статусы из {STATUS_MODEL_TABLE} не прочитаны: {e}")
+        return empty
+    finally:
+        connection.close()
+    confirmed = get_sync_state(STATUS_CONFIRMED_TABLE)
+    confirmed_ids = set(confirmed['id']) if not confirmed.empty else set()
+    known['is_final'] = known['is_final'].fillna(False).astype(bool)
+    known['confirmed'] = known['is_final'] & known['id'].isin(confirmed_ids)
+    return known
+
+
+def split_known_statuses(known: pd.DataFrame):
+    """ Делит известные задания на те, что больше не опрашиваем (финальный статус подтвержден),
+    и те, что нужно перепроверить (статус не финальный или еще не подтвержден).
+
+    Returns:
+        tuple: ({account: set(id)} пропускаемых, {account: [id]} перепроверяемых)
+    """
+    if known.empty:
+        return {}, {}
+    # Колонка может прийти с типом object, тогда known[...] выбирает колонки, а не строки
+    is_confirmed = known['confirmed'].fillna(False).astype(bool)
+    done = known.loc[is_confirmed]
+    active = known.loc[~is_confirmed]
+    skip_ids = done.groupby('account')['id'].apply(set).to_dict()
+    recheck_ids = active.groupby('account')['id'].apply(list).to_dict()
+    return skip_ids, recheck_ids
+
+
+def get_status_model_rows(order_ids: list) -> pd.DataFrame:
+    """ Строки assembly_task_status_model по заданиям (по одной на задание) —
+    для заданий, статус которых перепроверялся без повторной выдачи /api/v3/orders."""
+    if not order_ids:
+        return pd.DataFrame()
+    query = f"""
+    SELECT DISTINCT ON (id) *
+    FROM {STATUS_MODEL_TABLE}
+    WHERE id = ANY(%(ids)s)
+    ORDER BY id
+    """
+    connection = create_connection(os.getenv('NAME_2'), os.getenv('USER_2'), os.getenv('PASSWORD_2'),
+                                   os.getenv('HOST_2'), os.getenv('PORT_2'))
+    if connection is None:
+        return pd.DataFrame()
+    try:
+        return pd.read_sql(query, connection, params={'ids': [int(order_id) for order_id in order_ids]})
+    finally:
+        connection.close()
+
+
+def save_confirmed_statuses(df_statuses: pd.DataFrame, known: pd.DataFrame):
+    """ Отмечает подтвержденными задания, которые были финальными до запуска
+    и снова вернули финальный статус. Со следующего запуска они не опрашиваются."""
+    was_final = set(known.loc[known['is_final'].fillna(False).astype(bool), 'id'])
+    confirmed = df_statuses[df_statuses['wbStatus'].isin(FINAL_WB_STATUSES) & df_statuses['id'].isin(was_final)]
+    if confirmed.empty:
+        return
+    confirmed = confirmed.rename(columns={'wbStatus': 'wb_status'})[['id', 'account', 'wb_status']].copy()
+    confirmed['confirmed_at'] = datetime.now(timezone.utc).replace(tzinfo=None)
+    create_insert_table_db_sync(confirmed, STATUS_CONFIRMED_TABLE, STATUS_CONFIRMED_COLUMNS, ('id',))
+
+
+def get_assembly_date_from(overlap_minutes: int = 10) -> dict:
+    """ Возвращает {account: unix timestamp}, с которого нужно запрашивать сборочные задания
+    в инкрементальном режиме: время последнего полученного задания минус окно перекрытия.
+    Окно перекрытия страхует от заданий, появившихся в API с задержкой."""
+    state = get_sync_state(ASSEMBLY_STATE_TABLE)
+    if state.empty:
+        return {}
+    oldest = datetime.now(timezone.utc) - timedelta(days=ASSEMBLY_MAX_DAYS)
+    date_from = {}
+    for row in state.itertuples(index=False):
+        last_created_at = pd.Timestamp(row.last_created_at)
+        if last_created_at.tzinfo is None:
+            last_created_at = last_created_at.tz_localize('UTC')
+        start = max(last_created_at - timedelta(minutes=overlap_minutes), oldest)
+        date_from[row.account] = int(start.timestamp())
+    return date_from
+
+
+def save_assembly_watermarks(df_orders: pd.DataFrame):
+    """ Сохраняет по каждому кабинету время и ID самого нового полученного задания."""
+    if df_orders.empty:
+        return
+    df = df_orders[['account', 'createdAt', 'id']].copy()
+    df['createdAt'] = pd.to_datetime(df['createdAt'], utc=True)
+    newest = df.sort_values(['createdAt', 'id']).groupby('account', as_index=False).last()
+    state = pd.DataFrame({'account': newest['account'],
+                          'last_created_at': newest['createdAt'].dt.tz_localize(None),
+                          'last_id': newest['id'],
+                          'updated_at': datetime.now(timezone.utc).replace(tzinfo=None)})
+    create_insert_table_db_sync(state, ASSEMBLY_STATE_TABLE, ASSEMBLY_STATE_COLUMNS, ('account',))
+
+
+def create_assembly_info_df(all_data):
+    """ Функция принимает датафрейм (или список списков) с информацие о сборочных заданиях и возвращает 
     единый датафрейм с краткой информацией по каждому."""
-    df = pd.DataFrame([order for account_orders in all_data for order in account_orders])
+    if isinstance(all_data, pd.DataFrame):
+        df = all_data.copy()
+    else:
+        df = pd.DataFrame([order for account_orders in all_data for order in account_orders])
+    if df.empty:
+        df = pd.DataFrame(columns=ORDER_COLUMNS).astype({'id': 'int64'})
     df['createdAt'] = pd.to_datetime(df['createdAt'], utc=True)
     # Переводим в MSK (UTC+3)
     df['createdAt_msk'] = df['createdAt'].dt.tz_convert('Europe/Moscow')
@@ -177,126 +358,114 @@ async def get_tasks_status(account: str, api_token: str, payload: dict):
     Returns:
         list[dict]: Список заказов с полями 'orderId', 'supplierStatus', 'wbStatus', и 'account'.
     """
-    url = 'https://marketplace-api.wildberries.ru/api/v3/orders/status'
-    headers = {'Authorization': api_token}
+    path = '/api/v3/orders/status'
+    client = get_client()
     full_data = []
-    max_attempts = 5
 
     timeout = aiohttp.ClientTimeout(total=10)
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-        for attempt in range(max_attempts):
-            try:
-                async with session.post(url, headers=headers, json=payload) as res:
-                    # Только при 200 пытаемся парсить JSON
-                    if res.status == 200:
-                        data = await res.json()
-                        orders = data.get('orders', [])
-                        for order in orders:
-                            order['account'] = account
-                        full_data.extend(orders)
-                        print(f"[{account}] Успешно получены статусы для {len(orders)} заказов")
-                        logger.info(f"[{account}] Успешно получены статусы для {len(orders)} заказов")
-                        return full_data 
-
-                    elif res.status == 401:
-                        print(f"[{account}] Ошибка авторизации: 401. Проверьте токен.")
-                        logger.error(f"[{account}] Ошибка авторизации: 401. Проверьте токен.")
-                        return full_data
+    try:
+        async with client.post(account, 'marketplace', path, api_token, json=payload, timeout=timeout) as res:
+            # Только при 200 пытаемся парсить JSON
+            if res.status == 200:
+                data = loads(await res.read())
+                orders = data.get('orders', [])
+                for order in orders:
+                    order['account'] = account
+                full_data.extend(orders)
+                print(f"[{account}] Успешно получены статусы для {len(orders)} заказов")
+                logger.info(f"[{account}] Успешно получены статусы для {len(orders)} заказов")
+
+            elif res.status == 401:
+                print(f"[{account}] Ошибка авторизации: 401. Проверьте токен.")
+                logger.error(f"[{account}] Ошибка авторизации: 401. Проверьте токен.")
+
+            elif res.status == 400:
+                print(f"[{account}] Ошибка запроса: 400. Проверьте payload (формат: {{'orders': [...]}}).")
+                logger.error(f"[{account}] Ошибка запроса: 400. Проверьте payload (формат: {{'orders': [...]}}).")
+
+            else:
+                print(f"[{account}] Не удалось получить статусы: {res.status}")
+                logger.error(f"[{account}] Не удалось получить статусы: {res.status}")
+
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        print(f"[{account}] Ошибка соединения: {e!r}")
+        logger.error(f"[{account}] Ошибка соединения: {e!r}")
+    except Exception as e:
+        print(f"[{account}] Неизвестная ошибка: {e}")
+        logger.error(f"[{account}] Неизвестная ошибка: {e}")
+
+    return full_data
+    
 
-                    elif res.status == 400:
-                        print(f"[{account}] Ошибка запроса: 400. Проверьте payload (формат: {{'orders': [...]}}).")
-                        logger.error(f"[{account}] Ошибка запроса: 400. Проверьте payload (формат: {{'orders': [...]}}).")
-                        return full_data
+def chunked(lst, n):
+    """Разбивает список на части по n элементов."""
+    for i in range(0, len(lst), n):
+        yield lst[i:i + n]
 
-                    elif res.status == 429:
-                        print(f"[{account}] Слишком много запросов. Ждём 60 секунд...")
-                        logger.error(f"[{account}] Слишком много запросов. Ждём 60 секунд...")
-                        await asyncio.sleep(60)
-                        continue  # Повторим попытку
 
-                    elif 400 <= res.status < 500:
-                        print(f"[{account}] Клиентская ошибка: {res.status}")
-                        logger.error(f"[{account}] Клиентская ошибка: {res.status}")
-                        return full_data  # Не повторяем
+async def fetch_account_statuses(account, token, order_ids, semaphore):
+    """
+    Получает статусы сборочных заданий одного аккаунта.
 
-                    else:
-                        print(f"[{account}] Серверная ошибка: {res.status}. Попытка {attempt + 1} из {max_attempts}")
-                        logger.error(f"[{account}] Серверная ошибка: {res.status}. Попытка {attempt + 1} из {max_attempts}")
-                        await asyncio.sleep(1)
-
-            except (aiohttp.ClientConnectorError, aiohttp.ServerDisconnectedError) as e:
-                print(f"[{account}] Ошибка подключения: {e}")
-                logger.error(f"[{account}] Ошибка подключения: {e}")
-            except aiohttp.ClientTimeout:
-                print(f"[{account}] Таймаут соединения")
-                logger.error(f"[{account}] Таймаут соединения")
-            except asyncio.TimeoutError:
-                print(f"[{account}] Таймаут asyncio")
-                logger.error(f"[{account}] Таймаут asyncio")
-            except Exception as e:
-                print(f"[{account}] Неизвестная ошибка: {e}")
-                logger.error(f"[{account}] Неизвестная ошибка: {e}")
+    Пачки по 1000 ID отправляются одновременно, частоту запросов ограничивает
+    лимитер клиента, а семафор кабинета не дает держать в полете больше запросов,
+    чем всплеск лимита кабинета. Результаты возвращаются в порядке пачек.
 
-            # Задержка перед повторной попыткой
-            await asyncio.sleep(1)
+    Args:
+        account (str): Название аккаунта.
+        token (str): API-токен.
+        order_ids (list): ID сборочных заданий.
+        semaphore (asyncio.Semaphore): Семафор кабинета, общий для всех вызовов
+            по этому кабинету.
 
-        # Если все попытки провалились
-        print(f"[{account}] Не удалось получить данные после {max_attempts} попыток.")
-        logger.error(f"[{account}] Не удалось получить данные после {max_attempts} попыток.")
-        return full_data
-    
+    Returns:
+        list[dict]: Статусы сборочных заданий аккаунта.
+    """
+    async def fetch_chunk(chunk):
+        async with semaphore:
+            try:
+                return await get_tasks_status(account, token, {"orders": chunk})
+            except Exception as e:
+                print(f"[{account}] Ошибка при получении статусов: {e}")
+                logger.error(f"[{account}] Ошибка при получении статусов: {e}")
+                return []
 
-def chunked(lst, n):
-    """Разбивает список на части по n элементов."""
-    for i in range(0, len(lst), n):
-        yield lst[i:i + n]
+    results = await asyncio.gather(*(fetch_chunk(chunk) for chunk in chunked(order_ids, 1000)))  # по 1000 ID
+    return [status for chunk_statuses in results for status in chunk_statuses]
 
 
-async def fetch_all_statuses(assembly_dict, tokens_dict, max_concurrent=8):
+async def fetch_all_statuses(assembly_dict, tokens_dict, max_concurrent=None):
     """
     Для каждого аккаунта получает статусы сборочных заданий.
 
     Args:
         assembly_dict (dict): {account: [orderId, ...]}
         tokens_dict (dict): {account: api_token}
-        max_concurrent (int): Максимум одновременных запросов
+        max_concurrent (int): Максимум одновременных запросов внутри одного аккаунта
 
     Returns:
         pd.DataFrame: Все статусы со всеми аккаунтами
     """
-    semaphore = asyncio.Semaphore(max_concurrent)  # Ограничиваем параллельность
-    all_statuses = []
-
-    async def fetch_for_account(account, token, order_ids):
-        async with semaphore:
-            for chunk in chunked(order_ids, 1000):  # по 1000 ID
-                payload = {"orders": chunk}
-                try:
-                    statuses = await get_tasks_status(account, token, payload)
-                    if statuses:
-                        all_statuses.extend(statuses)
-                except Exception as e:
-                    print(f"[{account}] Ошибка при получении статусов: {e}")
-                    logger.error(f"[{account}] Ошибка при получении статусов: {e}")
-                # Лимит: 200 мс между запросами
-                await asyncio.sleep(0.2)
-
     # Создаём задачи для всех аккаунтов
     tasks = []
     for account, token in tokens_dict.items():
         order_ids = assembly_dict.get(account, [])
         if order_ids:
-            task = fetch_for_account(account, token, order_ids)
+            semaphore = asyncio.Semaphore(max_concurrent or ENDPOINT_LIMITS['marketplace'][2])
+            task = fetch_account_statuses(account, token, order_ids, semaphore)
             tasks.append(task)
         else:
             print(f"[{account}] Нет ID для получения статусов")
             logger.info(f"[{account}] Нет ID для получения статусов")
 
     # Запускаем все задачи
-    await asyncio.gather(*tasks)
+    try:
+        results = await asyncio.gather(*tasks)
+    finally:
+        await close_client()
 
     # Возвращаем DataFrame
-    return pd.DataFrame(all_statuses)
+    return pd.DataFrame([status for account_statuses in results for status in account_statuses])
 
 
 def convert_price(price) -> float:
@@ -1,6 +1,7 @@
 import asyncio
 import pandas as pd
 from utils_warehouse import load_api_tokens, re_shipment_info_get, create_insert_table_db_async
+from wb_client import close_client
 from datetime import datetime
 
 
@@ -11,7 +12,10 @@ async def main():
     for account, api_token in load_api_tokens().items():
         task = re_shipment_info_get(account, api_token, today)
         tasks.append(task)    
-    all_data = await asyncio.gather(*tasks)
+    try:
+        all_data = await asyncio.gather(*tasks)
+    finally:
+        await close_client()
     processed_data = []
     for i in all_data:
         orders = i['orders']
@@ -1,10 +1,15 @@
 import asyncio
-from supply_data_utils import main
+import os
+from supply_data_utils import main, save_supplies_cursors
 from utils_warehouse import create_insert_table_db_sync
 
+# Режим синхронизации: full — все поставки с начала пагинации,
+# incremental — только новые страницы и перепроверка незакрытых поставок
+SYNC_MODE = os.getenv('SUPPLY_SYNC_MODE', 'full')
+
 if __name__ == '__main__':
 
-    final_df = asyncio.run(main())
+    final_df = asyncio.run(main(incremental=SYNC_MODE == 'incremental'))
     # Подготовим данные для вставки в БД
     final_df = final_df.rename(columns={'closedAt': 'closed_at',
                                         'scanDt': 'scan_dt',
@@ -29,4 +34,6 @@ if __name__ == '__main__':
 
     # Ключевые колонки для UPSERT
     key_columns = ('id',)  # id как первичный ключ
-    create_insert_table_db_sync(final_df, table_name, columns_type, key_columns)
\ No newline at end of file
+    create_insert_table_db_sync(final_df, table_name, columns_type, key_columns)
+    # Курсор сохраняем только после успешной загрузки, чтобы не пропустить поставки
+    save_supplies_cursors(final_df)
\ No newline at end of file
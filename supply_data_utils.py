@@ -1,114 +1,182 @@
 import asyncio
 import aiohttp
-from utils_warehouse import load_api_tokens, create_connection, create_insert_table_db_sync
+from utils_warehouse import load_api_tokens, create_connection, create_insert_table_db_sync, get_sync_state
+from wb_client import get_client, close_client
+from wb_ingest import ColumnBuffer
 import pandas as pd
 import os
+from datetime import datetime
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Таблица с курсором пагинации /api/v3/supplies по каждому кабинету
+SUPPLIES_STATE_TABLE = 'supplies_sync_state'
+SUPPLIES_STATE_COLUMNS = {
+    'account': 'VARCHAR(255)',
+    'next_cursor': 'BIGINT',
+    'updated_at': 'TIMESTAMP',
+}
 
+# Поставки, заказы которых уже загружены в supplies_and_orders, и состав их заказов.
+# Закрытая поставка больше не меняется, поэтому после загрузки ее заказы не перезапрашиваются
+SUPPLY_ORDERS_SYNC_TABLE = 'supplies_orders_sync'
+SUPPLY_ORDERS_SYNC_COLUMNS = {
+    'supply_id': 'VARCHAR(255)',
+    'account': 'VARCHAR(255)',
+    'done': 'BOOLEAN',
+    'order_count': 'INTEGER',
+    'order_ids': 'TEXT',
+    'synced_at': 'TIMESTAMP',
+}
 
-async def get_supplies_list(account, api_token):
-    """Функция получает данные обо всех поставках по системе ФБС"""
+
+async def get_supplies_list(account, api_token, next_page=0):
+    """Функция получает данные обо всех поставках по системе ФБС.
+    next_page — курсор, с которого начинать пагинацию (0 — с самого начала).
+    В колонку page_next записывается курсор страницы, с которой пришла поставка."""
     print(f"🟡 Начало получения поставок для {account}")
-    # Список поставок
-    supplies_list_api = []
+    # Поставки, разложенные по колонкам
+    supplies_list_api = ColumnBuffer()
     # Адрес запроса
-    url = 'https://marketplace-api.wildberries.ru/api/v3/supplies'
-    headers = {'Authorization': api_token}
-    # Задержка при 429 ошибке
-    delay = 0.3
+    path = '/api/v3/supplies'
+    # Общий клиент с пулом соединений
+    client = get_client()
     # Максимально количество значений за один запрос
     limit = 1000
-    # Параметр пагинации
-    next_page = 0
-    # Количество попыток получить данные по запросу
-    max_attempts = 10
-    # Начальное кол-во попыток
-    attempt = 0
-    # Создание сессии для асинхронного http запроса
-    async with aiohttp.ClientSession(headers=headers) as session:
-        # Цикл из 10 попыток для получения данных
-        while attempt != max_attempts:
-            # Параметры запроса
-            params = {'limit' : limit,
-                    'next' : next_page}
-            try:
-                # Запуск сессии
-                async with session.get(url, params=params) as res:
-                    if res.status == 200:
-                        # Сбрасываем счетчик при успешном запросе
-                        attempt = 0
-                        # Асинхронный http запрос
-                        data = await res.json()
-                        # Сохраняем результат запроса в переменную, в этом случае нам возвращается список
-                        supplies = data['supplies']
-                        # Для каждой поставки сохраняю данные об ЛК
-                        for supply in supplies:
-                            supply['account'] = account
-                        # Добавляю расширенные данные в список
-                        supplies_list_api.extend(supplies)
-                        # В случае, если данные о поставках закончились или больше нет данных для дальнейшей пагинации, запросы прекращаются
-                        if not supplies or data['next'] == 0:
-                            break
-                        # Если данные есть, то пагинация продолжается
-                        else:
-                            next_page = data['next']
-                            # Задержка в запросе по требованию АПИ документации
-                            await asyncio.sleep(delay)
-                        print(f"Получены данные о {len(supplies_list_api)} поставках")
-                    # Обработка неправильного запроса
-                    elif res.status == 400:
-                        # Создаем запрос
-                        error_data = await res.json()
-                        # Сохраняем в переменную. Пытаемся получить данные по ключу message. Если такого ключа нет, выведем 'Неправильный запрос'
-                        error_detail = error_data.get('message', 'Неправильный запрос')
-                        print(f"Ошибка 400 для аккаунта {account}: {error_detail}")
-                        return None 
-                    # Обработка ошибки авторизации данных 
-                    elif res.status == 401:
-                        print(f"Ошибка 401 для аккаунта {account}: Не авторизован")
-                        return None
-                    # Обработка запрета на получение данных
-                    elif res.status == 403:
-                        # Создаем запрос
-                        error_data = await res.json()
-                        # Сохраняем в переменную. Пытаемся получить данные по ключу message. Если такого ключа нет, выведем 'Неправильный запрос'
-                        error_detail = error_data.get('message', 'Доступ запрещен')
-                        print(f"Ошибка 403 для аккаунта {account}: {error_detail}")
-                        return None
-                    # Обработка лимита запросов
-                    elif res.status == 429:
-                        error_data = await res.json()
-                        error_detail = error_data.get('detail', 'Слишком много запросов')
-                        print(f"Ошибка 429 для аккаунта {account}: {error_detail}")
-                        print(f"Лимит: 300 запросов в 1 минуту на аккаунт. ждем {delay}")
-                        # Ждем перед повторной попыткой
-                        await asyncio.sleep(delay) 
-                        attempt += 1
-                        continue
+    while True:
+        # Параметры запроса
+        params = {'limit' : limit,
+                'next' : next_page}
+        try:
+            # Запуск сессии
+            async with client.get(account, 'marketplace', path, api_token, params=params) as res:
+                if res.status == 200:
+                    # Декодируем страницу и сразу раскладываем поставки по колонкам,
+                    # ЛК и курсор страницы добавляются общими колонками
+                    data = supplies_list_api.add_page(await res.read(), 'supplies',
+                                                      account=account, page_next=next_page)
+                    supplies = data['supplies']
+                    # В случае, если данные о поставках закончились или больше нет данных для дальнейшей пагинации, запросы прекращаются
+                    if not supplies or data['next'] == 0:
+                        break
+                    # Если данные есть, то пагинация продолжается.
+                    # Лимит 300 запросов в минуту на аккаунт соблюдает ограничитель клиента
                     else:
-                        print('Нет данных по поставкам')
-                        attempt += 1
-            except aiohttp.ClientError as err:
-                print(f'Сетевая ошибка {err}')
-            except Exception as e:
-                print(f'Неожиданная ошибка {e}')
-            if attempt == max_attempts:
-                break
-    if supplies_list_api:
-        df = pd.DataFrame(supplies_list_api)
+                        next_page = data['next']
+                    print(f"Получены данные о {len(supplies_list_api)} поставках")
+                # Обработка неправильного запроса
+                elif res.status == 400:
+                    # Создаем запрос
+                    error_data = await res.json()
+                    # Сохраняем в переменную. Пытаемся получить данные по ключу message. Если такого ключа нет, выведем 'Неправильный запрос'
+                    error_detail = error_data.get('message', 'Неправильный запрос')
+                    print(f"Ошибка 400 для аккаунта {account}: {error_detail}")
+                    return None 
+                # Обработка ошибки авторизации данных 
+                elif res.status == 401:
+                    print(f"Ошибка 401 для аккаунта {account}: Не авторизован")
+                    return None
+                # Обработка запрета на получение данных
+                elif res.status == 403:
+                    # Создаем запрос
+                    error_data = await res.json()
+                    # Сохраняем в переменную. Пытаемся получить данные по ключу message. Если такого ключа нет, выведем 'Неправильный запрос'
+                    error_detail = error_data.get('message', 'Доступ запрещен')
+                    print(f"Ошибка 403 для аккаунта {account}: {error_detail}")
+                    return None
+                # Лимит запросов или ошибка сервера
+                else:
+                    print(f"Ошибка {res.status} для аккаунта {account}: не удалось получить поставки")
+                    break
+        except aiohttp.ClientError as err:
+            print(f'Сетевая ошибка {err}')
+            break
+        except Exception as e:
+            print(f'Неожиданная ошибка {e}')
+            break
+    if len(supplies_list_api):
+        df = supplies_list_api.to_frame()
         print(f"🟢 Завершено получение поставок для {account}")
         return df
     else:
         print('Не удалось получить документы')
         return None
     
-async def main():
+async def get_supply_info(account, api_token, supply_id):
+    """Получает текущее состояние одной поставки (/api/v3/supplies/{supplyId})."""
+    client = get_client()
+    try:
+        async with client.get(account, 'marketplace', f'/api/v3/supplies/{supply_id}', api_token) as res:
+            if res.status == 200:
+                supply = await res.json()
+                supply['account'] = account
+                return supply
+            print(f"Ошибка {res.status} при получении поставки {supply_id} для аккаунта {account}")
+    except aiohttp.ClientError as err:
+        print(f'Сетевая ошибка {err}')
+    return None
+
+
+def get_open_supplies(db_name = os.getenv('NAME_2'), db_user = os.getenv('USER_2'), db_password = os.getenv('PASSWORD_2'), db_host = os.getenv('HOST_2'), db_port = os.getenv('PORT_2')):
+    """Словарь аккаунт : список незакрытых поставок (done = false) из supplies_data"""
+    query = """
+    SELECT id, account
+    FROM supplies_data
+    WHERE done IS NOT TRUE
+    """
+    connection = create_connection(db_name, db_user, db_password, db_host, db_port)
+    df_db = pd.read_sql(query, connection)
+    connection.close()
+    return df_db.groupby('account')['id'].apply(list).to_dict()
+
+
+def get_supplies_cursors():
+    """Словарь аккаунт : курсор, с которого продолжать пагинацию поставок"""
+    state = get_sync_state(SUPPLIES_STATE_TABLE)
+    if state.empty:
+        return {}
+    return dict(zip(state['account'], state['next_cursor'].astype(int)))
+
+
+def save_supplies_cursors(df):
+    """Сохраняет курсор последней полученной страницы по каждому аккаунту.
+    Последняя страница при следующем запуске запрашивается повторно:
+    в нее могли добавиться новые поставки."""
+    cursors = df.dropna(subset=['page_next']).groupby('account')['page_next'].max()
+    if cursors.empty:
+        return
+    state = pd.DataFrame({'account': cursors.index,
+                          'next_cursor': cursors.astype(int).values,
+                          'updated_at': datetime.now()})
+    create_insert_table_db_sync(state, SUPPLIES_STATE_TABLE, SUPPLIES_STATE_COLUMNS, ('account',))
+
+
+async def main(incremental=False):
+    """Получает поставки по всем аккаунтам.
+    В инкрементальном режиме пагинация продолжается с сохраненного курсора,
+    а незакрытые поставки из БД перезапрашиваются по одной, чтобы обновить их состояние."""
+    tokens = load_api_tokens()
+    cursors = get_supplies_cursors() if incremental else {}
     # Создаем задачник для получения данных о поставках по всем аккаунтам асинхронно
-    tasks = [get_supplies_list(account, api_token) for account, api_token in load_api_tokens().items()]
-    res = await asyncio.gather(*tasks)
+    tasks = [get_supplies_list(account, api_token, cursors.get(account, 0)) for account, api_token in tokens.items()]
+    try:
+        res = await asyncio.gather(*tasks)
+        if incremental:
+            listed = pd.concat(res) if any(df is not None for df in res) else pd.DataFrame(columns=['id'])
+            listed_ids = set(listed['id'])
+            open_supplies = get_open_supplies()
+            # Незакрытые поставки, которые не попали в новые страницы
+            info_tasks = [get_supply_info(account, api_token, supply_id)
+                          for account, api_token in tokens.items()
+                          for supply_id in open_supplies.get(account, [])
+                          if supply_id not in listed_ids]
+            print(f"Перепроверяем {len(info_tasks)} незакрытых поставок")
+            rechecked = [supply for supply in await asyncio.gather(*info_tasks) if supply]
+            if rechecked:
+                res.append(pd.DataFrame(rechecked))
+    finally:
+        await close_client()
     return pd.concat(res)
 
 
@@ -131,76 +199,104 @@ def get_dict_supply(days = 11, db_name = os.getenv('NAME_2'), db_user = os.geten
         return df_db_dict
 
 
+def get_supplies_to_sync(days = 11, db_name = os.getenv('NAME_2'), db_user = os.getenv('USER_2'), db_password = os.getenv('PASSWORD_2'), db_host = os.getenv('HOST_2'), db_port = os.getenv('PORT_2')):
+    """Поставки за последние days дней, заказы которых нужно запросить:
+    незакрытые, а также закрытые, заказы которых еще не загружались после закрытия.
+    Возвращает датафрейм id, account, done."""
+    query = f"""
+    SELECT id, account, done
+    FROM supplies_data
+    WHERE created_at > CURRENT_DATE - INTERVAL '{days} days'
+    """
+    connection = create_connection(db_name, db_user, db_password, db_host, db_port)
+    df_db = pd.read_sql(query, connection)
+    connection.close()
+    df_db['done'] = df_db['done'].fillna(False).astype(bool)
+
+    synced = get_sync_state(SUPPLY_ORDERS_SYNC_TABLE)
+    if not synced.empty:
+        # Закрытые поставки, загруженные уже в закрытом состоянии
+        closed_synced = set(synced.loc[synced['done'].fillna(False).astype(bool), 'supply_id'])
+        df_db = df_db[~(df_db['done'] & df_db['id'].isin(closed_synced))]
+    print(f"Поставок для запроса заказов: {len(df_db)}, из них закрытых: {int(df_db['done'].sum())}")
+    return df_db
+
+
+def save_supplies_orders_sync(supplies, orders_df, fetched):
+    """Отмечает поставки, заказы которых загружены, вместе с их состоянием на момент загрузки
+    и id их заказов. Поставка без заказов тоже отмечается, если ее запрос прошел успешно.
+
+    Args:
+        supplies: поставки из get_supplies_to_sync
+        orders_df: загруженные заказы поставок
+        fetched: id поставок, заказы которых получены
+    """
+    synced = supplies[supplies['id'].isin(fetched)].rename(columns={'id': 'supply_id'})
+    if synced.empty:
+        return
+    synced = synced[['supply_id', 'account', 'done']].copy()
+    if orders_df.empty:
+        order_ids = pd.Series(dtype=object)
+    else:
+        order_ids = orders_df.groupby('supply_id')['id'].agg(lambda ids: ','.join(map(str, sorted(ids))))
+    synced['order_ids'] = synced['supply_id'].map(order_ids).fillna('')
+    synced['order_count'] = synced['order_ids'].map(lambda ids: len(ids.split(',')) if ids else 0)
+    synced['synced_at'] = datetime.now()
+    create_insert_table_db_sync(synced, SUPPLY_ORDERS_SYNC_TABLE, SUPPLY_ORDERS_SYNC_COLUMNS, ('supply_id',))
+
+
 # __________________________________________________________________________________________________________________________________________________________________#
 # Запрашиваем данные о содержании поставок на ВБ
 # __________________________________________________________________________________________________________________________________________________________________#
-async def get_orders_in_supply(account, api_token, supply_id):
-    url = f'https://marketplace-api.wildberries.ru/api/v3/supplies/{supply_id}/orders'
-    orders_list_api = []
-    headers = {'Authorization': api_token}
-    # Задержка при 429 ошибке
-    delay = 0.3
-    max_attempts = 10
-    # Начальное кол-во попыток
-    attempt = 0
-    # Создание сессии для асинхронного http запроса
-    async with aiohttp.ClientSession(headers=headers) as session:
-        if attempt != max_attempts:
-            try:
-                # Запуск сессии
-                async with session.get(url) as res:
-                    if res.status == 200:
-                        # Сбрасываем счетчик при успешном запросе
-                        attempt = 0
-                        # Асинхронный http запрос
-                        data = await res.json()
-                        # Сохраняем результат запроса в переменную, в этом случае нам возвращается список
-                        orders = data['orders']
-                        # Для каждой поставки сохраняю данные об ЛК
-                        for order in orders:
-                            order['supply_id'] = supply_id
-                            order['account'] = account
-                        # Добавляю расширенные данные в список
-                        orders_list_api.extend(orders)
-                        print(f"Получены данные о {len(orders_list_api)} заказах")
-                    # Обработка неправильного запроса
-                    elif res.status == 400:
-                        # Создаем запрос
-                        error_data = await res.json()
-                        # Сохраняем в переменную. Пытаемся получить данные по ключу message. Если такого ключа нет, выведем 'Неправильный запрос'
-                        error_detail = error_data.get('message', 'Неправильный запрос')
-                        print(f"Ошибка 400 для аккаунта {account}: {error_detail}")
-                        return None 
-                    # Обработка ошибки авторизации данных 
-                    elif res.status == 401:
-                        print(f"Ошибка 401 для аккаунта {account}: Не авторизован")
-                        return None
-                    # Обработка запрета на получение данных
-                    elif res.status == 403:
-                        # Создаем запрос
-                        error_data = await res.json()
-                        # Сохраняем в переменную. Пытаемся получить данные по ключу message. Если такого ключа нет, выведем 'Неправильный запрос'
-                        error_detail = error_data.get('message', 'Доступ запрещен')
-                        print(f"Ошибка 403 для аккаунта {account}: {error_detail}")
-                        return None
-                    # Обработка лимита запросов
-                    elif res.status == 429:
-                        error_data = await res.json()
-                        error_detail = error_data.get('detail', 'Слишком много запросов')
-                        print(f"Ошибка 429 для аккаунта {account}: {error_detail}")
-                        print(f"Лимит: 300 запросов в 1 минуту на аккаунт. ждем {delay}")
-                        # Ждем перед повторной попыткой
-                        await asyncio.sleep(delay) 
-                        attempt += 1
-                    else:
-                        print('Нет данных по поставкам')
-                        attempt += 1
-            except aiohttp.ClientError as err:
-                print(f'Сетевая ошибка {err}')
-            except Exception as e:
-                print(f'Неожиданная ошибка {e}')
-    if orders_list_api:
-        df = pd.DataFrame(orders_list_api)
+async def get_orders_in_supply(account, api_token, supply_id, buffer=None):
+    """Получает заказы поставки. Если передан общий ColumnBuffer, заказы дописываются
+    в него и возвращается их количество (None, если заказы получить не удалось),
+    иначе возвращается датафрейм."""
+    path = f'/api/v3/supplies/{supply_id}/orders'
+    orders_list_api = buffer if buffer is not None else ColumnBuffer()
+    # Буфер общий для одновременных запросов, поэтому считаем заказы этого ответа
+    received = None
+    client = get_client()
+    try:
+        # Запуск сессии
+        async with client.get(account, 'marketplace', path, api_token) as res:
+            if res.status == 200:
+                # Декодируем ответ и раскладываем заказы по колонкам вместе с поставкой и ЛК
+                data = orders_list_api.add_page(await res.read(), 'orders',
+                                                supply_id=supply_id, account=account)
+                received = len(data.get('orders') or [])
+                print(f"Получены данные о {received} заказах")
+            # Обработка неправильного запроса
+            elif res.status == 400:
+                # Создаем запрос
+                error_data = await res.json()
+                # Сохраняем в переменную. Пытаемся получить данные по ключу message. Если такого ключа нет, выведем 'Неправильный запрос'
+                error_detail = error_data.get('message', 'Неправильный запрос')
+                print(f"Ошибка 400 для аккаунта {account}: {error_detail}")
+                return None 
+            # Обработка ошибки авторизации данных 
+            elif res.status == 401:
+                print(f"Ошибка 401 для аккаунта {account}: Не авторизован")
+                return None
+            # Обработка запрета на получение данных
+            elif res.status == 403:
+                # Создаем запрос
+                error_data = await res.json()
+                # Сохраняем в переменную. Пытаемся получить данные по ключу message. Если такого ключа нет, выведем 'Неправильный запрос'
+                error_detail = error_data.get('message', 'Доступ запрещен')
+                print(f"Ошибка 403 для аккаунта {account}: {error_detail}")
+                return None
+            # Лимит запросов или ошибка сервера
+            else:
+                print(f"Ошибка {res.status} для аккаунта {account}: не удалось получить заказы поставки {supply_id}")
+    except aiohttp.ClientError as err:
+        print(f'Сетевая ошибка {err}')
+    except Exception as e:
+        print(f'Неожиданная ошибка {e}')
+    if buffer is not None:
+        return received
+    if len(orders_list_api):
+        df = orders_list_api.to_frame()
         print(f"🟢 Завершено получение поставок для {account}")
         return df
     else:
@@ -209,17 +305,16 @@ async def get_orders_in_supply(account, api_token, supply_id):
     
 
 async def fetch_supply_and_orders(dict_supply):
+    """Заказы поставок всех кабинетов. id поставок, заказы которых получены
+    (в том числе пустые), возвращаются в attrs['fetched_supplies'] датафрейма."""
     tokens = load_api_tokens()
-    all_orders = []
-    
-    # Семафор для ограничения одновременных запросов
-    semaphore = asyncio.Semaphore(10)  # Максимум 10 одновременных запросов
-    
-    async def bounded_get_orders(account, api_token, supply_id):
-        async with semaphore:
-            return await get_orders_in_supply(account, api_token, supply_id)
+    # Заказы всех поставок собираются в один колоночный буфер
+    all_orders = ColumnBuffer()
     
+    # Частоту запросов по каждому кабинету ограничивает клиент,
+    # поэтому поставки разных кабинетов запрашиваются одновременно
     tasks = []
+    task_supplies = []
     
     # Создаем задачи для каждого аккаунта и каждой поставки
     for account, api_token in tokens.items():
@@ -228,32 +323,50 @@ async def fetch_supply_and_orders(dict_supply):
             print(f"Аккаунт {account}: обрабатываем {len(supply_ids)} поставок")
             
             for supply_id in supply_ids:
-                tasks.append(bounded_get_orders(account, api_token, supply_id))
+                tasks.append(get_orders_in_supply(account, api_token, supply_id, all_orders))
+                task_supplies.append(supply_id)
     
     # Выполняем все задачи с ограничением
     print(f"Всего задач: {len(tasks)}")
-    results = await asyncio.gather(*tasks, return_exceptions=True)
+    try:
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        await close_client()
     
     # Обрабатываем результаты
-    for result in results:
+    fetched = set()
+    for supply_id, result in zip(task_supplies, results):
         if isinstance(result, Exception):
             print(f"Ошибка в задаче: {result}")
-        elif isinstance(result, pd.DataFrame) and not result.empty:
-            all_orders.extend(result.to_dict('records'))
+        elif result is not None:
+            fetched.add(supply_id)
     
     # Создаем DataFrame
-    if all_orders:
-        final_df = pd.DataFrame(all_orders)
+    if len(all_orders):
+        final_df = all_orders.to_frame()
         print(f"✅ Итого получено {len(final_df)} заказов из всех поставок")
-        return final_df
     else:
         print("❌ Не удалось получить ни одного заказа")
-        return pd.DataFrame()
+        final_df = pd.DataFrame()
+    final_df.attrs['fetched_supplies'] = fetched
+    return final_df
     
 
-async def main_get_supply_and_orders():
-    dict_supply = get_dict_supply()
+async def main_get_supply_and_orders(skip_synced=True):
+    """Загружает заказы поставок в supplies_and_orders.
+    При skip_synced заказы закрытых и уже загруженных поставок не перезапрашиваются."""
+    if skip_synced:
+        supplies = get_supplies_to_sync()
+        dict_supply = supplies.groupby('account')['id'].apply(list).to_dict()
+    else:
+        dict_supply = get_dict_supply()
     final_df = await fetch_supply_and_orders(dict_supply)
+    fetched = final_df.attrs['fetched_supplies']
+    if final_df.empty:
+        # Поставки без заказов тоже отмечаются, чтобы закрытые не запрашивались снова
+        if skip_synced:
+            save_supplies_orders_sync(supplies, final_df, fetched)
+        return
     final_df = final_df.rename(columns={'scanPrice' : 'scan_price',
                                         'orderUid' : 'order_uid',
                                         'colorCode' : 'color_code',
@@ -315,4 +428,6 @@ async def main_get_supply_and_orders():
 
     # Ключевые колонки для UPSERT
     key_columns = ('id',)
-    create_insert_table_db_sync(final_df, table_name, columns_type, key_columns)
\ No newline at end of file
+    create_insert_table_db_sync(final_df, table_name, columns_type, key_columns)
+    if skip_synced:
+        save_supplies_orders_sync(supplies, final_df, fetched)
\ No newline at end of file
@@ -1,11 +1,7 @@
 import requests
 import pandas as pd
 import json
-from datetime import datetime, timedelta
-import base64
-import io
-import zipfile
-from openpyxl import load_workbook
+from datetime import datetime
 import re
 import os
 import logging
@@ -20,6 +16,7 @@ import os
 from dotenv import load_dotenv
 import psycopg2
 from psycopg2 import OperationalError
+from wb_client import get_client
 
 # Функция для загрузки API токенов из файла tokens.json
 def load_api_tokens():
@@ -28,6 +25,8 @@ def load_api_tokens():
     CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
     file_path = os.path.join(CURRENT_DIR, "tokens.json")
     # file_path = 'tokens.json'
+    # Другой файл токенов можно указать в WB_TOKENS_FILE (например, для тестового сервера)
+    file_path = os.getenv('WB_TOKENS_FILE') or file_path
     
     if not os.path.exists(file_path):
         raise FileNotFoundError(f"Файл с токенами не найден: {file_path}")
@@ -66,306 +65,6 @@ def doc_categories():
         return None
 
 
-# beginTime = (datetime.now()-timedelta(days=10)).strftime('%Y-%m-%d')
-# endTime = (datetime.now()-timedelta(days=1)).strftime('%Y-%m-%d')   
-
-def documents_list(token, title):
-    """Метод предоставляет список документов продавца. 
-    Вы можете получить один или несколько документов из полученного списка."""
-    
-    url = 'https://documents-api.wildberries.ru/api/v1/documents/list'
-    headers = {'Authorization' : token}
-    beginTime = (datetime.now()-timedelta(days=10)).strftime('%Y-%m-%d')
-    endTime = (datetime.now()-timedelta(days=0)).strftime('%Y-%m-%d') 
-    params = {'beginTime' : beginTime,
-              'endTime' : endTime,
-              'category': title}
-    
-    try:
-        res = requests.get(url, headers=headers, params=params)
-        if res.status_code == 200:
-            data = res.json()
-            df = pd.DataFrame(data['data']['documents'])
-            return df
-        else:
-            print('Отсутствует список документов')
-    except requests.exceptions.RequestException as e:
-        print(f'"Ошибка запроса:", {e}')
-        return None
-    # для отлавливания других ошибок
-    except Exception as e:
-        print(f'Ошибка не связанная с запросом {e}')
-        return None
-    
-# Получаем перечень доступных для скачивания документов
-def create_acceptance_act():
-    """Функция обрабатывает данные полученные в documents_list
-    для каждого кабинета на ВБ"""
-    
-    with open('tokens.json', 'r', encoding='utf-8') as file:
-        tokens = json.load(file)
-
-    doc_list_data = []
-    for account, token in tokens.items():
-        # Получаем список документов для ФБО
-        df = pd.DataFrame(documents_list(token, 'act-income'))
-        df['account'] = account
-        doc_list_data.append(df)
-        # Получаем список документов для ФБC
-        df = pd.DataFrame(documents_list(token, 'act-income-mp'))
-        df['account'] = account
-        doc_list_data.append(df)
-
-    documents_list_df = pd.concat(doc_list_data)
-    return documents_list_df
-
-def act_income_docs_list(download_all_acts, account):
-    """Функция позволяет обрабатывать акты-приема передачи, 
-        полученные от ВБ при приеме товара для продаж по системе ФБО"""
-    acts_list = []
-    # Первый уровень — внешний архив
-    zip_data = io.BytesIO(download_all_acts)
-    with zipfile.ZipFile(zip_data, 'r') as full_zip:
-        acts_income_zip = full_zip.namelist()
-        for act in acts_income_zip:
-            with full_zip.open(act) as nested_zip_file:
-                # Читаем содержимое вложенного ZIP как байты
-                nested_zip_bytes = nested_zip_file.read()
-                # Загружаем его в память как новый ZIP-объект
-                nested_zip = zipfile.ZipFile(io.BytesIO(nested_zip_bytes))
-                # Получаем список файлов внутри вложенного ZIP
-                print("Файлы внутри вложенного ZIP:")
-                for inner_file in nested_zip.namelist():
-                    print(f"  - {inner_file}")
-                    # Если нужно, обрабатываем, например, ищем .xlsx
-                    if inner_file.endswith('.xlsx'):
-                        with nested_zip.open(inner_file) as xlsx_file:
-                            # df = pd.read_excel(xlsx_file)
-                            # print(f"Первые строки Excel-файла {inner_file}:")
-                            # print(df.head())
-                            df_act = pd.read_excel(xlsx_file, header=None)
-                            # Получаем строки 8 и 9 как заголовки
-                            header_1 = df_act.iloc[8].fillna('')
-                            header_2 = df_act.iloc[9].fillna('')
-
-                            # Формируем комбинированные заголовки
-                            multi_header = [
-                                f"{h1.strip()} - {h2.strip()}" if h2.strip() else h1.strip()
-                                for h1, h2 in zip(header_1, header_2)
-                            ]
-
-                            print(f"Количество колонок в df: {df_act.shape[1]}")
-                            print(f"Количество заголовков: {len(multi_header)}")
-                            
-                            # Загружаем данные с 12 строки
-                            df = df_act.iloc[12:].copy()
-                            df.columns = multi_header
-                            df = df.dropna(how='all').reset_index(drop=True)
-                            df['Документ'] = act
-                            # df['Номер_документа'] = df['Документ'].str.extract(r'act-income-(\d+)\.zip')
-                            df['Номер_документа'] = df['Документ'].str.extract(r'(\d+)\.zip')[0]        
-                            df['account'] = account
-                            acts_list.append(df)
-                            print(f'Данные по {act} добавлены в список')
-    return acts_list
-
-
-def download_all_acts(payload, account):
-    """Загружает все акты по ФБО"""
-    with open('tokens.json', 'r', encoding='utf-8') as file:
-        tokens = json.load(file)
-   
-    url = 'https://documents-api.wildberries.ru/api/v1/documents/download/all'
-    headers = {'Authorization': tokens[account]}
-
-    try:
-        res = requests.post(url, json=payload, headers=headers)
-        if res.status_code == 200:
-            data = res.json()
-            document_data = data['data']['document']
-            # Извлекаем зипы документов
-            decoded_data = base64.b64decode(document_data)
-            # Обрабатываем полученные документы
-            decoded_acts = act_income_docs_list(decoded_data, account)
-            return decoded_acts
-        else:
-            print('Отсутствует список документов')
-    except requests.exceptions.RequestException as e:
-        print(f'"Ошибка запроса:", {e}')
-        return None
-    # для отлавливания других ошибок
-    except Exception as e:
-        print(f'Ошибка не связанная с запросом {e}')
-        return None
-    
-def get_act_incomes():
-    """Объединяем акты приема-передачи по ФБО
-    со всех кабинетов в единный список,
-    затем создаем из него единый датафрейм"""
-    # Сюда помещаем все акты
-    decoded_data_list = []
-    act_incomes_dict = create_acceptance_act().groupby('account')['serviceName'].apply(list).to_dict()
-    # Проходим циклом по каждому списку документов, для каждого аккаунта
-    for account in act_incomes_dict:
-        print(f'Получаем данные для {account}')
-        
-        payload = {
-            "params": [
-                {
-                    "extension": "xlsx",
-                    "serviceName": doc_id
-                } for doc_id in act_incomes_dict[account]
-            ]
-        }
-        print(payload)
-        # Получаем и обрабатываем списки документов
-        decoded_data_list.append(download_all_acts(payload, account))
-    # Создаем список датафреймов для последующей обработки
-    all_dfs = []
-    # Складываем в список выше все датафреймы
-    for doc_list in decoded_data_list:
-        all_dfs.extend(doc_list)
-    # Создаем итоговый датафрейм для всех кабинетов
-    final_df = pd.concat(all_dfs, ignore_index=True)
-    # Убираем строки, которые не отностятся к кабинету
-    final_df = final_df[final_df['№ п\п'] != 'Итого']
-    return final_df
-
-# Получаем перечень доступных для скачивания документов
-def create_acceptance_certificate_marketplace():
-    """Функция обрабатывает данные полученные в documents_list
-    для каждого кабинета на ВБ"""
-    with open('tokens.json', 'r', encoding='utf-8') as file:
-        tokens = json.load(file)
-    doc_list_data = []
-    for account, token in tokens.items():
-        df = pd.DataFrame(documents_list(token, 'act-income-mp'))
-        df['account'] = account
-        doc_list_data.append(df)
-
-        df = pd.DataFrame(documents_list(token, 'act-income'))
-        df['account'] = account
-        doc_list_data.append(df)
-
-    documents_list_df = pd.concat(doc_list_data)
-    return documents_list_df
-
-def get_decoded_acts_fbs(account, doc_list):
-    """Позволяет обрабатывать архивный файл,
-        полученный из метода create_acceptance_certificate_marketplace"""
-    with open('tokens.json', 'r', encoding='utf-8') as file:
-        tokens = json.load(file)
-
-    url = 'https://documents-api.wildberries.ru/api/v1/documents/download/all'
-    headers = {'Authorization': tokens[account]}
-
-    payload = {
-                "params": [
-                    {
-                        "extension": "xlsx",
-                        "serviceName": doc_id
-                    } for doc_id in doc_list
-                ]
-            }
-    try:
-        res = requests.post(url, json=payload, headers=headers)
-        if res.status_code == 200:
-            data = res.json()
-            document_data = data['data']['document']
-            # Извлекаем зипы документов
-            decoded_data = base64.b64decode(document_data)
-            # Получаю общий архив, со всеми запрошенными документами
-            decoded_acts = io.BytesIO(decoded_data)
-            # Обрабатываем полученные документы
-            return decoded_acts
-        else:
-            print('Отсутствует список документов')
-    except requests.exceptions.RequestException as e:
-        print(f'"Ошибка запроса:", {e}')
-        return None
-    # для отлавливания других ошибок
-    except Exception as e:
-        print(f'Ошибка не связанная с запросом {e}')
-        return None
-    
-
-def proccessing_data_acceptance_act(account, decoded_acts):
-    """Позволяет обрабатывать каждый отдельный архив, который
-    содержит внутри эксель файл с информацией о приеме передаче товара
-    по заказам ФБС. Возвращает датафрейм с информацией по каждому
-    сборочному заданию в документе."""
-    acts_list = []
-    # Открываем данные общего архива со всеми документами
-    with zipfile.ZipFile(decoded_acts, 'r') as full_zip:
-        # Представляем документы в архиве, как коллекцию zip-файлов
-        acts_income_zip = full_zip.namelist()
-        for act in acts_income_zip:
-            # Проходим циклом по каждому документу
-            with full_zip.open(act) as nested_zip_file:
-                # Читаем содержимое вложенного ZIP как байты
-                nested_zip_bytes = nested_zip_file.read()
-                # Загружаем его в память как новый ZIP-объект. Внутри как правило два файла, один эксель, другой .sig
-                nested_zip = zipfile.ZipFile(io.BytesIO(nested_zip_bytes))
-                # Получаем список файлов внутри вложенного ZIP
-                print("Файлы внутри вложенного ZIP:")
-                # Теперь извлекаем каждый эксель файл
-                for inner_file in nested_zip.namelist():
-                    print(f"  - {inner_file}")
-                    # Если нужно, обрабатываем, например, ищем .xlsx
-                    if inner_file.endswith('.xlsx'):
-                        with nested_zip.open(inner_file) as xlsx_file:
-                            wb = load_workbook(xlsx_file, read_only=True)
-                            ws = wb.active
-                            # Получаем значение из D3
-                            if ws['D3'].value:
-                                date_value = ws['D3'].value
-                            elif ws['F3'].value:
-                                date_value = ws['F3'].value
-                            else:
-                                date_value = 'Нет даты'
-                            df_act = pd.read_excel(xlsx_file, header=None)
-
-                            # Получаем строки 8 и 9 как заголовки
-                            header_1 = df_act.iloc[8].fillna('')
-                            header_2 = df_act.iloc[9].fillna('')
-
-                            # Формируем комбинированные заголовки
-                            multi_header = [
-                                f"{h1.strip()} - {h2.strip()}" if h2.strip() else h1.strip()
-                                for h1, h2 in zip(header_1, header_2)
-                            ]
-
-                            print(f"Количество колонок в df: {df_act.shape[1]}")
-                            print(f"Количество заголовков: {len(multi_header)}")
-                            
-                            # Загружаем данные с 12 строки
-                            df = df_act.iloc[12:].copy()
-                            df.columns = multi_header
-                            df = df.dropna(how='all').reset_index(drop=True)
-                            df['Документ'] = act
-                            df['Дата'] = date_value
-                            df['Дата'] = df['Дата'].str.replace(' г.', '').str.strip()
-                            df['Номер_документа'] = df['Документ'].str.extract(r'act-income-mp-(\d+)\.zip')        
-                            df['account'] = account
-                            acts_list.append(df)
-                            print(f'Данные по {act} добавлены в список')
-    return acts_list
-
-
-def get_all_fbs_acts():
-    """ Собирает акты со всех кабинетов, используя методы 
-        get_decoded_acts_fbs и proccessing_data_acceptance_act.
-        Объединяет их в единый датафрейм."""
-    acceptance_certificate_marketplace_dict = create_acceptance_certificate_marketplace().groupby('account')['serviceName'].apply(list).to_dict()
-    full_docs = []
-    for account, doc_list in acceptance_certificate_marketplace_dict.items():
-        act = get_decoded_acts_fbs(account, doc_list)
-        full_docs.extend(proccessing_data_acceptance_act(account, act))
-    final_df = pd.concat(full_docs)    
-    final_df = final_df[final_df['Фактически принято - Стикер/этикетка'] != 'Итого']
-    return final_df
-
-
 def clean_and_parse_date(date_str):
     # Удаляем кавычки и букву "г"
     cleaned = re.sub(r'[\"г]', '', str(date_str)).strip()
@@ -379,6 +78,7 @@ def create_insert_table_db(df: pd.DataFrame, table_name: str, columns_type: dict
     """
     Загружает DataFrame в таблицу PostgreSQL с upsert по уникальному ключу.
     Если таблицы нет — создает с нужными типами и ограничением уникальности.
+    Возвращает True, если данные записаны.
     """
     import psycopg2
     import psycopg2.extras as extras
@@ -398,6 +98,8 @@ def create_insert_table_db(df: pd.DataFrame, table_name: str, columns_type: dict
     columns_definition = ",\n    ".join([f"{col} {dtype}" for col, dtype in columns_type.items()])
     unique_constraint = f"UNIQUE ({', '.join(key_columns)})"
 
+    conn = None
+    success = False
     try:
         conn = psycopg2.connect(
             dbname=name,
@@ -435,6 +137,7 @@ def create_insert_table_db(df: pd.DataFrame, table_name: str, columns_type: dict
         extras.execute_values(cur, insert_query, tuples)
 
         conn.commit()
+        success = True
         print("Данные успешно добавлены в БД.")
 
     except psycopg2.OperationalError as e:
@@ -447,6 +150,7 @@ def create_insert_table_db(df: pd.DataFrame, table_name: str, columns_type: dict
         if conn:
             conn.close()
             print("Соединение с базой данных закрыто.")
+    return success
 
 
 # Глобальный лок для создания таблицы
@@ -534,69 +238,53 @@ async def create_insert_table_db_async(df: pd.DataFrame, table_name: str, column
 
 
 # Данные по повторным отгрузкам
-semaphore = asyncio.Semaphore(10)
 
 async def re_shipment_info_get(account, api_token, date: str):
     """Функция позволяет получать данные о сборочных задниях, требующих повторную отгрузку"""
     
-    url = "https://marketplace-api.wildberries.ru/api/v3/supplies/orders/reshipment"
-    headers = {"Authorization": api_token}
+    path = "/api/v3/supplies/orders/reshipment"
+    client = get_client()
     
-    async with semaphore:
-        async with aiohttp.ClientSession(headers=headers) as session:
-            retry_count = 0
-            while retry_count < 5:
-                try:
-                    async with session.get(url) as response:
-                        print(f"HTTP статус: {response.status} по ЛК {account}")
-                        
-                        if response.status == 400:
-                            err = await response.json()
-                            print(f"Ошибка 400 {account}: {err.get('message') or err}")
-                            break  # Выходим из цикла, т.к. 400 обычно не исправляется повтором
-                            
-                        if response.status == 429:
-                            print(f"429 Too Many Requests для {account} — ждём минуту")
-                            retry_count += 1
-                            await asyncio.sleep(60)
-                            continue
+    try:
+        async with client.get(account, 'marketplace', path, api_token) as response:
+            print(f"HTTP статус: {response.status} по ЛК {account}")
+            
+            if response.status == 400:
+                err = await response.json()
+                print(f"Ошибка 400 {account}: {err.get('message') or err}")
+                return []
+                
+            response.raise_for_status()
+            res_data = await response.json()
+            
+            # Добавляем account к каждому элементу
+            if isinstance(res_data, list):
+                for item in res_data:
+                    # Добавляем account к основному объекту
+                    item['account'] = account
+                    
+                    # Добавляем account к каждому заказу внутри orders
+                    if 'orders' in item and isinstance(item['orders'], list):
+                        for order in item['orders']:
+                            order['account'] = account
                             
-                        response.raise_for_status()
-                        res_data = await response.json()
+                return res_data
+            else:
+                # Если ответ не список, добавляем account к объекту
+                res_data['account'] = account
+                
+                # И к orders если они есть
+                if 'orders' in res_data and isinstance(res_data['orders'], list):
+                    for order in res_data['orders']:
+                        order['date'] = date
+                        order['account'] = account
                         
-                        # Добавляем account к каждому элементу
-                        if isinstance(res_data, list):
-                            for item in res_data:
-                                # Добавляем account к основному объекту
-                                item['account'] = account
-                                
-                                # Добавляем account к каждому заказу внутри orders
-                                if 'orders' in item and isinstance(item['orders'], list):
-                                    for order in item['orders']:
-                                        order['account'] = account
-                                        
-                            return res_data
-                        else:
-                            # Если ответ не список, добавляем account к объекту
-                            res_data['account'] = account
-                            
-                            # И к orders если они есть
-                            if 'orders' in res_data and isinstance(res_data['orders'], list):
-                                for order in res_data['orders']:
-                                    order['date'] = date
-                                    order['account'] = account
-                                    
-                            return res_data  # Возвращаем как список для единообразия
-                            
-                except aiohttp.ClientError as e:
-                    print(f"Сетевая ошибка для {account}: {e}")
-                    retry_count += 1
-                    await asyncio.sleep(30)
-            
-            # Если дошли сюда - все попытки исчерпаны
-            print(f"Не удалось получить данные для {account} после 5 попыток")
-            return []
-        
+                return res_data  # Возвращаем как список для единообразия
+                
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        print(f"Не удалось получить данные для {account}: {e!r}")
+    return []
+    
 def batchify(data, batch_size):
     """
     Splits data into batches of a specified size.
@@ -735,3 +423,22 @@ def create_connection(db_name, db_user, db_password, db_host, db_port):
     except OperationalError as error:
         print(f"Произошла ошибка при подключении к БД PostgreSQL {error}")
     return connection
+
+
+def get_sync_state(table_name: str) -> pd.DataFrame:
+    """Читает таблицу состояния инкрементальной синхронизации (курсоры, отметки времени).
+    Если таблицы еще нет (первый запуск) или БД недоступна — возвращает пустой датафрейм,
+    и вызывающий код выполняет полную загрузку."""
+    load_dotenv()
+    connection = create_connection(os.getenv('NAME_2'), os.getenv('USER_2'), os.getenv('PASSWORD_2'),
+                                   os.getenv('HOST_2'), os.getenv('PORT_2'))
+    if connection is None:
+        return pd.DataFrame()
+    try:
+        return pd.read_sql(f"SELECT * FROM {table_name}", connection)
+    except Exception as e:
+        logging.warning(f"Состояние синхронизации {table_name} не прочитано: {e}")
+        return pd.DataFrame()
+    finally:
+        connection.close()
+
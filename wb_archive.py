@@ -0,0 +1,228 @@
+"""Локальный архив сырых ответов API Wildberries и режим воспроизведения.
+
+Каждый ответ API (страницы заказов, статусы, поставки, возвраты, списки
+и архивы документов) дописывается в сжатый gzip-файл вида
+<WB_ARCHIVE_DIR>/<дата>/<кабинет>_<группа методов>.jsonl.gz. Одна строка —
+одна запись: время, кабинет, метод, путь, параметры, тело запроса, статус,
+заголовки и тело ответа. Файлы только дописываются: новые записи
+добавляются отдельным gzip-блоком.
+
+Переменные окружения:
+    WB_ARCHIVE=1        — сохранять ответы в архив
+    WB_REPLAY=1         — брать ответы из архива вместо запросов к API
+    WB_ARCHIVE_DIR      — папка архива (по умолчанию <WB_DATA_DIR>/wb_archive)
+    WB_DATA_DIR         — папка данных вне проекта (по умолчанию ~/wb_data)
+    WB_REPLAY_DATE      — день архива (YYYY-MM-DD) для воспроизведения,
+                          по умолчанию используются все дни
+
+При воспроизведении на запрос отдается последний сохраненный ответ с теми же
+кабинетом, методом, путем, параметрами и телом запроса. Для инкрементальных
+режимов (ASSEMBLY_SYNC_MODE, SUPPLY_SYNC_MODE) отметки в БД должны совпадать
+с теми, что были при записи, иначе параметры запроса будут другими.
+"""
+import asyncio
+import base64
+import glob
+import gzip
+import json
+import logging
+import os
+from datetime import datetime
+from http import HTTPStatus
+from aiohttp import ClientResponseError, RequestInfo
+from multidict import CIMultiDict, CIMultiDictProxy
+from yarl import URL
+from wb_rate_limit import endpoint_group
+
+logger = logging.getLogger(__name__)
+
+# После скольких байт несжатых записей файл дописывается на диск
+FLUSH_BYTES = 1024 * 1024
+
+
+def _canonical(value) -> str:
+    """Приводит параметры или тело запроса к строке, одинаковой для одинаковых запросов."""
+    if value is None:
+        return ''
+    if isinstance(value, dict):
+        # aiohttp передает параметры строками, поэтому 0 и '0' — один запрос
+        value = {str(key): value[key] if isinstance(value[key], (dict, list)) else str(value[key])
+                 for key in value}
+    return json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def _file_name(account: str, group: str) -> str:
+    account = ''.join('_' if char in '/\\:*?"<>|' else char for char in str(account))
+    return f"{account}_{group}.jsonl.gz"
+
+
+def request_key(account: str, method: str, api: str, path: str, params=None, payload=None) -> tuple:
+    """Ключ запроса в архиве."""
+    return (str(account), method.upper(), api, path, _canonical(params), _canonical(payload))
+
+
+class ArchivedBody:
+    """Тело ответа из архива с тем же интерфейсом потокового чтения, что у res.content."""
+
+    def __init__(self, body: bytes):
+        self._body = body
+
+    async def read(self, n: int = -1) -> bytes:
+        return self._body
+
+    async def iter_chunked(self, n: int):
+        for start in range(0, len(self._body), n):
+            yield self._body[start:start + n]
+
+
+class ArchivedResponse:
+    """Ответ из архива с тем же интерфейсом чтения, что у aiohttp.ClientResponse."""
+
+    def __init__(self, status: int, headers: dict, body: bytes, method: str = 'GET', url: str = ''):
+        self.status = status
+        self.headers = CIMultiDict(headers or {})
+        self.method = method
+        self.url = URL(url)
+        self.content = ArchivedBody(body)
+        self._body = body
+
+    @property
+    def reason(self) -> str:
+        try:
+            return HTTPStatus(self.status).phrase
+        except ValueError:
+            return ''
+
+    @property
+    def content_type(self) -> str:
+        content_type = self.headers.get('Content-Type', 'application/octet-stream')
+        return content_type.split(';', 1)[0].strip().lower()
+
+    async def read(self) -> bytes:
+        return self._body
+
+    async def text(self, encoding: str = 'utf-8') -> str:
+        return self._body.decode(encoding)
+
+    async def json(self, **kwargs):
+        return json.loads(self._body)
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            request_info = RequestInfo(self.url, self.method, CIMultiDictProxy(CIMultiDict()), self.url)
+            raise ClientResponseError(request_info, (), status=self.status, message=self.reason,
+                                      headers=self.headers)
+
+    def release(self):
+        pass
+
+
+class ResponseArchive:
+    """Запись ответов в архив и их чтение в режиме воспроизведения."""
+
+    def __init__(self, directory: str = None, record: bool = False, replay: bool = False,
+                 replay_date: str = None):
+        if directory is None:
+            # wb_client сам импортирует этот модуль, поэтому импорт здесь
+            from wb_client import data_dir
+            directory = os.path.join(data_dir(), 'wb_archive')
+        self.directory = directory
+        self.record_enabled = record
+        self.replay = replay
+        self.replay_date = replay_date
+        # Несжатые записи, ожидающие записи на диск: {путь файла: [строки]}
+        self._pending = {}
+        self._pending_bytes = 0
+        # Загруженные для воспроизведения файлы: {(кабинет, группа): {ключ: запись}}
+        self._index = {}
+
+    @classmethod
+    def from_env(cls):
+        """Создает архив по переменным окружения. None, если архив не включен."""
+        record = os.getenv('WB_ARCHIVE', '0') == '1'
+        replay = os.getenv('WB_REPLAY', '0') == '1'
+        if not record and not replay:
+            return None
+        return cls(os.getenv('WB_ARCHIVE_DIR') or None, record=record and not replay,
+                   replay=replay, replay_date=os.getenv('WB_REPLAY_DATE') or None)
+
+    # ------------------------------------------------------------------ запись
+
+    async def record(self, account: str, method: str, api: str, path: str, request_kwargs: dict, res) -> ArchivedResponse:
+        """Читает тело ответа и добавляет запись в архив.
+        Возвращает ответ с уже прочитанным телом: вызывающий код читает его
+        (в том числе потоково, через content) так же, как ответ aiohttp."""
+        body = await res.read()
+        try:
+            body_text, encoding = body.decode('utf-8'), 'utf-8'
+        except UnicodeDecodeError:
+            body_text, encoding = base64.b64encode(body).decode('ascii'), 'base64'
+        now = datetime.now()
+        entry = {
+            'ts': now.isoformat(),
+            'account': str(account),
+            'method': method.upper(),
+            'api': api,
+            'path': path,
+            'params': _canonical(request_kwargs.get('params')),
+            'payload': _canonical(request_kwargs.get('json')),
+            'status': res.status,
+            'headers': dict(res.headers),
+            'encoding': encoding,
+            'body': body_text,
+        }
+        line = json.dumps(entry, ensure_ascii=False) + '\n'
+        file_path = os.path.join(self.directory, now.strftime('%Y-%m-%d'),
+                                 _file_name(account, endpoint_group(api, path)))
+        self._pending.setdefault(file_path, []).append(line)
+        self._pending_bytes += len(line)
+        if self._pending_bytes >= FLUSH_BYTES:
+            await self.flush()
+        return ArchivedResponse(res.status, res.headers, body, method.upper(), str(res.url))
+
+    @staticmethod
+    def _write(pending: dict):
+        for file_path, lines in pending.items():
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            # Режим 'ab' дописывает новый gzip-блок, старые записи не переписываются
+            with gzip.open(file_path, 'ab') as file:
+                file.write(''.join(lines).encode('utf-8'))
+
+    async def flush(self):
+        """Дописывает накопленные записи на диск (сжатие в отдельном потоке)."""
+        if not self._pending:
+            return
+        pending, self._pending, self._pending_bytes = self._pending, {}, 0
+        await asyncio.to_thread(self._write, pending)
+        logger.info(f"Архив ответов: записано {sum(len(lines) for lines in pending.values())} ответов")
+
+    # ------------------------------------------------------- воспроизведение
+
+    def _load(self, account: str, group: str) -> dict:
+        key = (str(account), group)
+        if key not in self._index:
+            day = self.replay_date or '*'
+            records = {}
+            for file_path in sorted(glob.glob(os.path.join(self.directory, day, _file_name(account, group)))):
+                with gzip.open(file_path, 'rt', encoding='utf-8') as file:
+                    for line in file:
+                        entry = json.loads(line)
+                        entry_key = (entry['account'], entry['method'], entry['api'], entry['path'],
+                                     entry['params'], entry['payload'])
+                        # Файлы отсортированы по дням, поэтому остается последний ответ
+                        records[entry_key] = entry
+            self._index[key] = records
+        return self._index[key]
+
+    def response(self, account: str, method: str, api: str, path: str, request_kwargs: dict) -> ArchivedResponse:
+        """Ответ из архива на запрос. Если запроса в архиве нет — ответ 404 с пустым телом."""
+        key = request_key(account, method, api, path, request_kwargs.get('params'), request_kwargs.get('json'))
+        entry = self._load(account, endpoint_group(api, path)).get(key)
+        if entry is None:
+            logger.warning(f"[{account}] В архиве нет ответа на {method} {path} {key[4]}")
+            return ArchivedResponse(404, {'Content-Type': 'application/json'}, b'{}', method.upper(), path)
+        if entry['encoding'] == 'base64':
+            body = base64.b64decode(entry['body'])
+        else:
+            body = entry['body'].encode('utf-8')
+        return ArchivedResponse(entry['status'], entry['headers'], body, method.upper(), path)
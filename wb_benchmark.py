@@ -0,0 +1,215 @@
+"""Нагрузочный прогон скриптов против локального тестового сервера API ВБ.
+
+Поднимает wb_mock_server с заданным объемом данных и отказами, по очереди
+запускает скрипты и для каждого выводит время работы, число запросов к API,
+повторы, ответы с отказами, код выхода и пиковую память процесса (RSS).
+
+Скрипты загружают данные в БД (NAME_2, USER_2, ...), поэтому прогон требует
+явно указанной тестовой БД: --db-name/--db-user/--db-password/--db-host/--db-port
+или переменные BENCH_DB_NAME, BENCH_DB_USER, ... Они передаются скриптам вместо
+настроек из .env, а БД из .env для прогона использовать нельзя. С --no-db скрипты
+получают недоступную БД: загрузка завершится ошибкой, но время и запросы к API
+до нее будут измерены (скрипты, которые сначала читают состояние из БД,
+завершатся сразу).
+
+Запуск:
+    python wb_benchmark.py --accounts 3 --orders 20000 --rate-429 0.02 --rate-5xx 0.01
+    python wb_benchmark.py --jobs assembly_info supply_data --rate-scale 10 --json bench.json
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+import psutil
+from dotenv import dotenv_values
+from wb_mock_server import build_parser as build_server_parser
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Скрипты для прогона: название -> путь относительно папки проекта
+JOBS = {
+    'assembly_info': 'assembly_info.py',
+    'supply_data': 'supply_data.py',
+    'supplies_and_orders': 'supplies_and_orders.py',
+    'reshipment': 'reshipment.py',
+    'acceptance_fbs_acts': os.path.join('acceptance_acts', 'acceptance_fbs_acts.py'),
+    'acceptance_fbo_acts': os.path.join('acceptance_acts', 'acceptance_fbo_acts.py'),
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def server_request(url: str, method: str = 'GET') -> dict:
+    request = urllib.request.Request(url, method=method, data=b'' if method == 'POST' else None)
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return json.loads(response.read())
+
+
+def wait_server(url: str, process: subprocess.Popen, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('Тестовый сервер завершился при запуске')
+        try:
+            return server_request(f'{url}/__stats')
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('Тестовый сервер не запустился')
+
+
+def wait_with_peak_rss(process: subprocess.Popen, timeout: float, interval: float = 0.05) -> int:
+    """Ждет завершения процесса (не дольше timeout) и возвращает пиковую RSS
+    процесса вместе с дочерними, в байтах."""
+    deadline = time.monotonic() + timeout
+    peak = 0
+    watched = psutil.Process(process.pid)
+    while process.poll() is None:
+        if time.monotonic() > deadline:
+            process.kill()
+            break
+        try:
+            rss = watched.memory_info().rss
+            rss += sum(child.memory_info().rss for child in watched.children(recursive=True))
+            peak = max(peak, rss)
+        except psutil.Error:
+            pass
+        time.sleep(interval)
+    process.wait()
+    return peak
+
+
+def run_job(name: str, url: str, env: dict, timeout: float) -> dict:
+    """Запускает один скрипт и собирает его метрики."""
+    script = os.path.join(BASE_DIR, JOBS[name])
+    server_request(f'{url}/__stats/reset', 'POST')
+    # Логи пишем во временный файл: pipe переполнится и остановит скрипт
+    with tempfile.TemporaryFile() as stderr:
+        started = time.perf_counter()
+        process = subprocess.Popen([sys.executable, os.path.basename(script)], cwd=os.path.dirname(script),
+                                   env=env, stdout=subprocess.DEVNULL, stderr=stderr)
+        rss = wait_with_peak_rss(process, timeout)
+        wall = time.perf_counter() - started
+        stderr.seek(0)
+        error = stderr.read().decode('utf-8', 'replace').strip().splitlines()
+    stats = server_request(f'{url}/__stats')
+    return {
+        'job': name,
+        'exit_code': process.returncode,
+        'wall_s': round(wall, 2),
+        'requests': stats['requests'],
+        'retries': stats['retries'],
+        'faults': stats['faults'],
+        'peak_rss_mb': round(rss / 1024 ** 2, 1),
+        'by_route': stats['by_route'],
+        'by_status': stats['by_status'],
+        'error': error[-1] if process.returncode and error else None,
+    }
+
+
+def print_report(results: list):
+    header = f"{'скрипт':<22}{'код':>5}{'время, с':>10}{'запросы':>9}{'повторы':>9}{'отказы':>8}{'RSS, МБ':>9}"
+    print(header)
+    print('-' * len(header))
+    for result in results:
+        print(f"{result['job']:<22}{result['exit_code']:>5}{result['wall_s']:>10}{result['requests']:>9}"
+              f"{result['retries']:>9}{result['faults']:>8}{result['peak_rss_mb']:>9}")
+        if result['error']:
+            print(f"    ошибка: {result['error']}")
+
+
+# Настройки БД скриптов: поле аргумента -> переменная окружения
+DB_FIELDS = {'name': 'NAME_2', 'user': 'USER_2', 'password': 'PASSWORD_2', 'host': 'HOST_2', 'port': 'PORT_2'}
+
+
+def benchmark_db_env(parser: argparse.ArgumentParser, args) -> dict:
+    """Переменные БД для скриптов прогона. Без явно указанной тестовой БД (или --no-db)
+    прогон не запускается: иначе тестовые данные попали бы в рабочие таблицы из .env."""
+    if args.no_db:
+        # Свободный порт без сервера: соединение с БД сразу завершится ошибкой
+        return {'NAME_2': 'benchmark', 'USER_2': 'benchmark', 'PASSWORD_2': '',
+                'HOST_2': '127.0.0.1', 'PORT_2': str(free_port())}
+    missing = [f'--db-{field}' for field in DB_FIELDS if field != 'password' and not getattr(args, f'db_{field}')]
+    if missing:
+        parser.error(f"не указана тестовая БД ({', '.join(missing)} или BENCH_DB_*); "
+                     f"для прогона без БД используйте --no-db")
+    db_env = {variable: getattr(args, f'db_{field}') or '' for field, variable in DB_FIELDS.items()}
+    production = dotenv_values(os.path.join(BASE_DIR, '.env'))
+    if all(production.get(variable) == db_env[variable] for variable in ('NAME_2', 'HOST_2', 'PORT_2')):
+        parser.error('тестовая БД совпадает с БД из .env')
+    return db_env
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Прогон скриптов против тестового сервера API ВБ',
+                                     parents=[build_server_parser()], conflict_handler='resolve')
+    parser.add_argument('--port', type=int, default=0, help='порт сервера (по умолчанию свободный)')
+    parser.add_argument('--jobs', nargs='+', choices=list(JOBS), default=list(JOBS), help='какие скрипты запускать')
+    parser.add_argument('--rate-scale', type=float, default=1.0,
+                        help='множитель лимитов запросов клиента (WB_RATE_LIMIT_SCALE)')
+    parser.add_argument('--timeout', type=float, default=1800, help='таймаут одного скрипта, с')
+    parser.add_argument('--json', help='сохранить результаты в json-файл')
+    for field in DB_FIELDS:
+        parser.add_argument(f'--db-{field}', default=os.getenv(f'BENCH_DB_{field.upper()}'),
+                            help=f'тестовая БД: {field} (BENCH_DB_{field.upper()})')
+    parser.add_argument('--no-db', action='store_true', help='прогон без БД: загрузка в БД завершится ошибкой')
+    args = parser.parse_args()
+    db_env = benchmark_db_env(parser, args)
+
+    port = args.port or free_port()
+    url = f'http://{args.host}:{port}'
+    with tempfile.TemporaryDirectory() as tmp:
+        tokens_file = os.path.join(tmp, 'tokens.json')
+        server_args = [sys.executable, os.path.join(BASE_DIR, 'wb_mock_server.py'),
+                       '--host', args.host, '--port', str(port), '--tokens-file', tokens_file,
+                       '--accounts', str(args.accounts), '--orders', str(args.orders),
+                       '--supplies', str(args.supplies), '--orders-per-supply', str(args.orders_per_supply),
+                       '--acts-per-day', str(args.acts_per_day), '--rows-per-act', str(args.rows_per_act),
+                       '--rate-429', str(args.rate_429), '--rate-5xx', str(args.rate_5xx),
+                       '--latency-ms', str(args.latency_ms), '--seed', str(args.seed)]
+        server = subprocess.Popen(server_args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_server(url, server)
+            env = {**os.environ,
+                   'WB_MARKETPLACE_URL': url,
+                   'WB_DOCUMENTS_URL': url,
+                   'WB_TOKENS_FILE': tokens_file,
+                   'WB_RATE_LIMIT_SCALE': str(args.rate_scale),
+                   'PYTHONIOENCODING': 'utf-8',
+                   # Архив актов и кэш перечня документов прогона — во временной папке,
+                   # чтобы тестовые акты не попали в рабочие архив и кэш
+                   'WB_DATA_DIR': tmp,
+                   'ACT_ARCHIVE_DIR': os.path.join(tmp, 'act_archive'),
+                   'ACT_LIST_CACHE_DIR': os.path.join(tmp, 'documents_list_cache'),
+                   'WB_ARCHIVE_DIR': os.path.join(tmp, 'wb_archive'),
+                   # Заданные переменные load_dotenv не перезаписывает, поэтому БД из .env не используется
+                   **db_env}
+            # Архив и воспроизведение ответов в прогоне не используются,
+            # архив актов работает как по умолчанию
+            env.pop('WB_REPLAY', None)
+            env.pop('WB_ARCHIVE', None)
+            env.pop('ACT_ARCHIVE', None)
+            results = []
+            for name in args.jobs:
+                print(f'Запуск {name}...')
+                results.append(run_job(name, url, env, args.timeout))
+        finally:
+            server.terminate()
+            server.wait()
+
+    print_report(results)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump({'params': vars(args), 'results': results}, file, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+"""Общий HTTP-клиент для API Wildberries.
+
+Держит по одной долгоживущей aiohttp-сессии на каждый хост API
+(marketplace-api, documents-api) с пулом keep-alive соединений и кэшем DNS,
+выдает заголовки авторизации для каждого кабинета и пропускает каждый
+запрос через ограничитель частоты (wb_rate_limit). Клиент привязан
+к event loop, в котором создан: при каждом asyncio.run создается свой.
+Ответы можно сохранять в локальный архив и воспроизводить из него
+без обращения к API (wb_archive, переменные WB_ARCHIVE и WB_REPLAY).
+Повторы при 429 / 5xx / сетевых ошибках и отключение сбоящих кабинетов
+выполняет сам клиент по общей политике (wb_retry).
+"""
+import asyncio
+import contextlib
+import logging
+import os
+import aiohttp
+from wb_rate_limit import RateLimiter
+from wb_archive import ResponseArchive
+from wb_retry import RETRY_STATUSES, CircuitBreaker, RetryPolicy
+
+logger = logging.getLogger(__name__)
+
+
+# Базовые адреса API по их назначению
+API_HOSTS = {
+    'marketplace': 'https://marketplace-api.wildberries.ru',
+    'documents': 'https://documents-api.wildberries.ru',
+}
+
+
+def api_host(api: str) -> str:
+    """Базовый адрес API. Переопределяется переменными WB_MARKETPLACE_URL / WB_DOCUMENTS_URL
+    (например, для локального тестового сервера wb_mock_server)."""
+    return os.getenv(f'WB_{api.upper()}_URL') or API_HOSTS[api]
+
+
+def data_dir() -> str:
+    """Папка данных вне проекта (архивы ответов и актов, кэши): WB_DATA_DIR, по умолчанию ~/wb_data."""
+    return os.getenv('WB_DATA_DIR', os.path.join(os.path.expanduser('~'), 'wb_data'))
+
+
+class WBClient:
+    """Пул соединений к API ВБ, общий для всех кабинетов и сборщиков данных."""
+
+    def __init__(self, limit_per_host: int = 20, ttl_dns_cache: int = 300,
+                 keepalive_timeout: int = 60, timeout: int = 60, limiter: RateLimiter = None,
+                 archive: ResponseArchive = None, retry: RetryPolicy = None, breaker: CircuitBreaker = None):
+        self.limit_per_host = limit_per_host
+        self.ttl_dns_cache = ttl_dns_cache
+        self.keepalive_timeout = keepalive_timeout
+        # Ограничиваем ожидание соединения и каждого чтения из сокета, а не весь запрос:
+        # большие архивы documents/download/all скачиваются дольше минуты, но не зависают
+        self.timeout = aiohttp.ClientTimeout(total=None, sock_connect=timeout, sock_read=timeout)
+        self.limiter = limiter or RateLimiter()
+        self.archive = archive if archive is not None else ResponseArchive.from_env()
+        # Политика повторов с бюджетом на весь запуск и отключение сбоящих кабинетов
+        self.retry = retry or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker()
+        self._sessions = {}
+        self._headers = {}
+        self.closed = False
+
+    def url(self, api: str, path: str) -> str:
+        """Собирает полный адрес запроса по названию API и пути метода."""
+        return f"{api_host(api)}{path}"
+
+    def session(self, api: str) -> aiohttp.ClientSession:
+        """Возвращает сессию для хоста API, создавая ее при первом обращении."""
+        session = self._sessions.get(api)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=self.ttl_dns_cache,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            session = aiohttp.ClientSession(base_url=api_host(api),
+                                            connector=connector,
+                                            timeout=self.timeout)
+            self._sessions[api] = session
+        return session
+
+    def headers(self, account: str, api_token: str = None) -> dict:
+        """Заголовки авторизации кабинета. Токен запоминается при первом вызове."""
+        if api_token is not None and self._headers.get(account, {}).get('Authorization') != api_token:
+            self._headers[account] = {'Authorization': api_token}
+        if account not in self._headers:
+            raise KeyError(f"Нет токена для кабинета {account}")
+        return self._headers[account]
+
+    @contextlib.asynccontextmanager
+    async def request(self, account: str, method: str, api: str, path: str, api_token: str = None, **kwargs):
+        """Запрос к API от имени кабинета с соблюдением лимитов ВБ.
+        Используется как session.get/post: async with client.get(...) as res.
+
+        Ответы 429 / 5xx и сетевые ошибки повторяются по политике self.retry,
+        наружу отдается последний ответ или исключение последней попытки.
+        Сборщики данных сами запросы не повторяют: ответ 429 / 5xx или сетевая
+        ошибка у них означает, что повторы уже исчерпаны. Если кабинет отключен
+        после повторяющихся ошибок (например, 401), сразу бросается
+        AccountUnavailableError (наследник aiohttp.ClientError)."""
+        headers = {**self.headers(account, api_token), **kwargs.pop('headers', {})}
+        if self.archive is not None and self.archive.replay:
+            # Режим воспроизведения: ответ из архива, без сети и без расхода лимитов
+            yield self.archive.response(account, method, api, path, kwargs)
+            return
+        attempt = 0
+        while True:
+            self.breaker.check(account)
+            # Ждем токен в ведре кабинета для этой группы методов
+            await self.limiter.acquire(account, api, path)
+            try:
+                res = await self.session(api).request(method, path, headers=headers, **kwargs)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as err:
+                self.breaker.failure(account)
+                if not self.retry.allow(attempt):
+                    raise
+                delay = self.retry.delay(attempt)
+                logger.warning(f"[{account}] {method} {path}: {err!r}, повтор через {delay:.1f} с")
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            # Подстраиваем лимит по заголовкам ответа
+            self.limiter.update(account, api, path, res.status, res.headers)
+            self.breaker.record(account, res.status)
+            if res.status in RETRY_STATUSES and self.retry.allow(attempt):
+                res.release()
+                # Паузу по 429 выдерживает ограничитель, для 5xx ждем по политике
+                delay = 0 if res.status == 429 else self.retry.delay(attempt)
+                logger.warning(f"[{account}] {method} {path}: ответ {res.status}, повтор через {delay:.1f} с")
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            break
+        try:
+            if self.archive is not None and self.archive.record_enabled:
+                # Тело уже прочитано для архива, наружу отдается ответ с этим телом
+                yield await self.archive.record(account, method, api, path, kwargs, res)
+            else:
+                yield res
+        finally:
+            res.release()
+
+    def get(self, account: str, api: str, path: str, api_token: str = None, **kwargs):
+        return self.request(account, 'GET', api, path, api_token, **kwargs)
+
+    def post(self, account: str, api: str, path: str, api_token: str = None, **kwargs):
+        return self.request(account, 'POST', api, path, api_token, **kwargs)
+
+    async def close(self):
+        """Закрывает все сессии и соединения пула."""
+        self.closed = True
+        if self.archive is not None:
+            await self.archive.flush()
+        for session in self._sessions.values():
+            if not session.closed:
+                await session.close()
+        self._sessions.clear()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+
+# Клиенты по event loop: aiohttp-сессию нельзя переносить между циклами
+_clients = {}
+
+
+def get_client() -> WBClient:
+    """Возвращает общий клиент для текущего event loop."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.closed:
+        # Убираем клиентов от завершенных циклов
+        for old_loop in [old for old in _clients if old.is_closed()]:
+            del _clients[old_loop]
+        client = WBClient()
+        _clients[loop] = client
+    return client
+
+
+async def close_client():
+    """Закрывает общий клиент текущего event loop, если он был создан."""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.close()
@@ -0,0 +1,87 @@
+"""Потоковое чтение ответов documents/download/all.
+
+Ответ ВБ — JSON вида {"data": {"fileName": ..., "extension": "zip", "document": "<base64>"}},
+где document — весь архив документов в base64. Вместо json() + b64decode (несколько
+полных копий архива в памяти) тело читается по кускам один раз: строка document
+декодируется из base64 по мере поступления и пишется во временный файл, который
+держится в памяти до WB_DOCUMENTS_SPOOL_MB мегабайт и затем переносится на диск.
+Пиковая память не зависит от числа документов в пачке.
+"""
+import binascii
+import os
+import re
+import tempfile
+
+CHUNK_SIZE = 256 * 1024
+SPOOL_MAX_SIZE = int(os.getenv('WB_DOCUMENTS_SPOOL_MB', 32)) * 1024 * 1024
+
+_DOCUMENT_KEY = re.compile(rb'"document"\s*:\s*"')
+# Ключ может прийти разрезанным между кусками — держим хвост такой длины
+_KEY_TAIL = 64
+
+
+class DocumentDecoder:
+    """Инкрементальный разбор тела ответа: ищет строку document и декодирует ее из base64."""
+
+    def __init__(self, max_size: int = None):
+        self.file = tempfile.SpooledTemporaryFile(max_size=max_size or SPOOL_MAX_SIZE)
+        self.found = False
+        self.done = False
+        self._head = b''
+        self._rest = b''
+
+    def feed(self, chunk: bytes):
+        if self.done or not chunk:
+            return
+        if not self.found:
+            data = self._head + chunk
+            match = _DOCUMENT_KEY.search(data)
+            if match is None:
+                self._head = data[-_KEY_TAIL:]
+                return
+            self.found = True
+            self._head = b''
+            chunk = data[match.end():]
+        end = chunk.find(b'"')
+        if end != -1:
+            chunk = chunk[:end]
+            self.done = True
+        self._decode(chunk)
+
+    def _decode(self, chunk: bytes):
+        data = self._rest + chunk
+        # Незаконченную escape-последовательность оставляем до следующего куска
+        keep = 1 if data.endswith(b'\\') and not self.done else 0
+        if keep:
+            data, tail = data[:-1], data[-1:]
+        else:
+            tail = b''
+        # В JSON символ / может быть экранирован, переводы строк в base64 не нужны
+        data = data.replace(b'\\/', b'/').replace(b'\\n', b'').replace(b'\\r', b'')
+        cut = len(data) if self.done else len(data) - len(data) % 4
+        if cut:
+            self.file.write(binascii.a2b_base64(data[:cut]))
+        self._rest = data[cut:] + tail
+
+    def finish(self):
+        """Возвращает файл с архивом (позиция в начале) или None, если document в ответе нет."""
+        if not self.found:
+            self.file.close()
+            return None
+        if not self.done:
+            self.done = True
+            self._decode(b'')
+        self.file.seek(0)
+        return self.file
+
+
+async def read_document_archive(res, chunk_size: int = CHUNK_SIZE):
+    """Читает ответ aiohttp на documents/download/all и возвращает файл с архивом или None."""
+    decoder = DocumentDecoder()
+    # Ответ из архива ответов (wb_archive) отдает уже прочитанное тело тем же интерфейсом
+    async for chunk in res.content.iter_chunked(chunk_size):
+        decoder.feed(chunk)
+        if decoder.done:
+            break
+    return decoder.finish()
+
@@ -0,0 +1,75 @@
+"""Колоночная загрузка страниц ответов API Wildberries.
+
+Страница декодируется быстрым JSON-декодером (orjson, если установлен),
+а поля записей сразу дописываются в списки по колонкам. Постоянные для
+страницы поля (кабинет, поставка) добавляются как колонки, без изменения
+каждой записи. В конце задачи собирается один DataFrame без промежуточных
+списков словарей.
+"""
+import json
+from itertools import repeat
+from operator import itemgetter
+import pandas as pd
+
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    loads = json.loads
+
+
+class ColumnBuffer:
+    """Накопитель записей по колонкам для сборки одного DataFrame."""
+
+    def __init__(self):
+        self.columns = {}
+        self.length = 0
+
+    def __len__(self):
+        return self.length
+
+    def _column(self, name):
+        column = self.columns.get(name)
+        if column is None:
+            # Новая колонка: для уже добавленных записей значение пустое
+            column = self.columns[name] = [None] * self.length
+        return column
+
+    def extend(self, records: list, **constants):
+        """Добавляет записи страницы. constants — колонки с одним значением на всю страницу."""
+        count = len(records)
+        if not count:
+            return
+        keys = tuple(records[0])
+        if all(len(record) == len(keys) for record in records):
+            try:
+                # Обычный случай: у всех записей одинаковый набор полей
+                rows = list(map(itemgetter(*keys), records)) if len(keys) > 1 else [(record[keys[0]],) for record in records]
+                for name, values in zip(keys, zip(*rows)):
+                    self._column(name).extend(values)
+            except KeyError:
+                rows = None
+        else:
+            rows = None
+        if rows is None:
+            for name in dict.fromkeys(key for record in records for key in record):
+                self._column(name).extend(record.get(name) for record in records)
+        for name, value in constants.items():
+            self._column(name).extend(repeat(value, count))
+        self.length += count
+        # Колонки, которых не было в этой странице, дополняем пустыми значениями
+        for column in self.columns.values():
+            if len(column) < self.length:
+                column.extend(repeat(None, self.length - len(column)))
+
+    def add_page(self, body: bytes, key: str, **constants) -> dict:
+        """Декодирует тело ответа и добавляет записи из data[key]. Возвращает декодированный ответ."""
+        data = loads(body)
+        self.extend(data.get(key) or [], **constants)
+        return data
+
+    def to_frame(self, columns: list = None) -> pd.DataFrame:
+        """Собирает DataFrame. columns — набор колонок для пустого результата."""
+        if not self.length and columns is not None:
+            return pd.DataFrame(columns=columns)
+        return pd.DataFrame(self.columns)
@@ -0,0 +1,423 @@
+"""Локальный тестовый сервер API Wildberries.
+
+Реализует методы, которые вызывают наши скрипты:
+    GET  /api/v3/orders
+    POST /api/v3/orders/status
+    GET  /api/v3/supplies
+    GET  /api/v3/supplies/{id}
+    GET  /api/v3/supplies/{id}/orders
+    GET  /api/v3/supplies/orders/reshipment
+    GET  /api/v1/documents/list
+    POST /api/v1/documents/download/all
+
+Данные генерируются детерминированно (по --seed) в заданном объеме: число
+кабинетов, заданий, поставок и актов. Можно добавить задержку ответа и
+случайные ответы 429 / 5xx. Счетчики запросов отдаются по GET /__stats
+и сбрасываются POST /__stats/reset.
+
+Кабинет определяется по токену: mock-token-<номер>. Файл токенов для
+скриптов пишет write_tokens (или wb_benchmark).
+
+Запуск:
+    python wb_mock_server.py --port 8080 --accounts 3 --orders 20000 --rate-429 0.02
+
+Скрипты направляются на сервер переменными окружения:
+    WB_MARKETPLACE_URL=http://127.0.0.1:8080
+    WB_DOCUMENTS_URL=http://127.0.0.1:8080
+    WB_TOKENS_FILE=<файл токенов>
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import io
+import json
+import random
+import zipfile
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from aiohttp import web
+from openpyxl import Workbook
+
+WB_STATUSES = ('waiting', 'sorted', 'sold', 'canceled', 'canceled_by_client', 'declined_by_client', 'defect',
+               'ready_for_pickup')
+SUPPLIER_STATUSES = ('new', 'confirm', 'complete', 'cancel')
+ID_BASE = 10_000_000
+
+
+def account_name(index: int) -> str:
+    return f'mock_{index}'
+
+
+def account_token(index: int) -> str:
+    return f'mock-token-{index}'
+
+
+def write_tokens(path: str, accounts: int):
+    """Записывает файл токенов для скриптов в формате tokens.json."""
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump({account_name(index): account_token(index) for index in range(accounts)}, file)
+
+
+def _hash(*parts) -> int:
+    """Стабильное псевдослучайное число по набору значений."""
+    return int.from_bytes(hashlib.blake2b(repr(parts).encode(), digest_size=8).digest(), 'big')
+
+
+class MockData:
+    """Генератор синтетических данных. Ничего не хранит, кроме кэша файлов актов."""
+
+    def __init__(self, accounts: int, orders: int, supplies: int, orders_per_supply: int,
+                 acts_per_day: int, rows_per_act: int, seed: int):
+        self.accounts = accounts
+        self.orders = orders
+        self.supplies = supplies
+        self.orders_per_supply = orders_per_supply
+        self.acts_per_day = acts_per_day
+        self.rows_per_act = rows_per_act
+        self.seed = seed
+        self.now = datetime.now(timezone.utc).replace(microsecond=0)
+        self._acts = {}
+
+    # Сборочные задания: индексы 0..orders-1 за последние 30 дней по возрастанию времени
+    def order_created(self, index: int) -> datetime:
+        return self.now - timedelta(days=30) + timedelta(seconds=index * 30 * 86400 // max(self.orders, 1))
+
+    def order_id(self, account: int, index: int) -> int:
+        return (account + 1) * ID_BASE + index
+
+    def order(self, account: int, index: int) -> dict:
+        order_id = self.order_id(account, index)
+        rnd = _hash(self.seed, order_id)
+        nm_id = 100000 + rnd % 500
+        return {
+            'address': None,
+            'scanPrice': None,
+            'deliveryType': 'fbs',
+            'supplyId': f'WB-GI-{account}{index // self.orders_per_supply:07d}',
+            'orderUid': f'{order_id}_uid',
+            'article': f'wild{rnd % 300}',
+            'colorCode': '',
+            'rid': f'{order_id}.0.0',
+            'createdAt': self.order_created(index).strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'offices': ['Москва'],
+            'skus': [str(2000000000000 + nm_id)],
+            'id': order_id,
+            'warehouseId': 1000 + account,
+            'officeId': 300 + rnd % 20,
+            'nmId': nm_id,
+            'chrtId': 200000 + rnd % 1000,
+            'price': 100000 + rnd % 500000,
+            'convertedPrice': 100000 + rnd % 500000,
+            'currencyCode': 643,
+            'convertedCurrencyCode': 643,
+            'cargoType': 1,
+            'isZeroOrder': False,
+            'comment': '',
+            'options': {'isB2b': False},
+        }
+
+    def order_status(self, order_id: int) -> dict:
+        index = order_id % ID_BASE
+        age = 1 - index / max(self.orders, 1)
+        rnd = _hash(self.seed, 'status', order_id)
+        # Чем старше задание, тем вероятнее финальный статус
+        if (rnd % 1000) / 1000 < age:
+            wb_status = WB_STATUSES[2 + rnd % 5]
+        else:
+            wb_status = WB_STATUSES[(rnd >> 8) % 2]
+        return {'id': order_id, 'supplierStatus': SUPPLIER_STATUSES[(rnd >> 16) % 4], 'wbStatus': wb_status}
+
+    # Поставки: индексы 0..supplies-1 за последние 60 дней, последние 5 — открытые
+    def supply_id(self, account: int, index: int) -> str:
+        return f'WB-GI-{account}{index:07d}'
+
+    def supply(self, account: int, index: int) -> dict:
+        created = self.now - timedelta(days=60) + timedelta(seconds=index * 60 * 86400 // max(self.supplies, 1))
+        done = index < self.supplies - 5
+        closed = (created + timedelta(hours=6)).strftime('%Y-%m-%dT%H:%M:%SZ') if done else None
+        return {
+            'id': self.supply_id(account, index),
+            'done': done,
+            'createdAt': created.strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'closedAt': closed,
+            'scanDt': closed,
+            'rejectDt': None,
+            'name': f'Поставка {index}',
+            'cargoType': 1,
+            'destinationOfficeId': 300 + index % 20,
+        }
+
+    def parse_supply_id(self, supply_id: str):
+        """(кабинет, индекс) по id поставки или None."""
+        if not supply_id.startswith('WB-GI-'):
+            return None
+        digits = supply_id[6:]
+        try:
+            return int(digits[:-7]), int(digits[-7:])
+        except ValueError:
+            return None
+
+    def supply_orders(self, account: int, index: int) -> list:
+        start = index * self.orders_per_supply
+        return [self.order(account, order_index % self.orders)
+                for order_index in range(start, start + self.orders_per_supply)]
+
+    # Акты приема-передачи: acts_per_day ФБС и ФБО на каждый день
+    def documents(self, account: int, day: str, category: str) -> list:
+        day_number = datetime.strptime(day, '%Y-%m-%d').toordinal()
+        prefix = 'act-income-mp' if category == 'act-income-mp' else 'act-income'
+        documents = []
+        for index in range(self.acts_per_day):
+            number = (account + 1) * 10 ** 9 + day_number * 100 + index
+            documents.append({'serviceName': f'{prefix}-{number}', 'name': f'Акт {number}',
+                              'category': category, 'extensions': ['xlsx', 'pdf'],
+                              'creationTime': f'{day}T12:00:00Z'})
+        return documents
+
+    def act_xlsx(self, service_name: str) -> bytes:
+        """Файл акта в формате ВБ: дата в D3, заголовки в строках 9-10, данные с 13 строки."""
+        if service_name in self._acts:
+            return self._acts[service_name]
+        number = int(service_name.rsplit('-', 1)[1])
+        day = datetime.fromordinal(number % 10 ** 9 // 100)
+        workbook = Workbook()
+        sheet = workbook.active
+        sheet['A1'] = 'Акт приема-передачи'
+        if service_name.startswith('act-income-mp'):
+            sheet['D3'] = f'{day:%d.%m.%Y} г.'
+            sheet.append([])
+            sheet.append([])
+            sheet.append([])
+            sheet.append([])
+            sheet.append([])
+            sheet.append(['№ п\\п', 'Номер заказа', 'Ед. изм.', 'Фактически принято', None])
+            sheet.append([None, None, None, 'Стикер/этикетка', 'Кол-во'])
+            sheet.append([])
+            sheet.append([])
+            for row in range(self.rows_per_act):
+                rnd = _hash(self.seed, service_name, row)
+                sheet.append([row + 1, str(ID_BASE + rnd % ID_BASE), 'шт', f'{rnd % 10 ** 10}', 1])
+            sheet.append([None, None, None, 'Итого', self.rows_per_act])
+        else:
+            sheet['D3'] = f'"{day:%d}" {day:%m} {day:%Y} г.'
+            sheet.append([])
+            sheet.append([])
+            sheet.append([])
+            sheet.append([])
+            sheet.append([])
+            sheet.append(['№ п\\п', 'Товар (наименование)', 'Ед. изм.', 'Фактически принято',
+                          None, None, None, None, None, None])
+            sheet.append([None, None, None, 'баркод', 'артикул продавца', 'сорт, размер', 'КИЗ',
+                          'ШК короба', 'кол-во', 'ШК товара'])
+            sheet.append([])
+            sheet.append([])
+            for row in range(self.rows_per_act):
+                rnd = _hash(self.seed, service_name, row)
+                sheet.append([row + 1, f'Товар {rnd % 300}', 'шт', str(2000000000000 + rnd % 10 ** 6),
+                              f'wild{rnd % 300}', '0', None, str(10 ** 9 + rnd % 10 ** 6), 1, rnd % 10 ** 9])
+        output = io.BytesIO()
+        workbook.save(output)
+        self._acts[service_name] = output.getvalue()
+        return self._acts[service_name]
+
+    def documents_archive(self, service_names: list) -> bytes:
+        """Общий zip со вложенными zip по каждому документу (xlsx + .sig)."""
+        output = io.BytesIO()
+        with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as full_zip:
+            for service_name in service_names:
+                nested = io.BytesIO()
+                with zipfile.ZipFile(nested, 'w', zipfile.ZIP_DEFLATED) as nested_zip:
+                    nested_zip.writestr(f'{service_name}.xlsx', self.act_xlsx(service_name))
+                    nested_zip.writestr(f'{service_name}.xlsx.sig', b'signature')
+                full_zip.writestr(f'{service_name}.zip', nested.getvalue())
+        return output.getvalue()
+
+
+class MockServer:
+    """aiohttp-приложение тестового сервера с отказами и счетчиками."""
+
+    def __init__(self, data: MockData, rate_429: float = 0.0, rate_5xx: float = 0.0,
+                 latency_ms: float = 0.0, seed: int = 0):
+        self.data = data
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        self.latency = latency_ms / 1000
+        self.random = random.Random(seed)
+        self.tokens = {account_token(index): index for index in range(data.accounts)}
+        self.reset()
+
+    def reset(self):
+        self.requests = Counter()
+        self.statuses = Counter()
+        self.faults = Counter()
+        self.retries = 0
+        self._seen = set()
+
+    def stats(self) -> dict:
+        return {'requests': sum(self.requests.values()),
+                'retries': self.retries,
+                'faults': sum(self.faults.values()),
+                'by_route': dict(self.requests),
+                'by_status': {str(status): count for status, count in self.statuses.items()},
+                'faults_by_status': {str(status): count for status, count in self.faults.items()}}
+
+    @web.middleware
+    async def middleware(self, request, handler):
+        if request.path.startswith('/__'):
+            return await handler(request)
+        route = request.match_info.route.resource.canonical if request.match_info.route.resource else request.path
+        self.requests[route] += 1
+        body = await request.read()
+        # Повтор — запрос с теми же методом, адресом и телом, что уже был
+        key = (request.method, request.path_qs, body, request.headers.get('Authorization'))
+        if key in self._seen:
+            self.retries += 1
+        self._seen.add(key)
+        if self.latency:
+            await asyncio.sleep(self.random.expovariate(1 / self.latency))
+        response = None
+        if request.headers.get('Authorization') not in self.tokens:
+            response = web.json_response({'title': 'unauthorized', 'detail': 'unknown token'}, status=401)
+        elif self.random.random() < self.rate_429:
+            self.faults[429] += 1
+            response = web.json_response({'title': 'too many requests', 'detail': 'mock limit'}, status=429,
+                                         headers={'X-Ratelimit-Retry': '1', 'X-Ratelimit-Remaining': '0'})
+        elif self.random.random() < self.rate_5xx:
+            status = self.random.choice((500, 502, 503))
+            self.faults[status] += 1
+            response = web.json_response({'title': 'server error'}, status=status)
+        if response is None:
+            response = await handler(request)
+        self.statuses[response.status] += 1
+        return response
+
+    def account(self, request) -> int:
+        return self.tokens[request.headers['Authorization']]
+
+    async def orders(self, request):
+        account = self.account(request)
+        limit = int(request.query.get('limit', 1000))
+        cursor = int(request.query.get('next', 0))
+        start = cursor % ID_BASE + 1 if cursor else 0
+        date_from = request.query.get('dateFrom')
+        if date_from:
+            since = datetime.fromtimestamp(int(date_from), timezone.utc)
+            # Первый индекс с createdAt >= dateFrom
+            seconds = (since - (self.data.now - timedelta(days=30))).total_seconds()
+            first = max(0, -(-int(seconds) * self.data.orders // (30 * 86400)))
+            start = max(start, first)
+        end = min(self.data.orders, start + limit)
+        page = [self.data.order(account, index) for index in range(start, end)]
+        next_cursor = self.data.order_id(account, end - 1) if page and end < self.data.orders else 0
+        return web.json_response({'orders': page, 'next': next_cursor})
+
+    async def orders_status(self, request):
+        self.account(request)
+        payload = await request.json()
+        return web.json_response({'orders': [self.data.order_status(order_id)
+                                              for order_id in payload.get('orders', [])]})
+
+    async def supplies(self, request):
+        account = self.account(request)
+        limit = int(request.query.get('limit', 1000))
+        start = int(request.query.get('next', 0))
+        end = min(self.data.supplies, start + limit)
+        page = [self.data.supply(account, index) for index in range(start, end)]
+        return web.json_response({'supplies': page, 'next': end if end < self.data.supplies else 0})
+
+    async def supply(self, request):
+        parsed = self.data.parse_supply_id(request.match_info['supply_id'])
+        if parsed is None or parsed[0] != self.account(request) or parsed[1] >= self.data.supplies:
+            return web.json_response({'title': 'not found'}, status=404)
+        return web.json_response(self.data.supply(*parsed))
+
+    async def supply_orders(self, request):
+        parsed = self.data.parse_supply_id(request.match_info['supply_id'])
+        if parsed is None or parsed[0] != self.account(request) or parsed[1] >= self.data.supplies:
+            return web.json_response({'title': 'not found'}, status=404)
+        return web.json_response({'orders': self.data.supply_orders(*parsed)})
+
+    async def reshipment(self, request):
+        account = self.account(request)
+        orders = [{'supplyId': self.data.supply_id(account, self.data.supplies - 1),
+                   'orderId': self.data.order_id(account, index)}
+                  for index in range(min(10, self.data.orders))]
+        return web.json_response({'orders': orders})
+
+    async def documents_list(self, request):
+        account = self.account(request)
+        begin = datetime.strptime(request.query['beginTime'], '%Y-%m-%d')
+        end = datetime.strptime(request.query['endTime'], '%Y-%m-%d')
+        categories = request.query.get('category', 'act-income-mp,act-income').split(',')
+        documents = []
+        day = begin
+        while day <= end:
+            for category in categories:
+                documents.extend(self.data.documents(account, f'{day:%Y-%m-%d}', category))
+            day += timedelta(days=1)
+        offset = int(request.query.get('offset', 0))
+        limit = int(request.query.get('limit', 50))
+        return web.json_response({'data': {'documents': documents[offset:offset + limit]}})
+
+    async def documents_download(self, request):
+        self.account(request)
+        payload = await request.json()
+        service_names = [param['serviceName'] for param in payload.get('params', [])]
+        if not service_names:
+            return web.json_response({'title': 'bad request', 'message': 'empty params'}, status=400)
+        archive = await asyncio.to_thread(self.data.documents_archive, service_names)
+        return web.json_response({'data': {'fileName': 'documents', 'extension': 'zip',
+                                           'document': base64.b64encode(archive).decode('ascii')}})
+
+    async def get_stats(self, request):
+        return web.json_response(self.stats())
+
+    async def reset_stats(self, request):
+        self.reset()
+        return web.json_response({'ok': True})
+
+    def app(self) -> web.Application:
+        app = web.Application(middlewares=[self.middleware], client_max_size=64 * 1024 ** 2)
+        app.router.add_get('/api/v3/orders', self.orders)
+        app.router.add_post('/api/v3/orders/status', self.orders_status)
+        app.router.add_get('/api/v3/supplies', self.supplies)
+        app.router.add_get('/api/v3/supplies/orders/reshipment', self.reshipment)
+        app.router.add_get('/api/v3/supplies/{supply_id}', self.supply)
+        app.router.add_get('/api/v3/supplies/{supply_id}/orders', self.supply_orders)
+        app.router.add_get('/api/v1/documents/list', self.documents_list)
+        app.router.add_post('/api/v1/documents/download/all', self.documents_download)
+        app.router.add_get('/__stats', self.get_stats)
+        app.router.add_post('/__stats/reset', self.reset_stats)
+        return app
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='Тестовый сервер API Wildberries')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--accounts', type=int, default=3, help='количество кабинетов')
+    parser.add_argument('--orders', type=int, default=10000, help='сборочных заданий на кабинет')
+    parser.add_argument('--supplies', type=int, default=200, help='поставок на кабинет')
+    parser.add_argument('--orders-per-supply', type=int, default=20, help='заказов в поставке')
+    parser.add_argument('--acts-per-day', type=int, default=2, help='актов каждого типа в день на кабинет')
+    parser.add_argument('--rows-per-act', type=int, default=50, help='строк в акте')
+    parser.add_argument('--rate-429', type=float, default=0.0, help='доля ответов 429')
+    parser.add_argument('--rate-5xx', type=float, default=0.0, help='доля ответов 5xx')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='средняя задержка ответа, мс')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--tokens-file', help='записать файл токенов для скриптов')
+    return parser
+
+
+def create_server(args) -> MockServer:
+    data = MockData(args.accounts, args.orders, args.supplies, args.orders_per_supply,
+                    args.acts_per_day, args.rows_per_act, args.seed)
+    return MockServer(data, args.rate_429, args.rate_5xx, args.latency_ms, args.seed)
+
+
+if __name__ == '__main__':
+    args = build_parser().parse_args()
+    if args.tokens_file:
+        write_tokens(args.tokens_file, args.accounts)
+    web.run_app(create_server(args).app(), host=args.host, port=args.port)
@@ -0,0 +1,129 @@
+"""Ограничение частоты запросов к API Wildberries.
+
+Лимиты ВБ считаются на аккаунт продавца и на группу методов, поэтому для каждой
+пары (кабинет, группа методов) заводится свой token bucket с документированными
+параметрами. Заголовки ответа X-Ratelimit-* подстраивают ведро под фактическое
+состояние лимита на стороне ВБ.
+"""
+import asyncio
+import os
+from time import monotonic
+
+
+# Документированные лимиты на один аккаунт продавца:
+# группа методов: (кол-во запросов, период в секундах, всплеск)
+ENDPOINT_LIMITS = {
+    # Маркетплейс: 300 запросов в минуту, интервал 200 мс, всплеск 20
+    'marketplace': (300, 60, 20),
+    # Список документов: 1 запрос в 10 секунд, всплеск 5
+    'documents_list': (1, 10, 5),
+    # Скачивание документов: 1 запрос в 5 минут, всплеск 5
+    'documents_download': (1, 300, 5),
+    # Остальные методы документов (категории и т.п.): 1 запрос в 10 секунд, всплеск 5
+    'documents': (1, 10, 5),
+}
+
+
+def endpoint_group(api: str, path: str) -> str:
+    """Определяет группу лимитов по API и пути метода."""
+    if api == 'documents':
+        if path.startswith('/api/v1/documents/list'):
+            return 'documents_list'
+        if path.startswith('/api/v1/documents/download'):
+            return 'documents_download'
+        return 'documents'
+    return 'marketplace'
+
+
+def _header_seconds(headers, name):
+    """Читает числовой заголовок лимита, None если его нет или он некорректен."""
+    value = headers.get(name)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше burst в запасе."""
+
+    def __init__(self, requests: int, period: float, burst: int):
+        self.rate = requests / period
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = monotonic()
+        # До этого момента запросы не отправляются (пауза по 429 / X-Ratelimit-Retry)
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        """Ждет свободный токен. Ожидающие запросы обслуживаются по очереди."""
+        async with self._lock:
+            while True:
+                now = monotonic()
+                self._refill(now)
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """Останавливает выдачу токенов на seconds секунд и обнуляет запас."""
+        now = monotonic()
+        self._refill(now)
+        self.tokens = 0.0
+        self.blocked_until = max(self.blocked_until, now + seconds)
+
+    def limit_remaining(self, remaining: float):
+        """Не даем локальному запасу превышать остаток, сообщенный сервером."""
+        self._refill(monotonic())
+        self.tokens = min(self.tokens, remaining)
+
+
+class RateLimiter:
+    """Набор ведер по парам (кабинет, группа методов)."""
+
+    def __init__(self, limits: dict = None, scale: float = None):
+        self.limits = limits or ENDPOINT_LIMITS
+        # Множитель частоты запросов. Больше 1 — только для локального тестового сервера
+        self.scale = scale if scale is not None else float(os.getenv('WB_RATE_LIMIT_SCALE', 1))
+        self._buckets = {}
+
+    def bucket(self, account: str, api: str, path: str) -> TokenBucket:
+        group = endpoint_group(api, path)
+        key = (account, group)
+        if key not in self._buckets:
+            requests, period, burst = self.limits[group]
+            self._buckets[key] = TokenBucket(requests * self.scale, period, burst)
+        return self._buckets[key]
+
+    async def acquire(self, account: str, api: str, path: str):
+        await self.bucket(account, api, path).acquire()
+
+    def update(self, account: str, api: str, path: str, status: int, headers):
+        """Подстраивает ведро по ответу ВБ.
+
+        X-Ratelimit-Retry — через сколько секунд можно повторить запрос (при 429),
+        X-Ratelimit-Remaining — сколько запросов еще доступно без ожидания.
+        """
+        bucket = self.bucket(account, api, path)
+        remaining = _header_seconds(headers, 'X-Ratelimit-Remaining')
+        if remaining is not None:
+            bucket.limit_remaining(remaining)
+        if status == 429:
+            retry = _header_seconds(headers, 'X-Ratelimit-Retry')
+            if retry is None:
+                retry = _header_seconds(headers, 'Retry-After')
+            if retry is None:
+                # Заголовков нет — ждем один интервал лимита
+                retry = 1 / bucket.rate
+            bucket.pause(retry)
@@ -0,0 +1,106 @@
+"""Общая политика повторов запросов к API Wildberries.
+
+Повторы выполняет клиент (wb_client), а не каждый сборщик данных отдельно:
+    - повторяются ответы 429 и 5xx, а также сетевые ошибки и таймауты;
+    - пауза перед повтором растет экспоненциально со случайным разбросом
+      (full jitter), паузу по 429 дополнительно выдерживает ограничитель частоты;
+    - на один запуск (один клиент) выделяется общий бюджет повторов,
+      чтобы сбои API не растягивали работу скрипта без предела;
+    - после нескольких подряд ответов 401 / 5xx или сетевых ошибок по кабинету
+      запросы этого кабинета на время паузы сразу завершаются ошибкой
+      AccountUnavailableError и не занимают очередь остальных кабинетов.
+
+Параметры задаются переменными окружения:
+    WB_RETRY_ATTEMPTS      — попыток на один запрос (по умолчанию 5)
+    WB_RETRY_BASE_DELAY    — начальная пауза, с (0.5)
+    WB_RETRY_MAX_DELAY     — максимальная пауза, с (30)
+    WB_RETRY_BUDGET        — повторов на весь запуск (200)
+    WB_BREAKER_THRESHOLD   — ошибок подряд до отключения кабинета (5)
+    WB_BREAKER_COOLDOWN    — пауза отключенного кабинета, с (300)
+"""
+import logging
+import os
+import random
+from time import monotonic
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+# Ответы, после которых запрос стоит повторить
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class AccountUnavailableError(aiohttp.ClientError):
+    """Кабинет временно отключен после повторяющихся ошибок."""
+
+    def __init__(self, account: str, seconds: float):
+        super().__init__(f"Кабинет {account} временно отключен после повторяющихся ошибок, "
+                         f"осталось {seconds:.0f} с")
+        self.account = account
+        self.seconds = seconds
+
+
+def _env_number(name: str, default):
+    value = os.getenv(name)
+    return type(default)(value) if value else default
+
+
+class RetryPolicy:
+    """Число попыток, паузы между ними и общий бюджет повторов на запуск."""
+
+    def __init__(self, max_attempts: int = None, base_delay: float = None, max_delay: float = None,
+                 budget: int = None):
+        self.max_attempts = max_attempts or _env_number('WB_RETRY_ATTEMPTS', 5)
+        self.base_delay = base_delay if base_delay is not None else _env_number('WB_RETRY_BASE_DELAY', 0.5)
+        self.max_delay = max_delay if max_delay is not None else _env_number('WB_RETRY_MAX_DELAY', 30.0)
+        self.budget = budget if budget is not None else _env_number('WB_RETRY_BUDGET', 200)
+        self.spent = 0
+
+    def delay(self, attempt: int) -> float:
+        """Пауза перед повтором номер attempt (с нуля): случайная от 0 до base * 2^attempt."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def allow(self, attempt: int) -> bool:
+        """Можно ли сделать еще одну попытку. Списывает повтор из бюджета."""
+        if attempt + 1 >= self.max_attempts:
+            return False
+        if self.spent >= self.budget:
+            logger.warning("Бюджет повторов запросов исчерпан")
+            return False
+        self.spent += 1
+        return True
+
+
+class CircuitBreaker:
+    """Отключает кабинет на cooldown секунд после threshold ошибок подряд."""
+
+    def __init__(self, threshold: int = None, cooldown: float = None):
+        self.threshold = threshold or _env_number('WB_BREAKER_THRESHOLD', 5)
+        self.cooldown = cooldown if cooldown is not None else _env_number('WB_BREAKER_COOLDOWN', 300.0)
+        self._failures = {}
+        self._open_until = {}
+
+    def check(self, account: str):
+        """Бросает AccountUnavailableError, если кабинет отключен."""
+        remaining = self._open_until.get(account, 0) - monotonic()
+        if remaining > 0:
+            raise AccountUnavailableError(account, remaining)
+
+    def failure(self, account: str):
+        failures = self._failures.get(account, 0) + 1
+        self._failures[account] = failures
+        # После паузы кабинету дается одна пробная попытка: ошибка снова его отключает
+        if failures >= self.threshold:
+            self._open_until[account] = monotonic() + self.cooldown
+            logger.error(f"[{account}] {failures} ошибок подряд, кабинет отключен на {self.cooldown:.0f} с")
+
+    def success(self, account: str):
+        self._failures.pop(account, None)
+        self._open_until.pop(account, None)
+
+    def record(self, account: str, status: int):
+        """Учитывает статус ответа: 401 и 5xx — ошибки, 2xx — успех."""
+        if status == 401 or status >= 500:
+            self.failure(account)
+        elif status < 400:
+            self.success(account)